@@ -0,0 +1,48 @@
+'''
+Micro-benchmark of `FirebaseAuthentication.authenticate`: cold verification vs.
+the verified-token cache, and path matching.
+
+`auth` is replaced by `FakeAuth`, which does the same RSA-2048 signature check
+on every call, so no network or Firebase project is needed.
+
+    python benchmarks/bench_auth.py
+'''
+from common import import_repo, measure, print_table
+from fakes import FakeAuth, install_auth
+
+from types import SimpleNamespace
+
+user_auth = import_repo("db.firebase.user_auth")
+
+def request_for(token: str, path: str = "/chat") -> SimpleNamespace:
+    return SimpleNamespace(path=path, data={}, headers={ "Authorization": "Bearer " + token })
+
+def main(iterations: int = 5000):
+    fake_auth = FakeAuth()
+    install_auth(fake_auth)
+    token = fake_auth.issue_token("user-1")
+    request = request_for(token)
+
+    uncached = user_auth.FirebaseAuthentication()
+    uncached.token_cache = None
+    cached = user_auth.FirebaseAuthentication()
+    cached.token_cache = user_auth.TokenCache()
+
+    rows = {
+        "verify every request": measure(lambda: uncached.authenticate(request), iterations),
+        "verified-token cache": measure(lambda: cached.authenticate(request), iterations),
+    }
+    print_table("authenticate() with a repeated bearer token", rows)
+    print(f"  speed-up: {rows['verified-token cache']['ops_per_second'] / rows['verify every request']['ops_per_second']:.0f}x")
+
+    ## Default rules, then a larger rule set as public endpoints grow
+    path = "/api/v1/chat/history"
+    for allowed in (["/validate-user", "/login", "/test", "/register", "/task"], [f"/public/page-{i}" for i in range(100)]):
+        matcher = user_auth.PathMatcher(allowed)
+        print_table(f"allowed path check, {len(allowed)} rules (miss)", {
+            "list scan": measure(lambda: path in allowed, iterations * 20),
+            "PathMatcher": measure(lambda: path in matcher, iterations * 20),
+        })
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+'''
+Throughput of `MicroBatcher` against a stub model whose server batches prompts.
+
+A single request takes 50 ms and a batch of up to 16 requests 80 ms, about
+what a local Ollama or TGI server does with a small model, and the server
+works on 4 requests (or batches) at a time. 64 concurrent callers (threads,
+then asyncio tasks) each send 20 requests, once straight to the model and
+once through the batcher.
+
+    python benchmarks/bench_batching.py
+'''
+from common import import_repo, percentile
+from fake_llm import StubChatModel
+
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import time
+
+batching = import_repo("llm.langchain.batching")
+
+def stub() -> StubChatModel:
+    return StubChatModel(name="ollama", latency=0.05, batch_overhead=0.08, parallel=4)
+
+def run_threads(model, callers: int, requests: int) -> dict[str, float]:
+    def caller(i: int) -> list[float]:
+        samples = []
+        for j in range(requests):
+            start = time.perf_counter()
+            model.invoke(f"Question {i}-{j}: what are the symptoms of Alzheimer's?")
+            samples.append(time.perf_counter() - start)
+        return samples
+    start = time.perf_counter()
+    with ThreadPoolExecutor(callers) as pool:
+        samples = [sample for samples in pool.map(caller, range(callers)) for sample in samples]
+    return summary(samples, time.perf_counter() - start)
+
+def run_tasks(model, callers: int, requests: int) -> dict[str, float]:
+    async def caller(i: int) -> list[float]:
+        samples = []
+        for j in range(requests):
+            start = time.perf_counter()
+            await model.ainvoke(f"Question {i}-{j}: what are the symptoms of Alzheimer's?")
+            samples.append(time.perf_counter() - start)
+        return samples
+    async def main() -> list[list[float]]:
+        return await asyncio.gather(*(caller(i) for i in range(callers)))
+    start = time.perf_counter()
+    samples = [sample for samples in asyncio.run(main()) for sample in samples]
+    return summary(samples, time.perf_counter() - start)
+
+def summary(samples: list[float], elapsed: float) -> dict[str, float]:
+    return {
+        "rps": len(samples) / elapsed,
+        "p50_ms": percentile(samples, 50) * 1000,
+        "p99_ms": percentile(samples, 99) * 1000,
+    }
+
+def report(name: str, result: dict[str, float], model: StubChatModel):
+    requests_per_call = model.calls / (model.batches or model.calls)
+    print(f"  {name:<24} {result['rps']:7.0f} req/s   p50 {result['p50_ms']:6.1f} ms   p99 {result['p99_ms']:6.1f} ms   requests/call {requests_per_call:5.1f}")
+
+def main(callers: int = 64, requests: int = 20):
+    print(f"{callers} callers x {requests} requests, server runs 4 requests/batches at a time")
+    for name, runner in (("threads", run_threads), ("asyncio", run_tasks)):
+        print(name)
+        model = stub()
+        report("direct", runner(model, callers, requests), model)
+        model = stub()
+        batcher = batching.MicroBatcher(model, max_batch_size=16, max_wait=0.005, max_concurrent_batches=4)
+        result = runner(batcher, callers, requests)
+        report("micro-batched", result, model)
+        stats = batcher.stats()
+        print(f"  {'':<24} mean batch {stats['mean_batch_size']:.1f}   queue wait p50 {stats['queue_wait_p50'] * 1000:.1f} ms   p99 {stats['queue_wait_p99'] * 1000:.1f} ms   errors {stats['errors']}")
+
+if __name__ == "__main__":
+    main()
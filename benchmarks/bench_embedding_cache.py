@@ -0,0 +1,49 @@
+'''
+Check and benchmark of `CachedEmbeddings`.
+
+A deterministic local fake stands in for the remote embedding API, with a
+fixed latency per request. Indexes a corpus cold, then re-indexes it with a
+fresh wrapper on the same cache file, which must make no remote call at all.
+
+    python benchmarks/bench_embedding_cache.py
+'''
+from common import import_repo
+from fake_llm import FakeEmbeddings
+
+import os
+import random
+import tempfile
+import time
+
+embeddings = import_repo("llm.langchain.embeddings")
+
+def corpus(n: int) -> list[str]:
+    rng = random.Random(0)
+    words = "memory brain care patient doctor symptom therapy sleep family routine".split()
+    return [" ".join(rng.choice(words) for _ in range(80)) + f" #{i}" for i in range(n)]
+
+def index(path: str, texts: list[str], workers: int) -> tuple[FakeEmbeddings, dict, float]:
+    remote = FakeEmbeddings(latency=0.05)
+    cached = embeddings.CachedEmbeddings(remote, path=path, batch_size=32, max_workers=workers)
+    start = time.perf_counter()
+    vectors = cached.embed_documents(texts)
+    elapsed = time.perf_counter() - start
+    assert all(abs(a - b) < 1e-6 for a, b in zip(vectors[-1], remote.vector(texts[-1])))
+    return remote, cached.stats(), elapsed
+
+def main(n: int = 2000):
+    texts = corpus(n)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "embedding_cache.sqlite")
+        _, _, sequential = index(os.path.join(tmp, "sequential.sqlite"), texts, workers=1)
+        remote, stats, cold = index(path, texts, workers=8)
+        print(f"cold, 1 worker    {sequential:7.2f}s")
+        print(f"cold, 8 workers   {cold:7.2f}s   {remote.calls} remote calls   {stats['bytes_stored'] / 2**20:.1f} MiB stored")
+        remote, stats, warm = index(path, texts, workers=8)
+        print(f"warm re-index     {warm:7.2f}s   {remote.calls} remote calls   hit rate {stats['hit_rate']:.0%}")
+    if remote.calls:
+        raise SystemExit("Re-indexing an unchanged corpus reached the embedding API")
+    print("CachedEmbeddings: unchanged corpus re-indexed without remote calls")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+'''
+Concurrency check and throughput benchmark of user ID allocation.
+
+Simulates several worker processes (one `IdAllocator` each) with many threads
+registering users of one organization against the in-memory Firestore fake,
+and fails if any user ID is handed out twice. The old read-modify-write of the
+organization document is run the same way for comparison.
+
+    python benchmarks/bench_id_allocation.py
+'''
+from common import import_repo
+from fakes import FakeFirestore
+
+from concurrent.futures import ThreadPoolExecutor
+import collections
+import time
+
+id_allocator = import_repo("db.firebase.id_allocator")
+
+ORG, ROLE = "org-1", "patient"
+
+def new_db(latency: float) -> FakeFirestore:
+    db = FakeFirestore(latency=latency)
+    db.collection("organizations").document(ORG).set({ "user_ids": { ROLE: 1 }, "active_users": 0 })
+    return db
+
+def read_modify_write(db: FakeFirestore) -> int:
+    ## What UserRegistration.register_user used to do
+    org_ref = db.collection("organizations").document(ORG)
+    org_data = org_ref.get().to_dict()
+    user_id = org_data["user_ids"][ROLE]
+    org_data["user_ids"][ROLE] += 1
+    org_data["active_users"] += 1
+    org_ref.update(org_data)
+    return user_id
+
+def run(workers: int, threads: int, per_thread: int, latency: float, legacy: bool = False) -> dict[str, object]:
+    db = new_db(latency)
+    allocators = [id_allocator.IdAllocator(db, block_size=50) for _ in range(workers)]
+
+    def register(slot: int) -> list[int]:
+        allocator = allocators[slot % workers]
+        ids = []
+        for _ in range(per_thread):
+            if legacy:
+                ids.append(read_modify_write(db))
+            else:
+                ids.append(allocator.next_id(ORG, ROLE))
+                allocator.add_active_users(ORG)
+        return ids
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers * threads) as executor:
+        ids = [user_id for chunk in executor.map(register, range(workers * threads)) for user_id in chunk]
+    elapsed = time.perf_counter() - start
+
+    duplicates = sum(count - 1 for count in collections.Counter(ids).values() if count > 1)
+    active = read_active_users(db, legacy)
+    return {
+        "registrations": len(ids),
+        "duplicates": duplicates,
+        "active_users": active,
+        "per_second": len(ids) / elapsed,
+        "org_writes": db.writes,
+    }
+
+def read_active_users(db: FakeFirestore, legacy: bool) -> int:
+    if legacy:
+        return db.collection("organizations").document(ORG).get().to_dict()["active_users"]
+    return id_allocator.IdAllocator(db).active_users(ORG)
+
+def main(latency: float = 0.002, threads: int = 8, per_thread: int = 100):
+    print(f"{threads} threads per worker, {per_thread} sign-ups per thread, {latency * 1000:.0f} ms per round trip")
+    failed = False
+    for workers in (1, 2, 4):
+        for legacy in (True, False):
+            result = run(workers, threads, per_thread, latency, legacy)
+            name = "read-modify-write" if legacy else "leased blocks"
+            print(f"  {workers} worker(s)  {name:<18} {result['per_second']:>8,.0f} sign-ups/s   "
+                  f"duplicates {result['duplicates']:>5}   active_users {result['active_users']}/{result['registrations']}")
+            if not legacy and (result["duplicates"] or result["active_users"] != result["registrations"]):
+                failed = True
+    if failed:
+        raise SystemExit("IdAllocator handed out duplicate IDs or lost active user updates")
+    print("IdAllocator: all IDs unique")
+
+if __name__ == "__main__":
+    main()
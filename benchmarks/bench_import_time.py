@@ -0,0 +1,96 @@
+'''
+Cold start cost of the llm package, measured with `python -X importtime`.
+
+Each scenario runs in a fresh interpreter several times; the table shows the
+median total import time reported by `-X importtime`, the median wall time of
+the whole process, and which provider / vector store libraries got imported.
+With `--against REF` the same scenarios also run on the tree of a git
+revision (e.g. the commit before the lazy imports) for comparison.
+
+    python benchmarks/bench_import_time.py --against HEAD~1
+'''
+from common import REPO_ROOT
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+
+PACKAGE = REPO_ROOT.name
+
+SCENARIOS = {
+    "import manager": f"import {PACKAGE}.llm.langchain.manager",
+    "ollama client": f"from {PACKAGE}.llm.langchain.manager import LLMManager\nLLMManager().load_llm('deepseek-r1:1.5b', 'ollama')",
+    "groq client": f"from {PACKAGE}.llm.langchain.manager import LLMManager\nLLMManager().load_llm('llama3-70b-8192', 'groq', api_key='x')",
+    "import resource": f"import {PACKAGE}.llm.langchain.resource",
+}
+
+## Libraries a worker shouldn't pay for unless it uses them
+HEAVY = ("langchain_huggingface", "langchain_ollama", "langchain_groq", "langchain_chroma", "chromadb", "langchain_community", "ollama", "groq")
+
+def import_time(root: str, code: str, runs: int) -> dict[str, object]:
+    '''
+    Run `code` in `runs` fresh interpreters with the tree under `root` importable.
+    '''
+    env = { **os.environ, "PYTHONPATH": root, "HF_TOKEN": "x" }
+    totals, walls, heavy = [], [], set()
+    with tempfile.TemporaryDirectory() as cwd:
+        ## The prompt template is read relative to the working directory
+        os.makedirs(os.path.join(cwd, "ai_chaperone/utils/chat"))
+        with open(os.path.join(cwd, "ai_chaperone/utils/chat/rag_prompt_template.txt"), "w") as file:
+            file.write("Answer from the context.\n{context}\nQuestion: {input}")
+        for _ in range(runs):
+            start = time.perf_counter()
+            result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=cwd, env=env, capture_output=True, text=True)
+            walls.append(time.perf_counter() - start)
+            if result.returncode != 0:
+                return { "error": result.stderr.strip().splitlines()[-1] }
+            total = 0
+            for line in result.stderr.splitlines():
+                if not line.startswith("import time:") or "cumulative" in line:
+                    continue
+                _, cumulative, name = line[len("import time:"):].split("|")
+                if not name[1:].startswith(" "):
+                    total += int(cumulative) # Top-level imports only; nested ones are included in them
+                if name.strip().split(".")[0] in HEAVY:
+                    heavy.add(name.strip().split(".")[0])
+            totals.append(total / 1e6)
+    return { "import_s": statistics.median(totals), "wall_s": statistics.median(walls), "heavy": sorted(heavy) }
+
+def checkout(ref: str, into: str) -> str:
+    '''
+    Extract the tree of a git revision as `<into>/<package name>`; returns `into`.
+    '''
+    archive = os.path.join(into, "tree.tar")
+    subprocess.run(["git", "-C", str(REPO_ROOT), "archive", "-o", archive, ref], check=True)
+    with tarfile.open(archive) as tar:
+        tar.extractall(os.path.join(into, PACKAGE))
+    return into
+
+def report(name: str, result: dict[str, object]):
+    if "error" in result:
+        print(f"  {name:<18} failed: {result['error']}")
+        return
+    print(f"  {name:<18} imports {result['import_s'] * 1000:7.0f} ms   process {result['wall_s'] * 1000:7.0f} ms   loads {', '.join(result['heavy']) or '-'}")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--against", help="git revision to compare with, e.g. HEAD~1")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    trees = { "working tree": str(REPO_ROOT.parent) }
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.against:
+            trees = { args.against: checkout(args.against, tmp), **trees }
+        for tree, root in trees.items():
+            print(tree)
+            for name, code in SCENARIOS.items():
+                report(name, import_time(root, code, args.runs))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+'''
+Cost of the instrumentation layer, and the latency breakdown of a chat request.
+
+First the overhead per call of a `traced` function: undecorated, with
+instrumentation disabled, enabled and sampled, with 1% sampling of root spans
+(a decision per call) and inside an unsampled request (decided once for it).
+Then one simulated chat request runs over the fakes (token verification,
+profile read, history load and save, retrieval, generation) inside
+`instrumentation.request`: its breakdown is printed, spans are mirrored to an
+in-memory OpenTelemetry exporter, and the Prometheus text is checked.
+
+    python benchmarks/bench_instrumentation.py
+'''
+from common import import_repo, measure, print_table
+from fake_llm import FakeEmbeddings, StubChatModel
+from fakes import FakeAuth, FakeFirestore, install_auth, install_firestore
+
+from langchain_core.messages import AIMessage, HumanMessage
+from types import SimpleNamespace
+import tempfile
+
+instrumentation_module = import_repo("instrumentation")
+instrumentation = instrumentation_module.instrumentation
+
+def plain(x):
+    return x + 1
+
+traced = instrumentation.traced("bench.traced")(plain)
+
+def overhead(iterations: int):
+    rows = { "undecorated": measure(lambda: plain(1), iterations) }
+    instrumentation.configure(enabled=False)
+    rows["traced, disabled"] = measure(lambda: traced(1), iterations)
+    instrumentation.configure(enabled=True, sample_rate=1.0)
+    rows["traced, enabled"] = measure(lambda: traced(1), iterations)
+    instrumentation.configure(enabled=True, sample_rate=0.01)
+    rows["traced, enabled, 1% sampled"] = measure(lambda: traced(1), iterations)
+    instrumentation.configure(enabled=True, sample_rate=0.0)
+    with instrumentation.request("unsampled"):
+        rows["traced, in unsampled request"] = measure(lambda: traced(1), iterations)
+    instrumentation.configure(enabled=False, sample_rate=1.0)
+    instrumentation.reset()
+    print_table("Cost of one call", rows)
+    base = rows["undecorated"]["mean_us"]
+    for name, row in rows.items():
+        print(f"  {name:<30} +{(row['mean_us'] - base) * 1000:7.0f} ns per call")
+
+def chat_request():
+    user_auth = import_repo("db.firebase.user_auth")
+    firestore = import_repo("db.firebase.firestore")
+    firebase = import_repo("llm.langchain.message_history.firebase")
+    vectorstore = import_repo("llm.langchain.vectorstore")
+    callbacks = import_repo("llm.langchain.callbacks")
+    firebase.print = lambda *args, **kwargs: None
+
+    db = FakeFirestore(latency=0.002)
+    install_firestore(db)
+    fake_auth = FakeAuth()
+    install_auth(fake_auth)
+    util = firestore.FirestoreUtil(db)
+    util.insert_data("users", "user-1", { "username": "alice", "email": "alice@example.com", "role": "patient" })
+    history = firebase.FirebaseMessageHistory("chat-1", "user-1")
+    history.add_messages([(HumanMessage if i % 2 == 0 else AIMessage)(f"message {i}") for i in range(60)])
+
+    directory = tempfile.mkdtemp()
+    store = vectorstore.NumpyVectorStore("docs", FakeEmbeddings(size=384, latency=0.02), directory)
+    store.add_texts([f"Care note {i}: routines, sleep and memory exercises." for i in range(2000)])
+    retriever = store.as_retriever().with_config(callbacks=[callbacks.instrumentation_callback])
+    model = StubChatModel(reply="Keep a steady daily routine.", latency=0.3, callbacks=[callbacks.instrumentation_callback])
+
+    authentication = user_auth.FirebaseAuthentication()
+    authentication.token_cache = None
+    request = SimpleNamespace(path="/chat", data={}, headers={ "Authorization": "Bearer " + fake_auth.issue_token("user-1") })
+
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+    from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+    exporter = InMemorySpanExporter()
+    provider = TracerProvider()
+    provider.add_span_processor(SimpleSpanProcessor(exporter))
+    hook = instrumentation.add_hook(instrumentation_module.OpenTelemetryHook(provider.get_tracer("bench")))
+
+    instrumentation.configure(enabled=True, sample_rate=1.0, slow_request_threshold=0.25)
+    with instrumentation.request("chat", uid="user-1") as context:
+        user, _ = authentication.authenticate(request)
+        util.fetch_user_data(user["uid"])
+        past = history.get_last_messages(20)
+        documents = retriever.invoke("how to help with sleep")
+        answer = model.invoke(past + [HumanMessage("How can I help my mother sleep?")] + [HumanMessage(d.page_content) for d in documents])
+        history.add_messages([HumanMessage("How can I help my mother sleep?"), answer])
+    instrumentation.configure(enabled=False)
+    instrumentation.remove_hook(hook)
+
+    print(f"\nBreakdown of request {context.request_id} ({context.duration * 1000:.0f} ms)")
+    print(f"  {'span':<36} {'calls':>5} {'total ms':>9} {'self ms':>8}")
+    for name, row in context.breakdown().items():
+        print(f"  {name:<36} {row['count']:>5} {row['total_ms']:>9.1f} {row['self_ms']:>8.1f}")
+
+    spans = exporter.get_finished_spans()
+    root = [span for span in spans if span.parent is None]
+    print(f"\nOpenTelemetry: {len(spans)} spans, {len(root)} root ({root[0].name if root else '-'}), "
+          f"{len({span.context.trace_id for span in spans})} trace")
+    text = instrumentation.prometheus_text()
+    print(f"Prometheus: {len(text.splitlines())} lines, e.g.")
+    for line in text.splitlines():
+        if 'span="llm.generate"' in line and "_count" in line or "auth_token" in line or line.startswith("backend_instrumentation"):
+            print("  " + line)
+    if len(root) != 1 or len({span.context.trace_id for span in spans}) != 1:
+        raise SystemExit("spans of the request didn't end up in one trace")
+
+def main(iterations: int = 200000):
+    overhead(iterations)
+    chat_request()
+
+if __name__ == "__main__":
+    main()
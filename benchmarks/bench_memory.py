@@ -0,0 +1,54 @@
+'''
+Prompt size and memory overhead per turn of `TokenWindowMemory` over a long chat.
+
+Runs a 1000-turn conversation on a `FileChatMessageHistory` against a stub
+model and records, every 100 turns, the history tokens a full buffer would
+send (what `ConversationBufferMemory` does) next to the tokens the windowed
+memory sends, with and without a rolling summary, and the time spent in the
+memory per turn.
+
+    python benchmarks/bench_memory.py
+'''
+from common import import_repo, percentile
+from fake_llm import StubChatModel
+
+from langchain_core.messages import AIMessage, HumanMessage
+import tempfile
+import time
+
+memory = import_repo("llm.langchain.memory")
+history = import_repo("llm.langchain.message_history")
+
+ANSWER = "Alzheimer's disease usually starts with short-term memory loss and trouble finding words. " * 3
+
+def run(turns: int, summarize: bool, budget: int) -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        chat = history.FileChatMessageHistory(directory, "session")
+        pinned = [HumanMessage("You are a caring virtual assistant for people living with dementia. " * 4), AIMessage("")]
+        chat.add_messages(pinned)
+        summarizer = StubChatModel(reply=lambda messages: "Earlier, the user asked about symptoms, care routines and appointments. " * 3) if summarize else None
+        windowed = memory.TokenWindowMemory(chat_memory=chat, pinned=pinned, max_token_limit=budget, summarizer=summarizer)
+        full_tokens = sum(memory.approximate_tokens(message.content) + 4 for message in pinned)
+        samples = []
+        print(f"  {'turn':>6} {'full buffer':>12} {'windowed':>9}")
+        for turn in range(1, turns + 1):
+            question = f"Question {turn}: what should I do when my mother forgets appointment number {turn}?"
+            start = time.perf_counter()
+            windowed.load_memory_variables({ "input": question })
+            windowed.save_context({ "input": question }, { "response": ANSWER })
+            samples.append(time.perf_counter() - start)
+            full_tokens += memory.approximate_tokens(question) + memory.approximate_tokens(ANSWER) + 8
+            if turn % (turns // 10) == 0:
+                print(f"  {turn:>6} {full_tokens:>12} {windowed.prompt_tokens():>9}")
+        print(f"  memory time per turn: p50 {percentile(samples, 50) * 1000:.2f} ms   p99 {percentile(samples, 99) * 1000:.2f} ms"
+              + (f"   summary updates {summarizer.calls}" if summarizer else ""))
+
+def main(turns: int = 1000, budget: int = 2000):
+    print(f"History tokens in the prompt, budget {budget}")
+    print("window only")
+    run(turns, False, budget)
+    print("window + rolling summary")
+    run(turns, True, budget)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+'''
+Time to first visible token and tokens generated, full-output parsing vs.
+streaming parsing, against a stub model streaming one token every 10 ms.
+
+The Deepseek reply has a 200-token think block before a 40-token answer; the
+chat reply answers in one line and then hallucinates 150 tokens of dialogue.
+
+    python benchmarks/bench_parsers.py
+'''
+from common import import_repo
+from fake_llm import StubChatModel
+
+import time
+
+parsers = import_repo("llm.langchain.parsers")
+
+DEEPSEEK_REPLY = "<think>\n" + "Let me recall what I know. " * 40 + "</think>\n\n" + "Common symptoms are memory loss, confusion and trouble with planning. " * 4
+CHAT_REPLY = "Sure, I have set a reminder for your medicine at 8 pm.\nHuman: thanks\nAI: " + "You are welcome, anything else? " * 30
+
+def run(reply: str, parser, streaming: bool) -> dict[str, float]:
+    model = StubChatModel(reply=reply, token_latency=0.01)
+    chain = model | parser
+    start = time.perf_counter()
+    if streaming:
+        first, answer = None, ""
+        for chunk in chain.stream("question"):
+            first = first if first is not None else time.perf_counter() - start
+            answer += chunk
+    else:
+        answer = chain.invoke("question")
+        first = time.perf_counter() - start
+    return { "ttft": first, "total": time.perf_counter() - start, "tokens": model.tokens_generated, "answer": answer }
+
+def main():
+    for name, reply, parser in (
+        ("DeepseekOutputParser", DEEPSEEK_REPLY, parsers.DeepseekOutputParser()),
+        ("ChatOutputParser", CHAT_REPLY, parsers.ChatOutputParser()),
+    ):
+        print(name)
+        results = {}
+        for streaming in (False, True):
+            results[streaming] = result = run(reply, parser, streaming)
+            label = "streamed" if streaming else "full output"
+            print(f"  {label:<12} first visible token {result['ttft'] * 1000:7.0f} ms   done {result['total'] * 1000:7.0f} ms   tokens generated {result['tokens']}")
+        if results[True]["answer"] != results[False]["answer"]:
+            raise SystemExit(f"{name}: streamed answer differs from the parsed one")
+
+if __name__ == "__main__":
+    main()
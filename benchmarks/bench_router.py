@@ -0,0 +1,62 @@
+'''
+Tail latency of `ModelRouter` against two stub backends serving one model.
+
+Each backend answers in ~20-50 ms but 5% of its requests take a second.
+Compares calling the usual backend directly, routing without hedging, and
+routing with hedging; then takes the primary backend down halfway through a
+run to check that requests fail over instead of failing.
+
+    python benchmarks/bench_router.py
+'''
+from common import import_repo, percentile
+from fake_llm import StubChatModel, heavy_tail
+
+import time
+
+router = import_repo("llm.langchain.router")
+
+def backends() -> dict[str, StubChatModel]:
+    return {
+        "ollama": StubChatModel(name="ollama", latency=heavy_tail(0.02, 1.0, 0.05, seed=1)),
+        "huggingface": StubChatModel(name="huggingface", latency=heavy_tail(0.05, 1.0, 0.05, seed=2)),
+    }
+
+def run(model, requests: int, outage_at: int | None = None, victim: StubChatModel | None = None) -> dict[str, float]:
+    samples, errors = [], 0
+    for i in range(requests):
+        if i == outage_at:
+            victim.fail_rate = 1.0
+        start = time.perf_counter()
+        try:
+            model.invoke("What are the symptoms of Alzheimer's?")
+        except Exception:
+            errors += 1
+        samples.append(time.perf_counter() - start)
+    return {
+        "p50_ms": percentile(samples, 50) * 1000,
+        "p99_ms": percentile(samples, 99) * 1000,
+        "max_ms": max(samples) * 1000,
+        "errors": errors,
+    }
+
+def report(name: str, result: dict[str, float]):
+    print(f"  {name:<26} p50 {result['p50_ms']:7.1f} ms   p99 {result['p99_ms']:7.1f} ms   max {result['max_ms']:7.1f} ms   errors {result['errors']}")
+
+def main(requests: int = 400):
+    print(f"{requests} sequential requests, 5% of backend calls take ~1 s")
+    report("ollama only", run(backends()["ollama"], requests))
+    report("router, no hedging", run(router.ModelRouter(backends=backends(), max_hedges=0, min_hedge_delay=0.1), requests))
+    report("router, hedged", run(router.ModelRouter(backends=backends(), min_hedge_delay=0.1), requests))
+
+    print("\nPrimary backend fails for the second half of the run")
+    stubs = backends()
+    report("ollama only", run(stubs["ollama"], requests, requests // 2, stubs["ollama"]))
+    stubs = backends()
+    hedged = router.ModelRouter(backends=stubs, min_hedge_delay=0.1)
+    result = run(hedged, requests, requests // 2, stubs["ollama"])
+    report("router, hedged", result)
+    if result["errors"]:
+        raise SystemExit("ModelRouter didn't fail over")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+'''
+Memory and resumability of the paginated scans of `FirestoreUtil`.
+
+Seeds a fake `users` collection and compares the peak memory (tracemalloc)
+of materialising it with `query.get()` against `scan` with projection and
+`export_collection`. The export is interrupted halfway and resumed; the output
+must hold every document exactly once. Also compares what a username lookup
+downloads with and without the user cache (whole profile vs `email` only).
+
+    python benchmarks/bench_scan.py
+'''
+from common import import_repo
+from fakes import FakeFirestore
+
+from google.cloud.firestore_v1.base_query import FieldFilter
+import json
+import os
+import tempfile
+import tracemalloc
+
+firestore = import_repo("db.firebase.firestore")
+
+def seed(db: FakeFirestore, count: int):
+    users = db.collection("users")
+    for i in range(count):
+        users.document(f"user-{i:07d}").set({
+            "username": f"user{i}",
+            "email": f"user{i}@example.com",
+            "role": "patient" if i % 10 else "doctor",
+            "organization": i % 50,
+            "profile": { "bio": "Retired teacher who enjoys gardening and crosswords. " * 8, "preferences": list(range(40)) },
+        })
+
+def peak(fn) -> tuple[object, float]:
+    '''
+    Result and peak traced memory in MB of `fn()`; timings are left out, the fake's query engine dominates them.
+    '''
+    tracemalloc.start()
+    result = fn()
+    _, top = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, top / 2**20
+
+def report(name: str, docs: int, mb: float):
+    print(f"  {name:<34} {docs:>7} docs   peak {mb:8.1f} MB")
+
+class Interrupted(Exception):
+    pass
+
+def main(count: int = 10000, page_size: int = 500):
+    db = FakeFirestore()
+    seed(db, count)
+    util = firestore.FirestoreUtil(db)
+    print(f"{count} user profiles of ~{len(json.dumps(db.collection('users').document('user-0000001').get().to_dict())) / 1024:.1f} KB")
+
+    docs, mb = peak(lambda: len([(doc.id, doc.to_dict()) for doc in db.collection("users").get()]))
+    report("query.get(), whole documents", docs, mb)
+    docs, mb = peak(lambda: sum(1 for _ in util.scan("users", page_size=page_size)))
+    report(f"scan, page {page_size}, whole documents", docs, mb)
+    docs, mb = peak(lambda: sum(1 for _ in util.scan("users", fields=["email", "role"], page_size=page_size)))
+    report(f"scan, page {page_size}, email + role", docs, mb)
+    docs, mb = peak(lambda: sum(1 for _ in util.scan("users", fields=["email"], filters=[FieldFilter("role", "==", "doctor")], page_size=page_size)))
+    report("scan, doctors only, email", docs, mb)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "users.jsonl")
+        ## Interrupt halfway through: the page after the middle is written, its checkpoint isn't
+        original = firestore.ScanCheckpoint.save
+        def crash(self):
+            if self.count > count // 2:
+                raise Interrupted()
+            original(self)
+        firestore.ScanCheckpoint.save = crash
+        try:
+            util.export_collection("users", path, page_size=page_size)
+        except Interrupted:
+            pass
+        finally:
+            firestore.ScanCheckpoint.save = original
+        checkpoint = firestore.ScanCheckpoint(path + ".checkpoint")
+        print(f"  interrupted export: {checkpoint}, file has {sum(1 for _ in open(path))} lines")
+        reads = db.reads
+        docs, mb = peak(lambda: util.export_collection("users", path, page_size=page_size))
+        report("resumed export", docs, mb)
+        ids = [json.loads(line)["id"] for line in open(path)]
+        print(f"  file: {len(ids)} lines, {len(set(ids))} unique IDs, resume read {db.reads - reads} documents")
+        if len(ids) != count or len(set(ids)) != count or os.path.exists(path + ".checkpoint"):
+            raise SystemExit("export didn't resume exactly where it stopped")
+
+    print("Username lookup, bytes downloaded")
+    email_only = util.fetch_email_by_username("user123")
+    query = db.collection("users").where(filter=FieldFilter("username", "==", "user123"))
+    print(f"  no user cache: {len(json.dumps(next(query.select(['email']).stream()).to_dict()))} B   "
+          f"with user cache (whole profile): {len(json.dumps(next(query.stream()).to_dict()))} B   -> {email_only}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+'''
+Benchmark of `NumpyVectorStore` against Chroma.
+
+Both stores index the same clustered synthetic vectors. Each store is then
+opened and queried in a fresh process, which reports import and cold-open time,
+p50/p99 query latency, recall@k against exact cosine search and peak RSS.
+NumpyVectorStore runs exhaustive (exact) and with its IVF index.
+
+    python benchmarks/bench_vectorstore.py [rows]
+'''
+from common import import_repo, percentile
+
+import multiprocessing
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+DIM, K, QUERIES = 384, 10, 200
+
+def dataset(rows: int) -> tuple[np.ndarray, np.ndarray]:
+    rng = np.random.default_rng(0)
+    centers = rng.normal(size=(max(1, rows // 200), DIM))
+    data = centers[rng.integers(0, len(centers), rows)] + 0.5 * rng.normal(size=(rows, DIM))
+    queries = centers[rng.integers(0, len(centers), QUERIES)] + 0.5 * rng.normal(size=(QUERIES, DIM))
+    return data.astype(np.float32), queries.astype(np.float32)
+
+def exact_top_k(data: np.ndarray, queries: np.ndarray) -> list[set[str]]:
+    normed = data / np.linalg.norm(data, axis=1, keepdims=True)
+    truth = []
+    for query in queries:
+        scores = normed @ (query / np.linalg.norm(query))
+        truth.append({ str(i) for i in np.argsort(-scores)[:K] })
+    return truth
+
+def build(kind: str, directory: str, data: np.ndarray) -> float:
+    start = time.perf_counter()
+    ids = [str(i) for i in range(len(data))]
+    if kind == "chroma":
+        from langchain_chroma import Chroma
+        store = Chroma("bench", persist_directory=directory, collection_metadata={ "hnsw:space": "cosine" })
+        for i in range(0, len(data), 5000):
+            store._collection.upsert(ids=ids[i:i + 5000], embeddings=data[i:i + 5000], documents=ids[i:i + 5000])
+    else:
+        store = open_numpy(directory, None)
+        store.add_embeddings(list(zip(ids, data)), ids=ids)
+        store.build_index()
+    return time.perf_counter() - start
+
+def open_numpy(directory: str, ivf_threshold: int | None):
+    vectorstore = import_repo("llm.langchain.vectorstore")
+    return vectorstore.NumpyVectorStore("bench", None, directory, ivf_threshold=ivf_threshold, n_probe=8)
+
+def query(kind: str, directory: str, queries: np.ndarray, truth: list[set[str]]) -> dict[str, float]:
+    ## Runs in a fresh process, so open time and RSS aren't shared between stores
+    start = time.perf_counter()
+    if kind == "chroma":
+        from langchain_chroma import Chroma
+    else:
+        import_repo("llm.langchain.vectorstore")
+    imported = time.perf_counter()
+    if kind == "chroma":
+        store = Chroma("bench", persist_directory=directory, collection_metadata={ "hnsw:space": "cosine" })
+    else:
+        store = open_numpy(directory, None if kind == "numpy exact" else 0)
+    store.similarity_search_by_vector(queries[0].tolist(), k=K) # First query loads the index
+    cold_open = time.perf_counter() - imported
+
+    samples, recall = [], 0.0
+    for vector, expected in zip(queries, truth):
+        t0 = time.perf_counter()
+        docs = store.similarity_search_by_vector(vector.tolist(), k=K)
+        samples.append(time.perf_counter() - t0)
+        recall += len(expected & { doc.page_content for doc in docs }) / K
+    return {
+        "import_ms": (imported - start) * 1000,
+        "cold_open_ms": cold_open * 1000,
+        "p50_ms": percentile(samples, 50) * 1000,
+        "p99_ms": percentile(samples, 99) * 1000,
+        "recall": recall / len(queries),
+        "rss_mib": peak_rss_mib(),
+    }
+
+def peak_rss_mib() -> float:
+    ## VmHWM rather than ru_maxrss, which a spawned child inherits from the parent across exec
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def main(rows: int = 20000):
+    data, queries = dataset(rows)
+    truth = exact_top_k(data, queries)
+    tmp = tempfile.mkdtemp()
+    context = multiprocessing.get_context("spawn")
+    try:
+        print(f"{rows:,} vectors of dimension {DIM}, {QUERIES} queries, recall@{K} against exact cosine")
+        for kind in ("chroma", "numpy exact", "numpy ivf"):
+            directory = f"{tmp}/{kind.split()[0]}"
+            if kind != "numpy ivf":
+                print(f"  {kind:<12} build {build(kind, directory, data):6.1f}s")
+        for kind in ("chroma", "numpy exact", "numpy ivf"):
+            with context.Pool(1) as pool:
+                result = pool.apply(query, (kind, f"{tmp}/{kind.split()[0]}", queries, truth))
+            print(f"  {kind:<12} import {result['import_ms']:6.0f} ms   open {result['cold_open_ms']:7.1f} ms   p50 {result['p50_ms']:6.2f} ms   p99 {result['p99_ms']:6.2f} ms   "
+                  f"recall {result['recall']:.3f}   peak RSS {result['rss_mib']:6.0f} MiB")
+    finally:
+        shutil.rmtree(tmp)
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,53 @@
+'''
+Shared helpers for the offline benchmarks.
+
+This repo is meant to be vendored as a package inside a project, so its modules
+use relative imports from the repo root. `import_repo` puts the parent directory
+on `sys.path` and imports modules through the repo directory as the package name.
+'''
+from pathlib import Path
+import importlib
+import statistics
+import sys
+import time
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+
+def import_repo(module: str):
+    '''
+    Import a module of this repo by its dotted path from the repo root, e.g. `db.firebase.user_auth`.
+    '''
+    if str(REPO_ROOT.parent) not in sys.path:
+        sys.path.insert(0, str(REPO_ROOT.parent))
+    return importlib.import_module(f"{REPO_ROOT.name}.{module}")
+
+def percentile(samples: list[float], pct: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+def measure(fn, iterations: int, warmup: int = 10) -> dict[str, float]:
+    '''
+    Call `fn` repeatedly and return throughput and latency percentiles (in microseconds).
+    '''
+    for _ in range(warmup):
+        fn()
+    samples = []
+    start = time.perf_counter()
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    elapsed = time.perf_counter() - start
+    return {
+        "iterations": iterations,
+        "ops_per_second": iterations / elapsed,
+        "mean_us": statistics.fmean(samples) * 1e6,
+        "p50_us": percentile(samples, 50) * 1e6,
+        "p99_us": percentile(samples, 99) * 1e6,
+    }
+
+def print_table(title: str, rows: dict[str, dict[str, float]]):
+    print(f"\n{title}")
+    for name, result in rows.items():
+        print(f"  {name:<28} {result['ops_per_second']:>12,.0f} ops/s   p50 {result['p50_us']:>10.1f} us   p99 {result['p99_us']:>10.1f} us")
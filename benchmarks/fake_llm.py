@@ -0,0 +1,206 @@
+'''
+Local stand-ins for chat model and embedding backends.
+
+`StubChatModel` answers every prompt with a canned reply after an injectable
+delay: a fixed latency, a callable drawing one per request (e.g. a heavy-tailed
+distribution), an optional failure rate, and a per-token delay when streaming.
+It counts calls and batched requests so benchmarks can check what reached the
+"server". `parallel` caps the requests the server works on at once; the others
+queue, as on an Ollama server with OLLAMA_NUM_PARALLEL.
+
+`FakeEmbeddings` replaces the embedding API with deterministic bag-of-words
+vectors, so the same text always gets the same vector and texts sharing words
+end up close, which keeps retrieval meaningful.
+'''
+from langchain_core.callbacks import CallbackManagerForLLMRun
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import ConfigDict, PrivateAttr
+
+from typing import Any, Callable, Iterator
+import asyncio
+import contextlib
+import random
+import re
+import threading
+import time
+import zlib
+
+import numpy as np
+
+
+class StubChatModel(BaseChatModel):
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    name: str = "stub"
+    reply: str | Callable[[list[BaseMessage]], str] = "ok"
+    latency: float | Callable[[], float] = 0.0
+    token_latency: float = 0.0 # Delay per generated token
+    fail_rate: float = 0.0
+    batch_overhead: float | None = None # Latency of a whole batch request; None answers batches one by one
+    parallel: int | None = None # Requests (or batches) served at once; None for no limit
+
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+    _rng: random.Random = PrivateAttr(default_factory=lambda: random.Random(0))
+    _slots: threading.Semaphore | None = PrivateAttr(default=None)
+    _async_slots: tuple | None = PrivateAttr(default=None) # (event loop, asyncio.Semaphore)
+    calls: int = 0
+    batches: int = 0
+    tokens_generated: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub"
+
+    def delay(self) -> float:
+        with self._lock:
+            self.calls += 1
+            fail = self._rng.random() < self.fail_rate
+        if fail:
+            raise ConnectionError(f"{self.name} failed")
+        return self.latency() if callable(self.latency) else self.latency
+
+    @contextlib.contextmanager
+    def slot(self):
+        if self.parallel is None:
+            yield
+            return
+        with self._lock:
+            if self._slots is None:
+                self._slots = threading.Semaphore(self.parallel)
+        with self._slots:
+            yield
+
+    @contextlib.asynccontextmanager
+    async def aslot(self):
+        if self.parallel is None:
+            yield
+            return
+        loop = asyncio.get_running_loop()
+        if self._async_slots is None or self._async_slots[0] is not loop:
+            self._async_slots = (loop, asyncio.Semaphore(self.parallel))
+        async with self._async_slots[1]:
+            yield
+
+    def answer(self, messages: list[BaseMessage]) -> str:
+        return self.reply(messages) if callable(self.reply) else self.reply
+
+    def _generate(self, messages: list[BaseMessage], stop: list[str] | None = None, run_manager: CallbackManagerForLLMRun | None = None, **kwargs: Any) -> ChatResult:
+        with self.slot():
+            time.sleep(self.delay())
+            if self.token_latency:
+                tokens = len(tokenize(self.answer(messages)))
+                time.sleep(self.token_latency * tokens)
+                with self._lock:
+                    self.tokens_generated += tokens
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(self.answer(messages)))])
+
+    async def _agenerate(self, messages: list[BaseMessage], stop: list[str] | None = None, run_manager=None, **kwargs: Any) -> ChatResult:
+        async with self.aslot():
+            await asyncio.sleep(self.delay())
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(self.answer(messages)))])
+
+    def _stream(self, messages: list[BaseMessage], stop: list[str] | None = None, run_manager: CallbackManagerForLLMRun | None = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        time.sleep(self.delay())
+        for token in tokenize(self.answer(messages)):
+            time.sleep(self.token_latency)
+            with self._lock:
+                self.tokens_generated += 1
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager is not None:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+    def batch(self, inputs: list, config=None, *, return_exceptions: bool = False, **kwargs: Any) -> list:
+        if self.batch_overhead is None:
+            return super().batch(inputs, config, return_exceptions=return_exceptions, **kwargs)
+        ## One request for the whole batch, like a server batching prompts on the GPU
+        with self._lock:
+            self.batches += 1
+            self.calls += len(inputs)
+        with self.slot():
+            time.sleep(self.batch_overhead)
+        return [AIMessage(self.answer(self._convert_input(prompt).to_messages())) for prompt in inputs]
+
+    async def abatch(self, inputs: list, config=None, *, return_exceptions: bool = False, **kwargs: Any) -> list:
+        if self.batch_overhead is None:
+            return await super().abatch(inputs, config, return_exceptions=return_exceptions, **kwargs)
+        with self._lock:
+            self.batches += 1
+            self.calls += len(inputs)
+        async with self.aslot():
+            await asyncio.sleep(self.batch_overhead)
+        return [AIMessage(self.answer(self._convert_input(prompt).to_messages())) for prompt in inputs]
+
+
+def tokenize(text: str) -> list[str]:
+    ## Roughly how chat APIs stream: words with their leading whitespace, tags as separate tokens
+    tokens, current = [], ""
+    for char in text:
+        if char in " \n<" and current:
+            tokens.append(current)
+            current = ""
+        current += char
+        if char == ">":
+            tokens.append(current)
+            current = ""
+    if current:
+        tokens.append(current)
+    return tokens
+
+
+def heavy_tail(median: float, tail: float, tail_rate: float, seed: int = 0) -> Callable[[], float]:
+    '''
+    Latency sampler: mostly around `median`, with `tail_rate` of the requests taking `tail`.
+    '''
+    rng = random.Random(seed)
+    lock = threading.Lock()
+
+    def sample() -> float:
+        with lock:
+            slow = rng.random() < tail_rate
+            jitter = rng.uniform(0.8, 1.2)
+        return (tail if slow else median) * jitter
+    return sample
+
+
+class FakeEmbeddings(Embeddings):
+    '''
+    Normalised sum of per-word random vectors, after a fixed `latency` per request.
+    '''
+    model_name = "fake-remote"
+
+    def __init__(self, size: int = 768, latency: float = 0.0):
+        self.size = size
+        self.latency = latency
+        self.calls = 0
+        self.texts = 0
+        self.__lock = threading.Lock()
+        self.__words: dict[str, np.ndarray] = {}
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        with self.__lock:
+            self.calls += 1
+            self.texts += len(texts)
+        if self.latency:
+            time.sleep(self.latency)
+        return [self.vector(text) for text in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.embed_documents([text])[0]
+
+    def vector(self, text: str) -> list[float]:
+        total = np.zeros(self.size, dtype=np.float32)
+        for word in re.findall(r"\w+", text.lower()) or [text]:
+            total += self.__word(word)
+        norm = np.linalg.norm(total)
+        return (total / norm if norm else total).tolist()
+
+    def __word(self, word: str) -> np.ndarray:
+        vector = self.__words.get(word)
+        if vector is None:
+            vector = np.random.default_rng(zlib.crc32(word.encode())).standard_normal(self.size).astype(np.float32)
+            self.__words[word] = vector
+        return vector
@@ -0,0 +1,697 @@
+'''
+In-memory stand-ins for the Firestore client.
+
+`FakeFirestore` implements the part of `google.cloud.firestore.Client` this repo
+uses: collections, documents, queries with `FieldFilter`, cursors and field
+projection, batches, `get_all`, transactions (usable with
+`firestore.transactional`) and the `ArrayUnion`/`ArrayRemove`/`Increment`/
+`DELETE_FIELD` transforms. Every call to the "server" sleeps for `latency`
+seconds and is counted in `round_trips`, so benchmarks can reason about
+network cost without a network.
+
+`AsyncFakeFirestore` serves the same storage to `AsyncClient` callers,
+transactions included (usable with `async_transactional`).
+
+`FakeAuth` stands in for `firebase_admin.auth`. `install_firestore` and
+`install_auth` put the fakes behind the repo's module-level clients.
+'''
+from google.api_core.exceptions import Aborted, InvalidArgument, NotFound
+from google.cloud.firestore_v1 import DELETE_FIELD, SERVER_TIMESTAMP
+from google.cloud.firestore_v1.field_path import FieldPath
+from google.cloud.firestore_v1.transforms import ArrayRemove, ArrayUnion, Increment
+
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import padding, rsa
+
+from datetime import datetime, timezone
+from types import SimpleNamespace
+import asyncio
+import copy
+import json
+import itertools
+import threading
+import time
+import uuid
+
+
+class FakeFirestore:
+    MAX_BATCH_WRITES = 500
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.round_trips = 0
+        self.reads = 0
+        self.writes = 0
+        self._docs: dict[str, dict] = {}
+        self._versions: dict[str, int] = {}
+        self._lock = threading.RLock()
+        self._failures: list[BaseException] = []
+        self._clock = itertools.count(1)
+
+    ## Client surface
+    def collection(self, path: str) -> "FakeCollection":
+        return FakeCollection(self, path)
+
+    def document(self, path: str) -> "FakeDocumentReference":
+        return FakeDocumentReference(self, path)
+
+    def batch(self) -> "FakeWriteBatch":
+        return FakeWriteBatch(self)
+
+    def transaction(self, max_attempts: int = 5, read_only: bool = False) -> "FakeTransaction":
+        return FakeTransaction(self, max_attempts, read_only)
+
+    def get_all(self, references, field_paths=None, transaction=None):
+        references = list(references)
+        self._round_trip()
+        snapshots = [ref._snapshot(field_paths, transaction) for ref in references]
+        yield from snapshots
+
+    ## Test helpers
+    def fail_next(self, *errors: BaseException):
+        '''
+        Make the next round trips raise the given errors, one each.
+        '''
+        with self._lock:
+            self._failures.extend(errors)
+
+    def dump(self) -> dict[str, dict]:
+        with self._lock:
+            return copy.deepcopy(self._docs)
+
+    def reset_counters(self):
+        self.round_trips = self.reads = self.writes = 0
+
+    ## Internals
+    def _round_trip(self):
+        with self._lock:
+            self.round_trips += 1
+            error = self._failures.pop(0) if self._failures else None
+        if self.latency:
+            time.sleep(self.latency)
+        if error is not None:
+            raise error
+
+    def _read(self, path: str) -> tuple[dict | None, int]:
+        with self._lock:
+            self.reads += 1
+            data = self._docs.get(path)
+            return copy.deepcopy(data), self._versions.get(path, 0)
+
+    def _commit(self, writes: list[tuple], reads: dict[str, int] | None = None):
+        if len(writes) > self.MAX_BATCH_WRITES:
+            raise InvalidArgument(f"maximum {self.MAX_BATCH_WRITES} writes allowed per request")
+        with self._lock:
+            for path, version in (reads or {}).items():
+                if self._versions.get(path, 0) != version:
+                    raise Aborted(f"Transaction lock timeout on {path}")
+            staged = {}
+            for op, path, data, merge in writes:
+                current = staged[path] if path in staged else copy.deepcopy(self._docs.get(path))
+                staged[path] = self._apply(op, path, current, data, merge)
+            for path, data in staged.items():
+                if data is None:
+                    self._docs.pop(path, None)
+                else:
+                    self._docs[path] = data
+                self._versions[path] = next(self._clock)
+            self.writes += len(writes)
+
+    def _apply(self, op: str, path: str, current: dict | None, data: dict, merge: bool) -> dict | None:
+        if op == "delete":
+            return None
+        if op == "create" and current is not None:
+            raise InvalidArgument(f"Document already exists: {path}")
+        if op == "update":
+            if current is None:
+                raise NotFound(f"No document to update: {path}")
+            for field, value in data.items():
+                self._set_path(current, FieldPath.from_string(field).parts, value)
+            return current
+        if current is None or not merge:
+            current = {}
+        self._merge(current, data)
+        return current
+
+    def _merge(self, target: dict, data: dict):
+        for field, value in data.items():
+            if isinstance(value, dict) and isinstance(target.get(field), dict):
+                self._merge(target[field], value)
+            else:
+                self._set_path(target, (field,), value)
+
+    def _set_path(self, target: dict, parts: tuple[str, ...], value):
+        for part in parts[:-1]:
+            target = target.setdefault(part, {})
+        field = parts[-1]
+        if value is DELETE_FIELD:
+            target.pop(field, None)
+        elif value is SERVER_TIMESTAMP:
+            target[field] = datetime.now(timezone.utc)
+        elif isinstance(value, ArrayUnion):
+            existing = list(target.get(field) or [])
+            existing.extend(v for v in copy.deepcopy(value.values) if v not in existing)
+            target[field] = existing
+        elif isinstance(value, ArrayRemove):
+            target[field] = [v for v in target.get(field) or [] if v not in value.values]
+        elif isinstance(value, Increment):
+            target[field] = (target.get(field) or 0) + value.value
+        elif isinstance(value, dict):
+            nested = {}
+            self._merge(nested, value)
+            target[field] = nested
+        else:
+            target[field] = copy.deepcopy(value)
+
+
+class FakeSnapshot:
+    def __init__(self, reference: "FakeDocumentReference", data: dict | None):
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+        self.exists = data is not None
+
+    def to_dict(self) -> dict | None:
+        return copy.deepcopy(self._data)
+
+    def get(self, field_path: str):
+        value = self._data
+        for part in FieldPath.from_string(field_path).parts:
+            value = value[part]
+        return copy.deepcopy(value)
+
+
+class FakeDocumentReference:
+    def __init__(self, client: FakeFirestore, path: str):
+        self._client = client
+        self.path = path
+        self.id = path.rsplit("/", 1)[-1]
+
+    @property
+    def parent(self) -> "FakeCollection":
+        return FakeCollection(self._client, self.path.rsplit("/", 1)[0])
+
+    def collection(self, name: str) -> "FakeCollection":
+        return FakeCollection(self._client, f"{self.path}/{name}")
+
+    def get(self, field_paths=None, transaction=None) -> FakeSnapshot:
+        self._client._round_trip()
+        return self._snapshot(field_paths, transaction)
+
+    def set(self, document_data: dict, merge: bool = False):
+        self._client._round_trip()
+        self._client._commit([("set", self.path, document_data, merge)])
+
+    def create(self, document_data: dict):
+        self._client._round_trip()
+        self._client._commit([("create", self.path, document_data, False)])
+
+    def update(self, field_updates: dict):
+        self._client._round_trip()
+        self._client._commit([("update", self.path, field_updates, False)])
+
+    def delete(self):
+        self._client._round_trip()
+        self._client._commit([("delete", self.path, None, False)])
+
+    def _snapshot(self, field_paths=None, transaction=None) -> FakeSnapshot:
+        data, version = self._client._read(self.path)
+        if transaction is not None:
+            transaction._reads.setdefault(self.path, version)
+        if data is not None and field_paths is not None:
+            data = _project(data, field_paths)
+        return FakeSnapshot(self, data)
+
+    def __eq__(self, other):
+        return isinstance(other, FakeDocumentReference) and other.path == self.path
+
+    def __hash__(self):
+        return hash(self.path)
+
+
+class FakeQuery:
+    OPERATORS = {
+        "==": lambda a, b: a == b,
+        "!=": lambda a, b: a != b,
+        "<": lambda a, b: a is not None and a < b,
+        "<=": lambda a, b: a is not None and a <= b,
+        ">": lambda a, b: a is not None and a > b,
+        ">=": lambda a, b: a is not None and a >= b,
+        "in": lambda a, b: a in b,
+        "not-in": lambda a, b: a not in b,
+        "array_contains": lambda a, b: isinstance(a, list) and b in a,
+        "array_contains_any": lambda a, b: isinstance(a, list) and any(v in a for v in b),
+    }
+
+    def __init__(self, client: FakeFirestore, path: str, filters=(), orders=(), limit=None, projection=None, cursor=None):
+        self._client = client
+        self._path = path
+        self._filters = tuple(filters)
+        self._orders = tuple(orders)
+        self._limit = limit
+        self._projection = projection
+        self._cursor = cursor
+
+    def _copy(self, **changes) -> "FakeQuery":
+        state = dict(filters=self._filters, orders=self._orders, limit=self._limit,
+                     projection=self._projection, cursor=self._cursor)
+        state.update(changes)
+        return FakeQuery(self._client, self._path, **state)
+
+    def where(self, field_path=None, op_string=None, value=None, *, filter=None) -> "FakeQuery":
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        if op_string in ("in", "not-in", "array_contains_any") and len(value) > 30:
+            raise InvalidArgument(f"'{op_string}' filters support a maximum of 30 elements in the value array")
+        return self._copy(filters=self._filters + ((field_path, op_string, value),))
+
+    def order_by(self, field_path: str, direction: str = "ASCENDING") -> "FakeQuery":
+        return self._copy(orders=self._orders + ((field_path, direction),))
+
+    def limit(self, count: int) -> "FakeQuery":
+        return self._copy(limit=count)
+
+    def select(self, field_paths) -> "FakeQuery":
+        return self._copy(projection=list(field_paths))
+
+    def start_after(self, document_fields_or_snapshot) -> "FakeQuery":
+        return self._copy(cursor=document_fields_or_snapshot)
+
+    def get(self, transaction=None) -> list[FakeSnapshot]:
+        return list(self.stream(transaction=transaction))
+
+    def stream(self, transaction=None):
+        self._client._round_trip()
+        with self._client._lock:
+            ## Matching and ordering look at the stored documents; only returned ones are copied and counted as reads
+            prefix = self._path + "/"
+            rows = [(path, data, self._client._versions.get(path, 0)) for path, data in self._client._docs.items()
+                    if path.startswith(prefix) and "/" not in path[len(prefix):]
+                    and all(self.OPERATORS[op](_lookup(data, field), value) for field, op, value in self._filters)]
+        if self._cursor is not None:
+            after = self._sort_key(self._cursor_row())
+            rows = [row for row in rows if self._sort_key(row) > after]
+        rows.sort(key=self._sort_key)
+        if self._limit is not None:
+            rows = rows[:self._limit]
+        for path, _, _ in rows:
+            data, version = self._client._read(path)
+            if data is None:
+                continue
+            if transaction is not None:
+                transaction._reads.setdefault(path, version)
+            if self._projection is not None:
+                data = _project(data, self._projection)
+            yield FakeSnapshot(FakeDocumentReference(self._client, path), data)
+
+    def _cursor_row(self) -> tuple:
+        cursor = self._cursor
+        if isinstance(cursor, FakeSnapshot):
+            ## Like the real client, the cursor takes its values from the snapshot
+            return (cursor.reference.path, cursor._data or {}, 0)
+        document_id = cursor.get(FieldPath.document_id(), "")
+        return (f"{self._path}/{document_id}", cursor, 0)
+
+    def _sort_key(self, row: tuple) -> tuple:
+        path, data, _ = row
+        key = []
+        for field, direction in self._orders:
+            value = path.rsplit("/", 1)[-1] if field == FieldPath.document_id() else _lookup(data, field)
+            key.append(_Reversed(value) if direction == "DESCENDING" else _Ordered(value))
+        key.append(_Ordered(path.rsplit("/", 1)[-1]))
+        return tuple(key)
+
+
+class FakeCollection(FakeQuery):
+    def __init__(self, client: FakeFirestore, path: str):
+        super().__init__(client, path)
+        self.id = path.rsplit("/", 1)[-1]
+
+    def document(self, document_id: str | None = None) -> FakeDocumentReference:
+        if document_id is None:
+            document_id = uuid.uuid4().hex[:20]
+        return FakeDocumentReference(self._client, f"{self._path}/{document_id}")
+
+    def add(self, document_data: dict, document_id: str | None = None):
+        ref = self.document(document_id)
+        ref.set(document_data)
+        return None, ref
+
+    def list_documents(self):
+        prefix = self._path + "/"
+        with self._client._lock:
+            paths = [path for path in self._client._docs
+                     if path.startswith(prefix) and "/" not in path[len(prefix):]]
+        return [FakeDocumentReference(self._client, path) for path in sorted(paths)]
+
+
+class FakeWriteBatch:
+    def __init__(self, client: FakeFirestore):
+        self._client = client
+        self._writes: list[tuple] = []
+
+    def set(self, reference, document_data: dict, merge: bool = False):
+        self._writes.append(("set", reference.path, document_data, merge))
+
+    def create(self, reference, document_data: dict):
+        self._writes.append(("create", reference.path, document_data, False))
+
+    def update(self, reference, field_updates: dict):
+        self._writes.append(("update", reference.path, field_updates, False))
+
+    def delete(self, reference):
+        self._writes.append(("delete", reference.path, None, False))
+
+    def commit(self):
+        self._client._round_trip()
+        self._client._commit(self._writes)
+        results, self._writes = [object()] * len(self._writes), []
+        return results
+
+    def __len__(self):
+        return len(self._writes)
+
+
+class FakeTransaction(FakeWriteBatch):
+    '''
+    Optimistic transaction: the versions of every document read through it are
+    checked at commit and `Aborted` is raised on conflict, which makes
+    `firestore.transactional` retry the wrapped function.
+    '''
+    def __init__(self, client: FakeFirestore, max_attempts: int, read_only: bool):
+        super().__init__(client)
+        self._max_attempts = max_attempts
+        self._read_only = read_only
+        self._reads: dict[str, int] = {}
+        self._id = None
+
+    @property
+    def in_progress(self) -> bool:
+        return self._id is not None
+
+    @property
+    def id(self):
+        return self._id
+
+    def get(self, ref_or_query):
+        if isinstance(ref_or_query, FakeDocumentReference):
+            return iter([ref_or_query.get(transaction=self)])
+        return ref_or_query.stream(transaction=self)
+
+    def get_all(self, references):
+        return self._client.get_all(references, transaction=self)
+
+    def _clean_up(self):
+        self._writes = []
+        self._reads = {}
+        self._id = None
+
+    def _begin(self, retry_id=None):
+        self._id = uuid.uuid4().bytes
+
+    def _rollback(self):
+        self._clean_up()
+
+    def _commit(self):
+        try:
+            self._client._round_trip()
+            self._client._commit(self._writes, self._reads)
+            return [object()] * len(self._writes)
+        finally:
+            self._clean_up()
+
+
+def _lookup(data: dict | None, field_path: str):
+    value = data
+    for part in FieldPath.from_string(field_path).parts:
+        if not isinstance(value, dict) or part not in value:
+            return None
+        value = value[part]
+    return value
+
+
+def _project(data: dict, field_paths) -> dict:
+    projected = {}
+    for field in field_paths:
+        parts = FieldPath.from_string(field).parts
+        value = _lookup(data, field)
+        if value is None:
+            continue
+        target = projected
+        for part in parts[:-1]:
+            target = target.setdefault(part, {})
+        target[parts[-1]] = value
+    return projected
+
+
+class _Ordered:
+    '''
+    Sort key wrapper ordering None first and mixed types by type name, like Firestore does.
+    '''
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+    def _key(self):
+        return (self.value is not None, type(self.value).__name__, self.value)
+
+    def __lt__(self, other):
+        return self._key() < other._key()
+
+    def __gt__(self, other):
+        return self._key() > other._key()
+
+    def __eq__(self, other):
+        return self._key() == other._key()
+
+
+class _Reversed(_Ordered):
+    def __lt__(self, other):
+        return self._key() > other._key()
+
+    def __gt__(self, other):
+        return self._key() < other._key()
+
+
+class AsyncFakeFirestore:
+    '''
+    `AsyncClient` counterpart of `FakeFirestore`, sharing its storage. Latency is
+    awaited with `asyncio.sleep`, so concurrent requests overlap like real ones.
+    '''
+    def __init__(self, client: FakeFirestore | None = None, latency: float = 0.0):
+        self.sync = client if client is not None else FakeFirestore()
+        self.latency = latency
+
+    def collection(self, path: str) -> "AsyncFakeQuery":
+        return AsyncFakeQuery(self, self.sync.collection(path))
+
+    def document(self, path: str) -> "AsyncFakeDocumentReference":
+        return AsyncFakeDocumentReference(self, self.sync.document(path))
+
+    def batch(self) -> "AsyncFakeWriteBatch":
+        return AsyncFakeWriteBatch(self, self.sync.batch())
+
+    def transaction(self, max_attempts: int = 5, read_only: bool = False) -> "AsyncFakeTransaction":
+        return AsyncFakeTransaction(self, self.sync.transaction(max_attempts, read_only))
+
+    async def get_all(self, references, field_paths=None, transaction=None):
+        await self._wait()
+        for snapshot in list(self.sync.get_all([ref._ref for ref in references], field_paths)):
+            yield AsyncFakeSnapshot(self, snapshot)
+
+    async def _wait(self):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+
+class AsyncFakeSnapshot(FakeSnapshot):
+    def __init__(self, client: AsyncFakeFirestore, snapshot: FakeSnapshot):
+        super().__init__(AsyncFakeDocumentReference(client, snapshot.reference), snapshot._data)
+
+
+class AsyncFakeDocumentReference:
+    def __init__(self, client: AsyncFakeFirestore, ref: FakeDocumentReference):
+        self._client = client
+        self._ref = ref
+        self.path = ref.path
+        self.id = ref.id
+
+    def collection(self, name: str) -> "AsyncFakeQuery":
+        return AsyncFakeQuery(self._client, self._ref.collection(name))
+
+    async def get(self, field_paths=None, transaction=None):
+        await self._client._wait()
+        transaction = transaction._batch if transaction is not None else None
+        return AsyncFakeSnapshot(self._client, self._ref.get(field_paths, transaction))
+
+    async def set(self, document_data: dict, merge: bool = False):
+        await self._client._wait()
+        self._ref.set(document_data, merge)
+
+    async def update(self, field_updates: dict):
+        await self._client._wait()
+        self._ref.update(field_updates)
+
+    async def delete(self):
+        await self._client._wait()
+        self._ref.delete()
+
+
+class AsyncFakeQuery:
+    def __init__(self, client: AsyncFakeFirestore, query: FakeQuery):
+        self._client = client
+        self._query = query
+        self.id = getattr(query, "id", None)
+
+    def document(self, document_id: str | None = None) -> AsyncFakeDocumentReference:
+        return AsyncFakeDocumentReference(self._client, self._query.document(document_id))
+
+    def where(self, *args, **kwargs) -> "AsyncFakeQuery":
+        return AsyncFakeQuery(self._client, self._query.where(*args, **kwargs))
+
+    def order_by(self, *args, **kwargs) -> "AsyncFakeQuery":
+        return AsyncFakeQuery(self._client, self._query.order_by(*args, **kwargs))
+
+    def limit(self, count: int) -> "AsyncFakeQuery":
+        return AsyncFakeQuery(self._client, self._query.limit(count))
+
+    def select(self, field_paths) -> "AsyncFakeQuery":
+        return AsyncFakeQuery(self._client, self._query.select(field_paths))
+
+    def start_after(self, snapshot) -> "AsyncFakeQuery":
+        return AsyncFakeQuery(self._client, self._query.start_after(snapshot))
+
+    async def get(self, transaction=None) -> list:
+        return [snapshot async for snapshot in self.stream()]
+
+    async def stream(self, transaction=None):
+        await self._client._wait()
+        for snapshot in list(self._query.stream()):
+            yield AsyncFakeSnapshot(self._client, snapshot)
+
+
+class AsyncFakeWriteBatch:
+    def __init__(self, client: AsyncFakeFirestore, batch: FakeWriteBatch):
+        self._client = client
+        self._batch = batch
+
+    def set(self, reference, document_data: dict, merge: bool = False):
+        self._batch.set(reference._ref, document_data, merge)
+
+    def update(self, reference, field_updates: dict):
+        self._batch.update(reference._ref, field_updates)
+
+    def delete(self, reference):
+        self._batch.delete(reference._ref)
+
+    async def commit(self):
+        await self._client._wait()
+        return self._batch.commit()
+
+
+class AsyncFakeTransaction(AsyncFakeWriteBatch):
+    '''
+    `AsyncTransaction` counterpart of `FakeTransaction`, usable with `async_transactional`.
+    '''
+    def __init__(self, client: AsyncFakeFirestore, transaction: FakeTransaction):
+        super().__init__(client, transaction)
+        self._max_attempts = transaction._max_attempts
+        self._read_only = transaction._read_only
+
+    @property
+    def in_progress(self) -> bool:
+        return self._batch.in_progress
+
+    @property
+    def _id(self):
+        return self._batch.id
+
+    def _clean_up(self):
+        self._batch._clean_up()
+
+    async def _begin(self, retry_id=None):
+        self._batch._begin(retry_id)
+
+    async def _rollback(self):
+        self._batch._rollback()
+
+    async def _commit(self):
+        await self._client._wait()
+        return self._batch._commit()
+
+
+class FakeAuth:
+    '''
+    Stand-in for `firebase_admin.auth`. ID tokens are signed with a local
+    RSA-2048 key and verified the same way, which costs about as much CPU as
+    the real check without fetching Google's certificates. Exceptions and other
+    names come from the real module.
+    '''
+    def __init__(self, latency: float = 0.0):
+        from firebase_admin import auth
+        self._auth = auth
+        self._key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        self._public_key = self._key.public_key()
+        self._lock = threading.Lock()
+        self.latency = latency # Per user management call; token checks are local, as in firebase_admin
+        self.users: dict[str, dict] = {}
+        self.verifications = 0
+
+    def issue_token(self, uid: str, ttl: float = 3600) -> str:
+        now = time.time()
+        payload = json.dumps({ "uid": uid, "iat": now, "exp": now + ttl }).encode()
+        signature = self._key.sign(payload, padding.PKCS1v15(), hashes.SHA256())
+        return payload.hex() + "." + signature.hex()
+
+    def verify_id_token(self, id_token: str, app=None, check_revoked: bool = False, clock_skew_seconds: int = 0) -> dict:
+        with self._lock:
+            self.verifications += 1
+        try:
+            payload, signature = (bytes.fromhex(part) for part in id_token.split("."))
+            self._public_key.verify(signature, payload, padding.PKCS1v15(), hashes.SHA256())
+        except Exception as e:
+            raise self._auth.InvalidIdTokenError("Invalid token", cause=e)
+        decoded = json.loads(payload)
+        if decoded["exp"] < time.time():
+            raise self._auth.ExpiredIdTokenError("Token expired", None)
+        return decoded
+
+    def create_user(self, **properties) -> SimpleNamespace:
+        if self.latency:
+            time.sleep(self.latency)
+        uid = properties.get("uid") or uuid.uuid4().hex[:28]
+        with self._lock:
+            if any(user.get("email") == properties.get("email") for user in self.users.values()):
+                raise self._auth.EmailAlreadyExistsError("Email already exists", None, None)
+            self.users[uid] = properties
+        return SimpleNamespace(uid=uid, **properties)
+
+    def import_users(self, users: list, hash_alg=None, app=None) -> SimpleNamespace:
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            for record in users:
+                self.users[record.uid] = { "email": record.email }
+        return SimpleNamespace(success_count=len(users), failure_count=0, errors=[])
+
+    def __getattr__(self, name: str):
+        return getattr(self._auth, name)
+
+
+def install_firestore(db) -> None:
+    '''
+    Make `FirestoreInstance()` (and so every `FirestoreUtil()`) return `db`.
+    '''
+    from common import import_repo
+    firestore = import_repo("db.firebase.firestore")
+    firestore.FirestoreInstance._FirestoreInstance__instance = db
+
+
+def install_auth(fake: FakeAuth) -> None:
+    '''
+    Route the repo's `auth` calls (authentication, registration, imports) to `fake`.
+    '''
+    from common import import_repo
+    for module in ("db.firebase.user_auth", "db.firebase.user_import"):
+        import_repo(module).auth = fake
@@ -0,0 +1,355 @@
+'''
+Offline regression suite over the hot paths of the repo.
+
+Every case runs one operation against the local fakes: `FakeFirestore` and
+`FakeAuth` (fakes.py), `FakeEmbeddings` and `StubChatModel` (fake_llm.py).
+No network, Firebase project or model server is needed. Cases are repeated
+at growing history lengths, batch sizes and corpus sizes, and each records
+throughput, p50/p99 latency and the peak memory allocated while it runs
+(tracemalloc, above what was allocated before).
+
+Results are saved as JSON in `benchmarks/results/<commit>.json`, so two
+commits can be compared with `--compare`. Changes beyond `--threshold`
+(default 20%) are flagged and make the comparison exit with status 1.
+
+    python benchmarks/suite.py
+    python benchmarks/suite.py --quick --only history,parsers
+    python benchmarks/suite.py --compare results/1a2b3c4.json results/5d6e7f8.json
+
+A group whose modules can't be imported in the current environment (e.g. a
+missing optional dependency) is reported as skipped and recorded as such.
+'''
+from common import REPO_ROOT, import_repo, measure
+from fakes import FakeAuth, FakeFirestore, install_auth, install_firestore
+from fake_llm import FakeEmbeddings, StubChatModel, tokenize
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from typing import Callable, Iterator
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import tracemalloc
+
+RESULTS_DIR = REPO_ROOT / "benchmarks" / "results"
+
+WORDS = ("memory brain care patient doctor symptom therapy sleep family routine medication appointment "
+         "walk music photo garden meal reminder caregiver confusion").split()
+
+GROUPS: dict[str, Callable[[bool], Iterator[dict]]] = {}
+
+def group(name: str):
+    '''
+    Register a generator of cases: dicts with `name`, `params`, `fn`, `iterations` and optionally `items`
+    (units of work per call, e.g. documents written, for the items/s column).
+    '''
+    def register(cases: Callable[[bool], Iterator[dict]]):
+        GROUPS[name] = cases
+        return cases
+    return register
+
+def sentence(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+## Firestore
+
+@group("firestore")
+def firestore_cases(quick: bool) -> Iterator[dict]:
+    firestore = import_repo("db.firebase.firestore")
+    rng = random.Random(0)
+    for corpus in (1000,) if quick else (1000, 10000):
+        db = FakeFirestore(latency=0.0005)
+        util = firestore.FirestoreUtil(db)
+        util.bulk_insert_data("users", (
+            (f"user-{i:07d}", { "username": f"user{i}", "email": f"user{i}@example.com", "role": "patient", "bio": sentence(rng, 60) })
+            for i in range(corpus)
+        ))
+        doc_ids = [f"user-{i:07d}" for i in range(0, corpus, max(1, corpus // 100))]
+        yield { "name": "fetch_many", "params": { "corpus": corpus, "docs": len(doc_ids) }, "fn": lambda: util.fetch_many("users", doc_ids), "iterations": 20, "items": len(doc_ids) }
+        yield { "name": "fetch_email_by_username", "params": { "corpus": corpus }, "fn": lambda: util.fetch_email_by_username("user7"), "iterations": 50 }
+        yield { "name": "scan", "params": { "corpus": corpus, "page_size": 500, "fields": 1 }, "fn": lambda: sum(1 for _ in util.scan("users", fields=["email"])), "iterations": 3, "items": corpus }
+    for batch in (100,) if quick else (100, 1000, 5000):
+        db = FakeFirestore(latency=0.0005)
+        util = firestore.FirestoreUtil(db)
+        records = [(f"doc-{i}", { "value": i, "text": sentence(rng, 20) }) for i in range(batch)]
+        yield { "name": "bulk_insert_data", "params": { "batch": batch }, "fn": lambda: util.bulk_insert_data("events", records), "iterations": 5, "items": batch }
+
+## Auth
+
+@group("auth")
+def auth_cases(quick: bool) -> Iterator[dict]:
+    user_auth = import_repo("db.firebase.user_auth")
+    fake = FakeAuth()
+    install_auth(fake)
+    for cached in (False, True):
+        authentication = user_auth.FirebaseAuthentication()
+        authentication.token_cache = user_auth.TokenCache() if cached else None
+        request = SimpleNamespace(path="/chat", data={}, headers={ "Authorization": "Bearer " + fake.issue_token("user-1") })
+        yield { "name": "authenticate", "params": { "token_cache": cached }, "fn": lambda a=authentication, r=request: a.authenticate(r), "iterations": 500 if quick else 3000 }
+
+## Message histories
+
+@group("history")
+def history_cases(quick: bool) -> Iterator[dict]:
+    message_history = import_repo("llm.langchain.message_history")
+    from langchain_core.messages import AIMessage, HumanMessage
+    rng = random.Random(0)
+    lengths = (100, 1000) if quick else (100, 1000, 10000)
+
+    directory = tempfile.mkdtemp()
+    try:
+        for length in lengths:
+            seeded = message_history.FileChatMessageHistory(directory, f"file-{length}")
+            seeded.add_messages([(HumanMessage if i % 2 == 0 else AIMessage)(sentence(rng, 30)) for i in range(length)])
+            uncached = message_history.FileChatMessageHistory(directory, f"file-{length}", cache=None)
+            appended = message_history.FileChatMessageHistory(directory, f"append-{length}")
+            appended.add_messages(seeded.messages)
+            message = HumanMessage(sentence(rng, 30))
+            yield { "name": "file.messages", "params": { "length": length, "cache": False }, "fn": lambda h=uncached: h.messages, "iterations": 10, "items": length }
+            yield { "name": "file.messages", "params": { "length": length, "cache": True }, "fn": lambda h=seeded: h.messages, "iterations": 200, "items": length }
+            yield { "name": "file.get_last_messages", "params": { "length": length, "n": 20 }, "fn": lambda h=uncached: h.get_last_messages(20), "iterations": 200 }
+            yield { "name": "file.add_message", "params": { "length": length }, "fn": lambda h=appended, m=message: h.add_message(m), "iterations": 200 }
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    from google.cloud.firestore_v1.transforms import Sentinel
+    db = FakeFirestore(latency=0.0005)
+    install_firestore(db)
+    firebase = import_repo("llm.langchain.message_history.firebase")
+    firebase.print = lambda *args, **kwargs: None # The history logs every message it adds
+    for length in lengths[:2]:
+        history = firebase.FirebaseMessageHistory(f"chat-{length}", f"uid-{length}")
+        for start in range(0, length, 200):
+            history.add_messages([(HumanMessage if i % 2 == 0 else AIMessage)(sentence(rng, 30)) for i in range(start, min(length, start + 200))])
+        message = HumanMessage(sentence(rng, 30))
+        yield { "name": "firebase.get_last_messages", "params": { "length": length, "n": 20 }, "fn": lambda h=history: h.get_last_messages(20), "iterations": 50 }
+        yield { "name": "firebase.add_message", "params": { "length": length }, "fn": lambda h=history, m=message: h.add_message(m), "iterations": 50 }
+
+## Retrieval-augmented generation
+
+@group("retrieval")
+def retrieval_cases(quick: bool) -> Iterator[dict]:
+    vectorstore = import_repo("llm.langchain.vectorstore")
+    rng = random.Random(0)
+    embedding = FakeEmbeddings(size=384)
+    for corpus in (1000, 10000) if quick else (1000, 10000, 50000):
+        directory = tempfile.mkdtemp()
+        store = vectorstore.NumpyVectorStore("bench", embedding, directory, ivf_threshold=20000)
+        texts = [sentence(rng, 40) for _ in range(corpus)]
+        for start in range(0, corpus, 5000):
+            chunk = texts[start:start + 5000]
+            store.add_embeddings(list(zip(chunk, embedding.embed_documents(chunk))), ids=[str(i) for i in range(start, start + len(chunk))])
+        retriever = store.as_retriever(search_kwargs={ "k": 4 })
+        question = "what helps a patient with confusion and sleep"
+        yield { "name": "retrieve", "params": { "corpus": corpus, "k": 4 }, "fn": lambda r=retriever: r.invoke(question), "iterations": 200 }
+        shutil.rmtree(directory, ignore_errors=True)
+
+@group("ingest")
+def ingest_cases(quick: bool) -> Iterator[dict]:
+    vectorstore = import_repo("llm.langchain.vectorstore")
+    ingest = import_repo("llm.langchain.ingest")
+    ingest.print = lambda *args, **kwargs: None # Every run prints its report
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+    rng = random.Random(0)
+    embedding = FakeEmbeddings(size=384)
+    for files in (10,) if quick else (10, 50):
+        directory = tempfile.mkdtemp()
+        sources = os.path.join(directory, "docs")
+        os.makedirs(sources)
+        for i in range(files):
+            with open(os.path.join(sources, f"doc-{i}.txt"), "w") as file:
+                file.write("\n\n".join(sentence(rng, 80) for _ in range(40)))
+        splitter = RecursiveCharacterTextSplitter(chunk_size=400, chunk_overlap=40)
+
+        def cold(directory=directory, sources=sources, splitter=splitter):
+            store_directory = tempfile.mkdtemp(dir=directory)
+            store = vectorstore.NumpyVectorStore("bench", embedding, store_directory)
+            ingest.DocumentIngestor(store, os.path.join(store_directory, "manifest.json"), splitter, parse_workers=0).ingest(sources)
+
+        store = vectorstore.NumpyVectorStore("bench", embedding, directory)
+        ingestor = ingest.DocumentIngestor(store, os.path.join(directory, "manifest.json"), splitter, parse_workers=0)
+        ingestor.ingest(sources)
+        yield { "name": "ingest.cold", "params": { "files": files }, "fn": cold, "iterations": 3, "items": files }
+        yield { "name": "ingest.unchanged", "params": { "files": files }, "fn": lambda i=ingestor, s=sources: i.ingest(s), "iterations": 5, "items": files }
+
+## Output parsers and model clients
+
+@group("parsers")
+def parser_cases(quick: bool) -> Iterator[dict]:
+    parsers = import_repo("llm.langchain.parsers")
+    parsers.print = lambda *args, **kwargs: None # The reasoning is printed once parsed
+    rng = random.Random(0)
+    chat, deepseek = parsers.ChatOutputParser(), parsers.DeepseekOutputParser()
+    for tokens in (50, 500) if quick else (50, 500, 5000):
+        answer = sentence(rng, tokens)
+        reasoning = f"<think>{sentence(rng, tokens)}</think>\n{answer}"
+        chunks = tokenize(answer + "\nHuman: and then?")
+        yield { "name": "chat.parse", "params": { "tokens": tokens }, "fn": lambda text=answer + "\nHuman: and then?": chat.parse(text), "iterations": 500 }
+        yield { "name": "chat.transform", "params": { "tokens": tokens }, "fn": lambda c=chunks: list(chat.transform(iter(c))), "iterations": 50, "items": len(chunks) }
+        yield { "name": "deepseek.transform", "params": { "tokens": tokens }, "fn": lambda c=tokenize(reasoning): list(deepseek.transform(iter(c))), "iterations": 50, "items": tokens * 2 }
+
+@group("llm")
+def llm_cases(quick: bool) -> Iterator[dict]:
+    batching = import_repo("llm.langchain.batching")
+    requests, callers = (64, 16) if quick else (256, 32)
+    for batch in (1, 4, 16):
+        model = StubChatModel(latency=0.002, batch_overhead=0.003, parallel=2)
+        batcher = batching.MicroBatcher(model, max_batch_size=batch, max_wait=0.002, max_concurrent_batches=2)
+
+        def workload(batcher=batcher):
+            with ThreadPoolExecutor(callers) as pool:
+                list(pool.map(lambda i: batcher.invoke(f"Question {i}"), range(requests)))
+        yield { "name": "micro_batched_requests", "params": { "max_batch_size": batch, "callers": callers }, "fn": workload, "iterations": 3, "items": requests }
+
+@group("memory")
+def memory_cases(quick: bool) -> Iterator[dict]:
+    memory = import_repo("llm.langchain.memory")
+    message_history = import_repo("llm.langchain.message_history")
+    from langchain_core.messages import AIMessage, HumanMessage
+    rng = random.Random(0)
+    directory = tempfile.mkdtemp()
+    try:
+        for length in (100, 1000) if quick else (100, 1000, 10000):
+            history = message_history.FileChatMessageHistory(directory, f"chat-{length}")
+            history.add_messages([(HumanMessage if i % 2 == 0 else AIMessage)(sentence(rng, 30)) for i in range(length)])
+            window = memory.TokenWindowMemory(chat_memory=history, max_token_limit=2000)
+
+            def turn(window=window):
+                window.load_memory_variables({ "input": "hello" })
+                window.save_context({ "input": "how are you?" }, { "response": sentence(rng, 30) })
+            yield { "name": "token_window.turn", "params": { "length": length, "budget": 2000 }, "fn": turn, "iterations": 100 }
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+## Instrumentation overhead
+
+@group("instrumentation")
+def instrumentation_cases(quick: bool) -> Iterator[dict]:
+    instrumentation = import_repo("instrumentation").instrumentation
+    traced = instrumentation.traced("suite.traced")(lambda: None)
+    iterations = 20000 if quick else 200000
+    for mode, sample_rate in (("disabled", None), ("enabled", 1.0), ("sampled_1pct", 0.01)):
+        def call(sample_rate=sample_rate):
+            instrumentation.configure(enabled=sample_rate is not None, sample_rate=sample_rate)
+            try:
+                for _ in range(100):
+                    traced()
+            finally:
+                instrumentation.configure(enabled=False, sample_rate=1.0)
+        yield { "name": "traced_call", "params": { "mode": mode }, "fn": call, "iterations": iterations // 100, "items": 100 }
+    instrumentation.reset()
+
+## Runner
+
+def run_case(case: dict) -> dict:
+    iterations = case["iterations"]
+    result = measure(case["fn"], iterations, warmup=max(1, min(10, iterations // 10)))
+    ## Peak memory of a few more calls, above what was already allocated
+    tracemalloc.start()
+    baseline, _ = tracemalloc.get_traced_memory()
+    for _ in range(min(iterations, 3)):
+        case["fn"]()
+    _, top = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    items = case.get("items", 1)
+    return {
+        "name": case["name"],
+        "params": case["params"],
+        "iterations": iterations,
+        "ops_per_second": result["ops_per_second"],
+        "items_per_second": result["ops_per_second"] * items,
+        "p50_us": result["p50_us"],
+        "p99_us": result["p99_us"],
+        "peak_kb": (top - baseline) / 1024,
+    }
+
+def describe(record: dict) -> str:
+    params = " ".join(f"{key}={value}" for key, value in record["params"].items())
+    return f"{record['name']} {params}"
+
+def run(groups: list[str], quick: bool) -> dict:
+    report = {
+        "commit": git("rev-parse", "--short", "HEAD"),
+        "dirty": bool(git("status", "--porcelain", "--untracked-files=no")),
+        "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "quick": quick,
+        "results": [],
+        "skipped": {},
+    }
+    for name in groups:
+        print(f"\n{name}")
+        try:
+            for case in GROUPS[name](quick):
+                record = { "group": name, **run_case(case) }
+                report["results"].append(record)
+                print(f"  {describe(record):<52} {record['ops_per_second']:>10,.1f} ops/s {record['items_per_second']:>12,.0f} items/s"
+                      f"   p50 {record['p50_us']:>10.1f} us   p99 {record['p99_us']:>10.1f} us   peak {record['peak_kb']:>9.1f} KB")
+        except ImportError as e:
+            report["skipped"][name] = f"{type(e).__name__}: {e}"
+            print(f"  skipped: {report['skipped'][name]}")
+    return report
+
+def compare(base_path: str, new_path: str, threshold: float) -> int:
+    with open(base_path) as file:
+        base = json.load(file)
+    with open(new_path) as file:
+        new = json.load(file)
+    key = lambda record: (record["group"], record["name"], json.dumps(record["params"], sort_keys=True))
+    before = { key(record): record for record in base["results"] }
+    regressions = 0
+    print(f"{base['commit']}{'+' if base['dirty'] else ''} -> {new['commit']}{'+' if new['dirty'] else ''}   (change in ops/s, p99, peak memory)")
+    for record in new["results"]:
+        old = before.get(key(record))
+        if old is None:
+            continue
+        changes = {
+            "ops/s": record["ops_per_second"] / old["ops_per_second"] - 1,
+            "p99": record["p99_us"] / old["p99_us"] - 1 if old["p99_us"] else 0.0,
+            "peak": (record["peak_kb"] - old["peak_kb"]) / max(old["peak_kb"], 64.0), # Small peaks are noise
+        }
+        worse = changes["ops/s"] < -threshold or changes["p99"] > threshold or changes["peak"] > threshold
+        regressions += worse
+        print(f"  {record['group'] + ' ' + describe(record):<60} " + "   ".join(f"{name} {change:+7.1%}" for name, change in changes.items())
+              + ("   REGRESSION" if worse else ""))
+    print(f"{regressions} regression(s) beyond {threshold:.0%}")
+    return 1 if regressions else 0
+
+def git(*args: str) -> str:
+    try:
+        return subprocess.run(["git", "-C", str(REPO_ROOT), *args], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark suite")
+    parser.add_argument("--quick", action="store_true", help="smaller sizes, for a fast check")
+    parser.add_argument("--only", help=f"comma-separated groups out of: {', '.join(GROUPS)}")
+    parser.add_argument("--output", help="result file; defaults to benchmarks/results/<commit>.json")
+    parser.add_argument("--compare", nargs=2, metavar=("BASE", "NEW"), help="compare two result files instead of running")
+    parser.add_argument("--threshold", type=float, default=0.2, help="relative change flagged as a regression")
+    args = parser.parse_args()
+
+    if args.compare:
+        sys.exit(compare(*args.compare, args.threshold))
+    groups = args.only.split(",") if args.only else list(GROUPS)
+    unknown = [name for name in groups if name not in GROUPS]
+    if unknown:
+        parser.error(f"unknown groups: {', '.join(unknown)}")
+    report = run(groups, args.quick)
+    output = args.output or str(RESULTS_DIR / f"{report['commit']}{'-dirty' if report['dirty'] else ''}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as file:
+        json.dump(report, file, indent=2)
+    print(f"\nResults saved to {output}")
+
+if __name__ == "__main__":
+    main()
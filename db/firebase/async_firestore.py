@@ -0,0 +1,355 @@
+from firebase_admin import firestore_async
+
+from google.cloud.firestore_v1.base_query import FieldFilter
+from google.cloud.firestore_v1.async_document import AsyncDocumentReference
+from google.cloud.firestore_v1.base_document import DocumentSnapshot
+from google.cloud.firestore import AsyncClient
+
+from .firestore import BulkWriteReport, FirestoreUtil
+from ...exception import MsgException
+from ...instrumentation import instrumentation
+
+from typing import AsyncIterable, Awaitable, Iterable
+import asyncio
+import random
+import time
+
+class AsyncFirestoreInstance:
+    __instance: AsyncClient = None
+
+    def __new__(cls):
+        if cls.__instance is None:
+            cls.__instance = firestore_async.client()
+        return cls.__instance
+
+async def gather_bounded(aws: Iterable[Awaitable], limit: int = 100) -> list:
+    '''
+    `asyncio.gather` with at most `limit` awaitables running at once; results keep the input order.
+    '''
+    semaphore = asyncio.Semaphore(limit)
+
+    async def run(aw: Awaitable):
+        async with semaphore:
+            return await aw
+
+    return await asyncio.gather(*(run(aw) for aw in aws))
+
+@instrumentation.instrument("firestore_async")
+class AsyncFirestoreUtil:
+    '''
+    Asyncio counterpart of `FirestoreUtil`, backed by Firestore's `AsyncClient`.
+
+    Same methods, same results and the same shared `FirestoreUtil.user_cache`;
+    every call is a coroutine, so one event loop can keep hundreds of requests in flight.
+    '''
+    def __init__(self, db: AsyncClient | None = None):
+        self.__db = db if db is not None else AsyncFirestoreInstance()
+        self.__users = self.__db.collection("users")
+
+    @property
+    def user_cache(self):
+        return FirestoreUtil.user_cache
+
+    async def validate_user_role(self, email: str, role: str) -> str:
+        cached = self.user_cache.get_by_email(email) if self.user_cache is not None else None
+        if cached is not None:
+            docs = [cached]
+        else:
+            query = self.__users.where(filter=FieldFilter("email", "==", email))
+            docs = await self.__lookup_users(query, ["role"])
+        if len(docs) == 0:
+            raise MsgException(
+                "Invalid User!!",
+                "User not found!! Please register!!",
+                400
+            )
+        user_role = None
+        for _, user_data in docs:
+            user_role = user_data.get("role", None)
+        if(user_role != role):
+            raise MsgException(
+                "Invalid Login!!",
+                "User role doesn't match!! Please login from proper interface.",
+                406
+            )
+        return True
+
+    async def fetch_user_data(self, uid: str, send_ref: bool = False):
+        """Fetch User data from Firestore
+
+        Args:
+            uid (str): User ID (for reference)
+            send_ref (bool, optional): Boolean value for sending Doc snapshot or Data only. Defaults to False.
+
+        Returns:
+            DocumentSnapshot | dict: Doc snapshot | Data retrieved from Firestore
+        """
+        if not send_ref and self.user_cache is not None:
+            user_data = self.user_cache.get(uid)
+            if user_data is not None:
+                return user_data
+        ref: DocumentSnapshot = await self.__users.document(uid).get()
+        if ref.exists:
+            self.__cache_users([(ref.id, ref.to_dict())])
+        return ref if send_ref else ref.to_dict()
+
+    async def fetch_data(self, doc_id: str, collection: str, send_ref: bool = False) -> AsyncDocumentReference | dict:
+        """Fetch data from Firestore
+
+        Args:
+            doc_id (str): Document ID (for reference)
+            collection (str): Collection path ( must be in odd values)
+            send_ref (bool, optional): Boolean value for sending Doc reference or Data only. Defaults to False.
+
+        Returns:
+            AsyncDocumentReference | dict: Doc reference | Data retrieved from Firestore
+        """
+        ref: AsyncDocumentReference = self.__db.collection(collection).document(doc_id)
+        return ref if send_ref else (await ref.get()).to_dict()
+
+    async def fetch_many(self, collection: str, doc_ids: list[str], fields: list[str] | None = None, max_concurrency: int = 100) -> list[dict[str, object] | None]:
+        """Fetch many documents by ID using concurrent `get_all` calls
+
+        Args:
+            collection (str): Collection path ( must be in odd values)
+            doc_ids (list[str]): Document IDs to be fetched
+            fields (list[str] | None, optional): Field paths to be returned. Defaults to None (whole documents).
+            max_concurrency (int, optional): Number of `get_all` calls in flight. Defaults to 100.
+
+        Returns:
+            list[dict | None]: Data aligned with `doc_ids`; None for documents not found
+        """
+        found: dict[str, dict[str, object] | None] = {}
+        use_cache = collection == "users" and fields is None and self.user_cache is not None
+        if use_cache:
+            for doc_id in doc_ids:
+                user_data = self.user_cache.get(doc_id)
+                if user_data is not None:
+                    found[doc_id] = user_data
+
+        coll = self.__db.collection(collection)
+        missing = [doc_id for doc_id in dict.fromkeys(doc_ids) if doc_id not in found]
+        size = FirestoreUtil.Constants.max_get_all_docs
+        chunks = [missing[i:i + size] for i in range(0, len(missing), size)]
+
+        async def fetch_chunk(chunk: list[str]) -> list[tuple[str, dict[str, object] | None]]:
+            snapshots = self.__db.get_all([coll.document(doc_id) for doc_id in chunk], field_paths=fields)
+            return [(snapshot.id, snapshot.to_dict() if snapshot.exists else None) async for snapshot in snapshots]
+
+        for results in await gather_bounded((fetch_chunk(chunk) for chunk in chunks), max_concurrency):
+            found.update(results)
+        if use_cache:
+            self.__cache_users([(doc_id, data) for doc_id, data in found.items() if data is not None])
+        return [found.get(doc_id) for doc_id in doc_ids]
+
+    async def fetch_users(self, uids: list[str], fields: list[str] | None = None) -> list[dict[str, object] | None]:
+        return await self.fetch_many("users", uids, fields)
+
+    async def fetch_many_by_field(self, collection: str, field: str, values: list[object], fields: list[str] | None = None, max_concurrency: int = 100) -> list[list[dict[str, object]]]:
+        """Fetch documents whose `field` matches any of `values`, using concurrent `in` queries
+
+        Args:
+            collection (str): Collection path ( must be in odd values)
+            field (str): Field path to be matched
+            values (list[object]): Values to be matched
+            fields (list[str] | None, optional): Field paths to be returned; `field` is always included. Defaults to None.
+            max_concurrency (int, optional): Number of queries in flight. Defaults to 100.
+
+        Returns:
+            list[list[dict]]: Matching documents aligned with `values`
+        """
+        coll = self.__db.collection(collection)
+        unique = list(dict.fromkeys(values))
+        size = FirestoreUtil.Constants.max_in_values
+        chunks = [unique[i:i + size] for i in range(0, len(unique), size)]
+        projection = list(dict.fromkeys([field, *fields])) if fields is not None else None
+
+        async def fetch_chunk(chunk: list[object]) -> list[dict[str, object]]:
+            query = coll.where(filter=FieldFilter(field, "in", chunk))
+            if projection is not None:
+                query = query.select(projection)
+            return [doc.to_dict() async for doc in query.stream()]
+
+        found: dict[object, list[dict[str, object]]] = {}
+        for results in await gather_bounded((fetch_chunk(chunk) for chunk in chunks), max_concurrency):
+            for data in results:
+                value = data
+                for part in field.split("."):
+                    value = value.get(part) if isinstance(value, dict) else None
+                found.setdefault(value, []).append(data)
+        return [found.get(value, []) for value in values]
+
+    async def fetch_email_by_username(self, username: str) -> str:
+        """Fetch Email from Database based on provided username
+
+        Args:
+            username (str): Username to be searched for
+
+        Raises:
+            MsgException: In case Username is not found
+
+        Returns:
+            email: Email found
+        """
+        cached = self.user_cache.get_by_username(username) if self.user_cache is not None else None
+        if cached is not None:
+            docs = [cached]
+        else:
+            query = self.__users.where(filter=FieldFilter("username", "==", username))
+            docs = await self.__lookup_users(query, ["email"])
+        email = None
+
+        for _, user_data in docs:
+            email = user_data["email"]
+
+        if(email == None):
+            raise MsgException(
+                "User not found!!",
+                "Given username doesn't match to any user. Please check and try again!!",
+                400
+            )
+        return email
+
+    async def fetch_user_data_by_user_id(self, user_id: int, org_id: int, send_ref_id: bool = False) -> dict[str, object] | str:
+        '''
+        Fetch user data by User ID and Organization ID; Use this to fetch UID from user ID as well.
+        '''
+        cached = self.user_cache.get_by_user_id(user_id, org_id) if self.user_cache is not None else None
+        if cached is not None:
+            docs = [cached]
+        else:
+            query = self.__users.where(filter=FieldFilter("user_id", "==", user_id)).where(filter=FieldFilter("organization", "==", org_id))
+            docs = await self.__lookup_users(query)
+        user_data = None
+        doc_id = None
+
+        if len(docs) > 0:
+            doc_id, user_data = docs[-1]
+
+        return doc_id if send_ref_id else user_data
+
+    async def insert_data(self, collection: str, doc_id: str | None, data: dict[str, object]) -> bool:
+        '''
+        To insert data to Firebase; see `FirestoreUtil.insert_data`.
+        '''
+        coll = self.__db.collection(collection)
+        if doc_id is not None:
+            doc_ref = coll.document(doc_id)
+        else:
+            doc_ref = coll.document()
+
+        await doc_ref.set(data, merge=True)
+        if collection == "users":
+            self.__invalidate_users([doc_ref.id])
+        return True
+
+    async def insert_many(self, collection: str, items: Iterable[tuple[str | None, dict[str, object]]], max_concurrency: int = 100) -> list[bool | BaseException]:
+        '''
+        Insert documents as individual concurrent writes. Results are aligned with `items`;
+        a failed write gives back its exception instead of cancelling the others.
+        '''
+        async def insert(doc_id: str | None, data: dict[str, object]) -> bool | BaseException:
+            try:
+                return await self.insert_data(collection, doc_id, data)
+            except Exception as e:
+                return e
+
+        return await gather_bounded((insert(doc_id, data) for doc_id, data in items), max_concurrency)
+
+    async def batch_insert_data(self, collection: str, doc_ids: list[str] | None, data: list[dict[str, object]]) -> BulkWriteReport:
+        records = zip(doc_ids, data) if doc_ids is not None else ((None, record) for record in data)
+        return await self.bulk_insert_data(collection, records)
+
+    async def bulk_insert_data(
+            self,
+            collection: str,
+            records: Iterable | AsyncIterable,
+            chunk_size: int = 500,
+            max_concurrency: int = 50,
+            max_retries: int = 5,
+        ) -> BulkWriteReport:
+        '''
+        Insert documents from a sync or async iterable in batches committed concurrently;
+        see `FirestoreUtil.bulk_insert_data`. At most `max_concurrency` batches are in flight.
+        '''
+        chunk_size = max(1, min(chunk_size, FirestoreUtil.Constants.max_batch_writes))
+        coll = self.__db.collection(collection)
+        report = BulkWriteReport(collection)
+        semaphore = asyncio.Semaphore(max_concurrency)
+        tasks: set[asyncio.Task] = set()
+        start = time.perf_counter()
+
+        async def commit(chunk_no: int, chunk: list[tuple[AsyncDocumentReference, dict[str, object]]]):
+            try:
+                report.retries += await self.__commit_chunk(chunk, max_retries)
+                report.written += len(chunk)
+            except Exception as e:
+                report.failures.append({ "chunk": chunk_no, "doc_ids": [ref.id for ref, _ in chunk], "error": repr(e) })
+            finally:
+                if collection == "users":
+                    self.__invalidate_users([ref.id for ref, _ in chunk])
+                semaphore.release()
+
+        async def submit(chunk):
+            ## Backpressure: don't read further records while too many chunks are pending
+            await semaphore.acquire()
+            task = asyncio.create_task(commit(report.chunks, chunk))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            report.chunks += 1
+
+        chunk = []
+        async for record in self.__iterate(records):
+            doc_id, data = record if isinstance(record, tuple) else (None, record)
+            chunk.append((coll.document(doc_id) if doc_id is not None else coll.document(), data))
+            if len(chunk) >= chunk_size:
+                await submit(chunk)
+                chunk = []
+        if chunk:
+            await submit(chunk)
+        await asyncio.gather(*list(tasks))
+
+        report.elapsed = time.perf_counter() - start
+        return report
+
+    async def __iterate(self, records: Iterable | AsyncIterable):
+        if hasattr(records, "__aiter__"):
+            async for record in records:
+                yield record
+        else:
+            for record in records:
+                yield record
+
+    async def __commit_chunk(self, chunk: list[tuple[AsyncDocumentReference, dict[str, object]]], max_retries: int) -> int:
+        for attempt in range(max_retries + 1):
+            batch_ref = self.__db.batch()
+            for doc_ref, data in chunk:
+                batch_ref.set(doc_ref, data, merge=True)
+            try:
+                await batch_ref.commit()
+                return attempt
+            except FirestoreUtil.Constants.retryable_errors:
+                if attempt == max_retries:
+                    raise
+                backoff = min(FirestoreUtil.Constants.max_backoff, FirestoreUtil.Constants.base_backoff * 2 ** attempt)
+                await asyncio.sleep(random.uniform(0, backoff))
+
+    async def __lookup_users(self, query, fields: list[str] | None = None) -> list[tuple[str, dict[str, object]]]:
+        '''
+        Run a query on `users`; without a user cache only `fields` are fetched, with one whole profiles are fetched and cached.
+        '''
+        if self.user_cache is None and fields is not None:
+            query = query.select(fields)
+        docs = [(doc.id, doc.to_dict()) async for doc in query.stream()]
+        self.__cache_users(docs)
+        return docs
+
+    def __cache_users(self, docs: list[tuple[str, dict[str, object]]]):
+        if self.user_cache is not None:
+            for uid, user_data in docs:
+                self.user_cache.put(uid, user_data)
+
+    def __invalidate_users(self, uids: list[str]):
+        if self.user_cache is not None:
+            for uid in uids:
+                self.user_cache.invalidate(uid)
@@ -1,11 +1,26 @@
 from firebase_admin import firestore
 
+from google.api_core import exceptions as api_exceptions
 from google.cloud.firestore_v1.base_query import FieldFilter
 from google.cloud.firestore_v1.document import DocumentReference
 from google.cloud.firestore_v1.base_document import DocumentSnapshot
+from google.cloud.firestore_v1.field_path import FieldPath
 from google.cloud.firestore import Client
 
 from ...exception import MsgException
+from ...instrumentation import instrumentation
+
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Iterable, Iterator
+import copy
+import json
+import os
+import random
+import threading
+import time
+
+_END = object() # End of the records in `bulk_insert_data`; a None record is written (and fails) like any other
 
 class FirestoreInstance:
     __instance: Client = None
@@ -15,17 +30,202 @@ class FirestoreInstance:
             cls.__instance = firestore.client()
         return cls.__instance
 
+class BulkWriteReport:
+    '''
+    Outcome of a bulk write. Truthy only if every chunk was committed.
+    '''
+    def __init__(self, collection: str):
+        self.collection = collection
+        self.written = 0
+        self.chunks = 0
+        self.retries = 0
+        self.failures: list[dict[str, object]] = []
+        self.elapsed = 0.0
+
+    @property
+    def failed(self) -> int:
+        return sum(len(failure["doc_ids"]) for failure in self.failures)
+
+    @property
+    def docs_per_second(self) -> float:
+        return self.written / self.elapsed if self.elapsed else 0.0
+
+    def __bool__(self):
+        return not self.failures
+
+    def __repr__(self):
+        return (f"BulkWriteReport(collection={self.collection!r}, written={self.written}, failed={self.failed}, "
+                f"chunks={self.chunks}, retries={self.retries}, docs_per_second={self.docs_per_second:.1f})")
+
+class ScanCheckpoint:
+    '''
+    Position of a paginated scan: the scan it belongs to, the ID of the last
+    document handled and how many were handled. Saved after every page, so an
+    interrupted scan resumes after the last completed page. Written atomically
+    (temporary file + `os.replace`), so a crash never leaves a torn checkpoint.
+    '''
+    def __init__(self, path: str | None = None):
+        self.path = path
+        self.scan: dict[str, object] | None = None
+        self.last_id: str | None = None
+        self.count = 0
+        self.done = False
+        self.extra: dict[str, object] = {} # Caller state saved along, e.g. an output file offset
+        if path is not None and os.path.exists(path):
+            with open(path) as file:
+                state = json.load(file)
+            self.scan = state["scan"]
+            self.last_id = state["last_id"]
+            self.count = state["count"]
+            self.done = state["done"]
+            self.extra = state.get("extra", {})
+
+    def save(self) -> None:
+        if self.path is None:
+            return
+        state = { "scan": self.scan, "last_id": self.last_id, "count": self.count, "done": self.done, "extra": self.extra }
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as file:
+            json.dump(state, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, self.path)
+
+    def remove(self) -> None:
+        if self.path is not None and os.path.exists(self.path):
+            os.remove(self.path)
+
+    def __repr__(self):
+        return f"ScanCheckpoint(path={self.path!r}, last_id={self.last_id!r}, count={self.count}, done={self.done})"
+
+class UserCache:
+    '''
+    TTL and size-bounded LRU cache of `users` documents.
+
+    Documents are stored by UID with secondary indexes (email -> UID,
+    username -> email, (user_id, organization) -> UID), so a user fetched by
+    any lookup answers all the others until it expires or is invalidated.
+    '''
+    def __init__(self, ttl: float = 300.0, max_entries: int = 10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.__entries: OrderedDict[str, tuple[float, dict[str, object]]] = OrderedDict()
+        self.__by_email: dict[str, str] = {}
+        self.__by_username: dict[str, str] = {}
+        self.__by_user_id: dict[tuple[object, object], str] = {}
+        self.__lock = threading.Lock()
+
+    def get(self, uid: str) -> dict[str, object] | None:
+        with self.__lock:
+            return self.__lookup(uid)
+
+    def get_by_email(self, email: str) -> tuple[str, dict[str, object]] | None:
+        with self.__lock:
+            return self.__lookup_index(self.__by_email.get(email))
+
+    def get_by_username(self, username: str) -> tuple[str, dict[str, object]] | None:
+        with self.__lock:
+            return self.__lookup_index(self.__by_email.get(self.__by_username.get(username)))
+
+    def get_by_user_id(self, user_id: int, org_id: int) -> tuple[str, dict[str, object]] | None:
+        with self.__lock:
+            return self.__lookup_index(self.__by_user_id.get((user_id, org_id)))
+
+    def put(self, uid: str, data: dict[str, object]) -> None:
+        with self.__lock:
+            self.__remove(uid)
+            self.__entries[uid] = (time.monotonic() + self.ttl, copy.deepcopy(data))
+            if data.get("email") is not None:
+                self.__by_email[data["email"]] = uid
+                if data.get("username") is not None:
+                    self.__by_username[data["username"]] = data["email"]
+            if data.get("user_id") is not None:
+                self.__by_user_id[(data["user_id"], data.get("organization"))] = uid
+            while len(self.__entries) > self.max_entries:
+                self.__remove(next(iter(self.__entries)))
+
+    def invalidate(self, uid: str) -> None:
+        with self.__lock:
+            self.__remove(uid)
+
+    def clear(self) -> None:
+        with self.__lock:
+            self.__entries.clear()
+            self.__by_email.clear()
+            self.__by_username.clear()
+            self.__by_user_id.clear()
+
+    def stats(self) -> dict[str, object]:
+        with self.__lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self.__entries),
+            }
+
+    def __lookup(self, uid: str | None) -> dict[str, object] | None:
+        entry = self.__entries.get(uid) if uid is not None else None
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                self.__remove(uid)
+            self.misses += 1
+            return None
+        self.__entries.move_to_end(uid)
+        self.hits += 1
+        return copy.deepcopy(entry[1])
+
+    def __lookup_index(self, uid: str | None) -> tuple[str, dict[str, object]] | None:
+        data = self.__lookup(uid)
+        return (uid, data) if data is not None else None
+
+    def __remove(self, uid: str):
+        entry = self.__entries.pop(uid, None)
+        if entry is None:
+            return
+        data = entry[1]
+        email = data.get("email")
+        if self.__by_email.get(email) == uid:
+            del self.__by_email[email]
+            if self.__by_username.get(data.get("username")) == email:
+                del self.__by_username[data["username"]]
+        key = (data.get("user_id"), data.get("organization"))
+        if self.__by_user_id.get(key) == uid:
+            del self.__by_user_id[key]
+
+@instrumentation.instrument("firestore")
 class FirestoreUtil:
     '''
     Util class for Firestore Access
+
+    Lookups on `users` go through `FirestoreUtil.user_cache` once it is enabled
+    with `enable_user_cache`; writes to `users` made through this class invalidate it.
     '''
-    def __init__(self):
-        self.__db = FirestoreInstance()
+    user_cache: UserCache | None = None # Shared by every instance
+
+    def __init__(self, db: Client | None = None):
+        self.__db = db if db is not None else FirestoreInstance()
         self.__users = self.__db.collection("users")
+
+    @classmethod
+    def enable_user_cache(cls, ttl: float = 300.0, max_entries: int = 10000) -> UserCache:
+        cls.user_cache = UserCache(ttl, max_entries)
+        return cls.user_cache
+
+    @classmethod
+    def disable_user_cache(cls) -> None:
+        cls.user_cache = None
     
     def validate_user_role(self, email: str, role: str) -> str:
-        query = self.__users.where(filter=FieldFilter("email", "==", email))
-        docs = query.get()
+        cached = self.user_cache.get_by_email(email) if self.user_cache is not None else None
+        if cached is not None:
+            docs = [cached]
+        else:
+            query = self.__users.where(filter=FieldFilter("email", "==", email))
+            docs = self.__lookup_users(query, ["role"])
         if len(docs) == 0:
             raise MsgException(
                 "Invalid User!!",
@@ -33,8 +233,7 @@ class FirestoreUtil:
                 400
             )
         user_role = None
-        for doc in docs:
-            user_data = doc.to_dict()
+        for _, user_data in docs:
             user_role = user_data.get("role", None)
         if(user_role != role):
             raise MsgException(
@@ -54,7 +253,13 @@ class FirestoreUtil:
         Returns:
             DocumentSnapshot | dict: Doc reference | Data retrieved from Firestore
         """
+        if not send_ref and self.user_cache is not None:
+            user_data = self.user_cache.get(uid)
+            if user_data is not None:
+                return user_data
         ref: DocumentSnapshot = self.__users.document(uid).get()
+        if ref.exists:
+            self.__cache_users([(ref.id, ref.to_dict())])
         return ref if send_ref else ref.to_dict()
     
     def fetch_data(self, doc_id: str, collection: str, send_ref: bool = False) -> DocumentReference | dict:
@@ -70,6 +275,83 @@ class FirestoreUtil:
         """
         ref: DocumentReference = self.__db.collection(collection).document(doc_id)
         return ref if send_ref else ref.get().to_dict()
+
+    def fetch_many(self, collection: str, doc_ids: list[str], fields: list[str] | None = None, max_workers: int = 8) -> list[dict[str, object] | None]:
+        """Fetch many documents by ID using batched `get_all` calls run in parallel
+
+        Args:
+            collection (str): Collection path ( must be in odd values)
+            doc_ids (list[str]): Document IDs to be fetched
+            fields (list[str] | None, optional): Field paths to be returned; Defaults to None (whole documents).
+            max_workers (int, optional): Number of `get_all` calls in flight. Defaults to 8.
+
+        Returns:
+            list[dict | None]: Data aligned with `doc_ids`; None for documents not found
+        """
+        found: dict[str, dict[str, object] | None] = {}
+        use_cache = collection == "users" and fields is None and self.user_cache is not None
+        if use_cache:
+            for doc_id in doc_ids:
+                user_data = self.user_cache.get(doc_id)
+                if user_data is not None:
+                    found[doc_id] = user_data
+
+        coll = self.__db.collection(collection)
+        missing = [doc_id for doc_id in dict.fromkeys(doc_ids) if doc_id not in found]
+        size = self.Constants.max_get_all_docs
+        chunks = [missing[i:i + size] for i in range(0, len(missing), size)]
+
+        def fetch_chunk(chunk: list[str]) -> list[tuple[str, dict[str, object] | None]]:
+            snapshots = self.__db.get_all([coll.document(doc_id) for doc_id in chunk], field_paths=fields)
+            return [(snapshot.id, snapshot.to_dict() if snapshot.exists else None) for snapshot in snapshots]
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for results in executor.map(instrumentation.wrap(fetch_chunk), chunks):
+                found.update(results)
+        if use_cache:
+            self.__cache_users([(doc_id, data) for doc_id, data in found.items() if data is not None])
+        return [found.get(doc_id) for doc_id in doc_ids]
+
+    def fetch_users(self, uids: list[str], fields: list[str] | None = None) -> list[dict[str, object] | None]:
+        '''
+        Fetch many users by UID (e.g. the `patients` of a doctor); see `fetch_many`.
+        '''
+        return self.fetch_many("users", uids, fields)
+
+    def fetch_many_by_field(self, collection: str, field: str, values: list[object], fields: list[str] | None = None, max_workers: int = 8) -> list[list[dict[str, object]]]:
+        """Fetch documents whose `field` matches any of `values`, using `in` queries run in parallel
+
+        Args:
+            collection (str): Collection path ( must be in odd values)
+            field (str): Field path to be matched
+            values (list[object]): Values to be matched; split into chunks of Firestore's `in` limit
+            fields (list[str] | None, optional): Field paths to be returned; `field` is always included. Defaults to None (whole documents).
+            max_workers (int, optional): Number of queries in flight. Defaults to 8.
+
+        Returns:
+            list[list[dict]]: Matching documents aligned with `values`
+        """
+        coll = self.__db.collection(collection)
+        unique = list(dict.fromkeys(values))
+        size = self.Constants.max_in_values
+        chunks = [unique[i:i + size] for i in range(0, len(unique), size)]
+        projection = list(dict.fromkeys([field, *fields])) if fields is not None else None
+
+        def fetch_chunk(chunk: list[object]) -> list[dict[str, object]]:
+            query = coll.where(filter=FieldFilter(field, "in", chunk))
+            if projection is not None:
+                query = query.select(projection)
+            return [doc.to_dict() for doc in query.stream()]
+
+        found: dict[object, list[dict[str, object]]] = {}
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for results in executor.map(instrumentation.wrap(fetch_chunk), chunks):
+                for data in results:
+                    value = data
+                    for part in field.split("."):
+                        value = value.get(part) if isinstance(value, dict) else None
+                    found.setdefault(value, []).append(data)
+        return [found.get(value, []) for value in values]
     
     def fetch_email_by_username(self, username: str) -> str:
         """Fetch Email from Database based on provided username
@@ -83,12 +365,15 @@ class FirestoreUtil:
         Returns:
             email: Email found
         """
-        query = self.__users.where(filter=FieldFilter("username", "==", username))
-        docs = query.get()
+        cached = self.user_cache.get_by_username(username) if self.user_cache is not None else None
+        if cached is not None:
+            docs = [cached]
+        else:
+            query = self.__users.where(filter=FieldFilter("username", "==", username))
+            docs = self.__lookup_users(query, ["email"])
         email = None
         
-        for doc in docs:
-            user_data = doc.to_dict()
+        for _, user_data in docs:
             email = user_data["email"]
         
         if(email == None):
@@ -103,17 +388,132 @@ class FirestoreUtil:
         '''
         Fetch user data by User ID and Organization ID; Use this to fetch UID from user ID as well. 
         '''
-        query = self.__users.where(filter=FieldFilter("user_id", "==", user_id)).where(filter=FieldFilter("organization", "==", org_id))
-        docs = query.get()
+        cached = self.user_cache.get_by_user_id(user_id, org_id) if self.user_cache is not None else None
+        if cached is not None:
+            docs = [cached]
+        else:
+            query = self.__users.where(filter=FieldFilter("user_id", "==", user_id)).where(filter=FieldFilter("organization", "==", org_id))
+            docs = self.__lookup_users(query)
         user_data = None
         doc_id = None
         
-        for doc in docs:
-            user_data = doc.to_dict()
-            doc_id = doc.id
+        if len(docs) > 0:
+            doc_id, user_data = docs[-1]
         
         return doc_id if send_ref_id else user_data
 
+    def scan_pages(
+        self,
+        collection: str,
+        fields: list[str] | None = None,
+        filters: list[FieldFilter] | None = None,
+        page_size: int = 500,
+        checkpoint: ScanCheckpoint | None = None,
+    ) -> Iterator[list[DocumentSnapshot]]:
+        """Scan a collection page by page in document ID order, in fixed memory
+
+        Every page is one `limit(page_size)` query streamed with `stream()` and
+        continued with `start_after` on the last snapshot of the previous page.
+
+        Args:
+            collection (str): Collection path ( must be in odd values)
+            fields (list[str] | None, optional): Field paths to be returned; Defaults to None (whole documents).
+            filters (list[FieldFilter] | None, optional): Equality filters to be applied. Defaults to None.
+            page_size (int, optional): Documents per query. Defaults to 500.
+            checkpoint (ScanCheckpoint | None, optional): Resume from and record progress in this checkpoint; it is saved once the caller is done with a page. Defaults to None.
+
+        Returns:
+            Iterator[list[DocumentSnapshot]]: Non-empty pages of snapshots
+        """
+        query = self.__db.collection(collection)
+        for field_filter in filters or []:
+            query = query.where(filter=field_filter)
+        if fields is not None:
+            query = query.select(fields)
+        query = query.order_by(FieldPath.document_id())
+
+        cursor = None
+        if checkpoint is not None:
+            scan = {
+                "collection": collection,
+                "fields": fields,
+                "filters": [[f.field_path, f.op_string, repr(f.value)] for f in filters or []],
+            }
+            if checkpoint.scan is None:
+                checkpoint.scan = scan
+            elif checkpoint.scan != scan:
+                raise Exception("Checkpoint belongs to another scan!! Please check once again!!")
+            if checkpoint.done:
+                return
+            if checkpoint.last_id is not None:
+                cursor = { FieldPath.document_id(): checkpoint.last_id }
+
+        while True:
+            page_query = query.limit(page_size)
+            if cursor is not None:
+                page_query = page_query.start_after(cursor)
+            page = list(page_query.stream())
+            if page:
+                yield page
+            ## Only reached once the caller asks for the next page, i.e. is done with this one
+            if checkpoint is not None:
+                checkpoint.last_id = page[-1].id if page else checkpoint.last_id
+                checkpoint.count += len(page)
+                checkpoint.done = len(page) < page_size
+                checkpoint.save()
+            if len(page) < page_size:
+                return
+            cursor = page[-1]
+
+    def scan(self, collection: str, fields: list[str] | None = None, filters: list[FieldFilter] | None = None, page_size: int = 500, checkpoint: ScanCheckpoint | None = None) -> Iterator[tuple[str, dict[str, object]]]:
+        '''
+        Documents of a collection as (doc_id, data), one page in memory at a time; see `scan_pages`.
+        '''
+        for page in self.scan_pages(collection, fields, filters, page_size, checkpoint):
+            for snapshot in page:
+                yield snapshot.id, snapshot.to_dict()
+
+    def export_collection(
+        self,
+        collection: str,
+        path: str,
+        fields: list[str] | None = None,
+        filters: list[FieldFilter] | None = None,
+        page_size: int = 500,
+        checkpoint_path: str | None = None,
+    ) -> int:
+        """Export a collection to a JSON Lines file (`{"id": ..., "data": ...}` per line); resumable
+
+        The file is synced and the checkpoint saved after every page. On resume
+        the file is cut back to the size recorded in the checkpoint, so a page
+        written before the interruption but not checkpointed isn't duplicated.
+        The checkpoint is removed once the export is complete.
+
+        Args:
+            collection (str): Collection path ( must be in odd values)
+            path (str): Output file
+            fields (list[str] | None, optional): Field paths to be exported; Defaults to None (whole documents).
+            filters (list[FieldFilter] | None, optional): Equality filters to be applied. Defaults to None.
+            page_size (int, optional): Documents per query. Defaults to 500.
+            checkpoint_path (str | None, optional): Defaults to `<path>.checkpoint`.
+
+        Returns:
+            int: Number of documents in the file
+        """
+        checkpoint = ScanCheckpoint(checkpoint_path if checkpoint_path is not None else path + ".checkpoint")
+        offset = checkpoint.extra.get("offset", 0)
+        with open(path, "r+b" if offset and os.path.exists(path) else "wb") as file:
+            file.truncate(offset)
+            file.seek(offset)
+            for page in self.scan_pages(collection, fields, filters, page_size, checkpoint):
+                lines = [json.dumps({ "id": snapshot.id, "data": snapshot.to_dict() }, default=str) for snapshot in page]
+                file.write(("\n".join(lines) + "\n").encode("utf-8"))
+                file.flush()
+                os.fsync(file.fileno())
+                checkpoint.extra["offset"] = file.tell()
+        checkpoint.remove()
+        return checkpoint.count
+
     def insert_data(self, collection: str, doc_id: str | None, data: dict[str, object]) -> bool:
         '''
         To insert data to Firebase.
@@ -134,22 +534,139 @@ class FirestoreUtil:
             doc_ref = coll.document()
         
         doc_ref.set(data, merge=True)
+        if collection == "users":
+            self.__invalidate_users([doc_ref.id])
         return True
     
-    def batch_insert_data(self, collection: str, doc_ids: list[str] | None, data: list[dict[str, object]]) -> bool:
-        batch_ref = self.__db.batch()
+    def batch_insert_data(self, collection: str, doc_ids: list[str] | None, data: list[dict[str, object]]) -> BulkWriteReport:
+        '''
+        Insert many documents at once; see `bulk_insert_data`. `doc_ids` must be aligned with `data`, or None for generated IDs.
+        '''
+        records = zip(doc_ids, data) if doc_ids is not None else ((None, record) for record in data)
+        return self.bulk_insert_data(collection, records)
+
+    def bulk_insert_data(
+            self,
+            collection: str,
+            records: Iterable[tuple[str | None, dict[str, object]] | dict[str, object]],
+            chunk_size: int = 500,
+            max_workers: int = 8,
+            max_retries: int = 5,
+        ) -> BulkWriteReport:
+        '''
+        Insert documents from any iterable (generators included) in batches committed concurrently.
+
+        Parameters
+        ----------
+        collection : str
+            Collection path to which the data will be added.
+        records : Iterable[tuple[str | None, dict] | dict]
+            `(doc_id, data)` pairs, or plain data dicts for generated IDs. Consumed lazily;
+            at most `2 * max_workers` chunks are held in memory.
+        chunk_size : int
+            Writes per batch; capped at Firestore's limit of 500.
+        max_workers : int
+            Number of batches committed in parallel.
+        max_retries : int
+            Retries of a batch failing with a transient error, with jittered exponential backoff.
+
+        Returns
+        -------
+        BulkWriteReport
+            Written count, failed chunks with their document IDs and errors, and throughput.
+        '''
+        chunk_size = max(1, min(chunk_size, self.Constants.max_batch_writes))
         coll = self.__db.collection(collection)
+        report = BulkWriteReport(collection)
+        start = time.perf_counter()
 
-        length = len(data)
+        def collect(future, chunk_no, doc_refs):
+            if collection == "users":
+                self.__invalidate_users([ref.id for ref in doc_refs])
+            try:
+                report.retries += future.result()
+                report.written += len(doc_refs)
+            except Exception as e:
+                report.failures.append({ "chunk": chunk_no, "doc_ids": [ref.id for ref in doc_refs], "error": repr(e) })
 
-        for i in range(length):
-            doc_id = doc_ids[i] if doc_ids is not None else None
-            if doc_id is not None:
-                doc_ref = coll.document(doc_id)
-            else:
-                doc_ref = coll.document()
-            
-            batch_ref.set(doc_ref, data[i], merge=True)
-        batch_ref.commit()
+        ## Chunks are committed under the caller's request and span
+        commit_chunk = instrumentation.wrap(self.__commit_chunk)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            in_flight = {}
+            chunk = []
+            records = iter(records)
+            while True:
+                record = next(records, _END)
+                if record is not _END:
+                    doc_id, data = record if isinstance(record, tuple) else (None, record)
+                    chunk.append((coll.document(doc_id) if doc_id is not None else coll.document(), data))
+                    if len(chunk) < chunk_size:
+                        continue
+                if chunk:
+                    ## Backpressure: don't read further records while too many chunks are pending
+                    while len(in_flight) >= 2 * max_workers:
+                        done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            collect(future, *in_flight.pop(future))
+                    future = executor.submit(commit_chunk, chunk, max_retries)
+                    in_flight[future] = (report.chunks, [doc_ref for doc_ref, _ in chunk])
+                    report.chunks += 1
+                    chunk = []
+                if record is _END:
+                    break
+            for future in list(in_flight):
+                collect(future, *in_flight.pop(future))
 
-        return True
+        report.elapsed = time.perf_counter() - start
+        return report
+
+    def __lookup_users(self, query, fields: list[str] | None = None) -> list[tuple[str, dict[str, object]]]:
+        '''
+        Run a query on `users`; without a user cache only `fields` are fetched, with one whole profiles are fetched and cached.
+        '''
+        if self.user_cache is None and fields is not None:
+            query = query.select(fields)
+        docs = [(doc.id, doc.to_dict()) for doc in query.stream()]
+        self.__cache_users(docs)
+        return docs
+
+    def __cache_users(self, docs: list[tuple[str, dict[str, object]]]):
+        if self.user_cache is not None:
+            for uid, user_data in docs:
+                self.user_cache.put(uid, user_data)
+
+    def __invalidate_users(self, uids: list[str]):
+        if self.user_cache is not None:
+            for uid in uids:
+                self.user_cache.invalidate(uid)
+
+    def __commit_chunk(self, chunk: list[tuple[DocumentReference, dict[str, object]]], max_retries: int) -> int:
+        '''
+        Commit one batch, retrying transient errors. Returns the number of retries needed.
+        '''
+        for attempt in range(max_retries + 1):
+            batch_ref = self.__db.batch()
+            for doc_ref, data in chunk:
+                batch_ref.set(doc_ref, data, merge=True)
+            try:
+                batch_ref.commit()
+                return attempt
+            except self.Constants.retryable_errors:
+                if attempt == max_retries:
+                    raise
+                backoff = min(self.Constants.max_backoff, self.Constants.base_backoff * 2 ** attempt)
+                time.sleep(random.uniform(0, backoff))
+
+    class Constants:
+        max_batch_writes = 500 # Firestore limit of writes per commit
+        max_in_values = 30 # Firestore limit of values in an `in` filter
+        max_get_all_docs = 100 # Documents requested per `get_all` call
+        base_backoff = 0.1 # seconds
+        max_backoff = 10.0 # seconds
+        retryable_errors = (
+            api_exceptions.Aborted,
+            api_exceptions.DeadlineExceeded,
+            api_exceptions.InternalServerError,
+            api_exceptions.ResourceExhausted,
+            api_exceptions.ServiceUnavailable,
+        )
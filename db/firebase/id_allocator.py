@@ -0,0 +1,178 @@
+from firebase_admin import firestore
+
+from google.cloud.firestore_v1 import Increment
+from google.cloud.firestore_v1.field_path import FieldPath
+from google.cloud.firestore import Client
+
+from .firestore import FirestoreInstance
+from ...exception import MsgException
+
+import bisect
+import random
+import threading
+
+class IdAllocator:
+    '''
+    Allocates per-organization, per-role user IDs without a hot document.
+
+    Every process leases a block of `block_size` IDs at a time by advancing
+    `organizations/{org_id}.user_ids.{role}` inside a transaction, then hands
+    them out from memory. IDs are unique across processes, returned in increasing
+    order by each call, and may leave gaps when a process exits with part of a
+    block unused.
+
+    Sign-ups count active users in `counter_shards` counter documents under
+    `organizations/{org_id}/counters`, so they don't contend on the organization
+    document either. Every lease adds what the shards counted since into the
+    `active_users` field of the organization document, in the same transaction,
+    so the field keeps growing for its readers, behind by the sign-ups since the
+    last lease; `active_users()` is exact.
+    '''
+    __default = None
+    __default_guard = threading.Lock()
+
+    def __init__(self, db: Client | None = None, block_size: int = 50, counter_shards: int = 10):
+        self.__db = db if db is not None else FirestoreInstance()
+        self.block_size = block_size
+        self.counter_shards = counter_shards
+        self.__leases: dict[tuple[str, str], list[list[int]]] = {} # (org, role) -> leased [next, end) ranges, lowest first
+        self.__locks: dict[tuple[str, str], tuple[threading.Lock, threading.Lock]] = {} # (org, role) -> locks of its leases, of leasing
+        self.__lock = threading.Lock()
+
+    @classmethod
+    def default(cls) -> "IdAllocator":
+        '''
+        Allocator shared by the whole process, so leased blocks aren't wasted per request.
+        '''
+        with cls.__default_guard:
+            if cls.__default is None:
+                cls.__default = cls()
+            return cls.__default
+
+    def next_id(self, org_id: str, role: str) -> int:
+        return self.reserve(org_id, role, 1)[0]
+
+    def reserve(self, org_id: str, role: str, count: int) -> list[int]:
+        """Reserve `count` user IDs; served from the leased block, leasing more as needed
+
+        Args:
+            org_id (str): Organization ID
+            role (str): User role; IDs are sequenced per role
+            count (int): Number of IDs required
+
+        Raises:
+            MsgException: In case the organization has no ID sequence for the role
+
+        Returns:
+            list[int]: Reserved IDs in increasing order
+        """
+        key = (org_id, role)
+        with self.__lock:
+            lock, leasing = self.__locks.setdefault(key, (threading.Lock(), threading.Lock()))
+
+        ids = self.__take(key, lock, count)
+        if len(ids) < count:
+            ## One transaction at a time per sequence; threads served from the leased
+            ## ranges meanwhile only wait on `lock`
+            with leasing:
+                ids.extend(self.__take(key, lock, count - len(ids))) # Leased while waiting
+                if len(ids) < count:
+                    ## Lease what's still needed in one transaction, at least a whole block
+                    needed = count - len(ids)
+                    size = max(self.block_size, needed)
+                    start = self.__lease(org_id, role, size)
+                    ids.extend(range(start, start + needed))
+                    if needed < size:
+                        with lock:
+                            bisect.insort(self.__leases[key], [start + needed, start + size])
+        return sorted(ids)
+
+    def reserve_batch(self, org_id: str, counts: dict[str, int]) -> dict[str, list[int]]:
+        '''
+        Reserve IDs for several roles at once with a single transaction on the
+        organization document, bypassing the leased blocks. Meant for bulk imports.
+        '''
+        counts = { role: count for role, count in counts.items() if count > 0 }
+        if not counts:
+            return {}
+        starts = self.__lease_many(org_id, counts)
+        return { role: list(range(starts[role], starts[role] + count)) for role, count in counts.items() }
+
+    def add_active_users(self, org_id: str, count: int = 1) -> None:
+        shard = random.randrange(self.counter_shards)
+        self.__counters(org_id).document(f"active_users_{shard}").set({ "count": Increment(count) }, merge=True)
+
+    def active_users(self, org_id: str) -> int:
+        '''
+        Active user count: the `active_users` field plus what the counter shards counted since the last lease.
+        '''
+        org_data = self.__db.collection("organizations").document(org_id).get().to_dict() or {}
+        counted = org_data.get(self.Constants.counted_field, {})
+        total = org_data.get("active_users", 0)
+        for shard, count in self.__shard_counts(org_id).items():
+            total += max(0, count - counted.get(shard, 0))
+        return total
+
+    def __counters(self, org_id: str):
+        return self.__db.collection("organizations").document(org_id).collection("counters")
+
+    def __shard_counts(self, org_id: str) -> dict[str, int]:
+        return { doc.id: doc.to_dict().get("count", 0) for doc in self.__counters(org_id).stream() }
+
+    def __take(self, key: tuple[str, str], lock: threading.Lock, count: int) -> list[int]:
+        '''
+        Up to `count` IDs from the leased ranges of `key`.
+        '''
+        ids = []
+        with lock:
+            leases = self.__leases.setdefault(key, [])
+            while leases and len(ids) < count:
+                lease = leases[0]
+                take = min(count - len(ids), lease[1] - lease[0])
+                ids.extend(range(lease[0], lease[0] + take))
+                lease[0] += take
+                if lease[0] >= lease[1]:
+                    leases.pop(0)
+        return ids
+
+    def __lease(self, org_id: str, role: str, size: int) -> int:
+        return self.__lease_many(org_id, { role: size })[role]
+
+    def __lease_many(self, org_id: str, sizes: dict[str, int]) -> dict[str, int]:
+        '''
+        Advance the ID sequences of the given roles in one transaction, adding the new counts of the
+        active user shards to the organization document; returns the first ID of every range.
+        '''
+        org_ref = self.__db.collection("organizations").document(org_id)
+        ## Shards only grow and the organization document records how much of each it has added, so they
+        ## are read outside the transaction (sign-ups don't abort it) and a stale read never counts twice
+        shard_counts = self.__shard_counts(org_id)
+
+        @firestore.transactional
+        def advance(transaction, org_ref):
+            org_data = org_ref.get(transaction=transaction).to_dict() or {}
+            starts = {}
+            for role in sizes:
+                starts[role] = org_data.get("user_ids", {}).get(role)
+                if starts[role] is None:
+                    raise MsgException(
+                        "Invalid Role!!",
+                        f"Organization {org_id} has no user IDs for role {role}.",
+                        400
+                    )
+            update = { FieldPath("user_ids", role).to_api_repr(): starts[role] + size for role, size in sizes.items() }
+            counted = org_data.get(self.Constants.counted_field, {})
+            added = 0
+            for shard, count in shard_counts.items():
+                if count > counted.get(shard, 0):
+                    added += count - counted.get(shard, 0)
+                    update[FieldPath(self.Constants.counted_field, shard).to_api_repr()] = count
+            if added:
+                update["active_users"] = Increment(added)
+            transaction.update(org_ref, update)
+            return starts
+
+        return advance(self.__db.transaction(), org_ref)
+
+    class Constants:
+        counted_field = "active_users_counted" # Shard id -> shard count already added to `active_users`
@@ -1,13 +1,155 @@
 from firebase_admin import auth
 
 from .firestore import FirestoreUtil
+from .id_allocator import IdAllocator
 from ...exception import ExceptionUtil, MsgException
+from ...instrumentation import instrumentation
+
+from collections import OrderedDict
+from typing import Iterable
+import hashlib
+import threading
+import time
+
+class PathMatcher:
+    '''
+    Pre-compiled path rules: exact paths are matched with a set lookup and
+    prefixes with a single `str.startswith` call. Supports `path in matcher`,
+    and reads and grows like the list of exact paths it replaces
+    (iteration, `len`, `append`, `extend`, `remove`).
+    '''
+    def __init__(self, exact: Iterable[str] = (), prefixes: Iterable[str] = ()):
+        self.__paths = list(exact)
+        self.exact = set(self.__paths)
+        self.prefixes = tuple(sorted(set(prefixes), key=len, reverse=True))
+
+    def __contains__(self, path: str) -> bool:
+        return path in self.exact or path.startswith(self.prefixes)
+
+    def __iter__(self):
+        return iter(self.__paths)
+
+    def __len__(self) -> int:
+        return len(self.__paths)
+
+    def __repr__(self) -> str:
+        return f"PathMatcher({self.__paths!r}, prefixes={list(self.prefixes)!r})"
+
+    def append(self, path: str) -> None:
+        self.__paths.append(path)
+        self.exact.add(path)
+
+    def extend(self, paths: Iterable[str]) -> None:
+        for path in paths:
+            self.append(path)
+
+    def remove(self, path: str) -> None:
+        self.__paths.remove(path)
+        if path not in self.__paths:
+            self.exact.discard(path)
+
+class TokenCache:
+    '''
+    Bounded LRU cache of verified ID tokens, keyed by the SHA-256 digest of the token.
+
+    Entries expire at the token's `exp` claim. `revoke_token` drops a single token
+    and `revoke_uid` drops every token of a user and rejects tokens of that user
+    issued before the revocation, e.g. when wired to `auth.revoke_refresh_tokens`.
+    '''
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.__entries: OrderedDict[bytes, tuple[float, dict[str, object]]] = OrderedDict()
+        self.__by_uid: dict[str, set[bytes]] = {}
+        self.__revoked: dict[str, float] = {} # UID -> tokens issued before this time are revoked
+        self.__lock = threading.Lock()
+
+    def get(self, token: str) -> dict[str, object] | None:
+        key = self.__digest(token)
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is None or entry[0] <= time.time():
+                if entry is not None:
+                    self.__remove(key)
+                self.misses += 1
+                return None
+            self.__entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, token: str, decoded_token: dict[str, object]) -> None:
+        if self.is_revoked(decoded_token):
+            return
+        key = self.__digest(token)
+        with self.__lock:
+            self.__remove(key)
+            self.__entries[key] = (float(decoded_token["exp"]), decoded_token)
+            self.__by_uid.setdefault(decoded_token["uid"], set()).add(key)
+            while len(self.__entries) > self.max_entries:
+                self.__remove(next(iter(self.__entries)))
+
+    def is_revoked(self, decoded_token: dict[str, object]) -> bool:
+        revoked_at = self.__revoked.get(decoded_token["uid"])
+        return revoked_at is not None and decoded_token.get("iat", 0) < revoked_at
+
+    def revoke_token(self, token: str) -> None:
+        with self.__lock:
+            self.__remove(self.__digest(token))
+
+    def revoke_uid(self, uid: str, revoked_at: float | None = None) -> None:
+        with self.__lock:
+            self.__revoked[uid] = revoked_at if revoked_at is not None else time.time()
+            for key in list(self.__by_uid.get(uid, ())):
+                self.__remove(key)
+
+    def clear(self) -> None:
+        with self.__lock:
+            self.__entries.clear()
+            self.__by_uid.clear()
+
+    def stats(self) -> dict[str, object]:
+        with self.__lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self.__entries),
+            }
+
+    def __digest(self, token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def __remove(self, key: bytes):
+        entry = self.__entries.pop(key, None)
+        if entry is None:
+            return
+        keys = self.__by_uid.get(entry[1]["uid"])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self.__by_uid[entry[1]["uid"]]
 
 class FirebaseAuthentication: ## Inherit from DRF Authentication class if using DRF
-    def __init__(self):
+    ## Shared across instances, as frameworks like DRF create one per request
+    token_cache: TokenCache | None = TokenCache()
+    default_allowed_paths = ("/validate-user", "/login", "/test", "/register", "/task")
+
+    def __init__(self, allowed_paths: Iterable[str] | PathMatcher | None = None):
         super().__init__()
-        self.allowed_paths = ["/validate-user", "/login", "/test", "/register", "/task"]
+        self.allowed_paths = allowed_paths if allowed_paths is not None else self.default_allowed_paths
+
+    @property
+    def allowed_paths(self) -> PathMatcher:
+        return self.__allowed_paths
+
+    @allowed_paths.setter
+    def allowed_paths(self, paths: Iterable[str] | PathMatcher):
+        ## Lists are compiled on assignment; the matcher can still be appended to and iterated like one
+        self.__allowed_paths = paths if isinstance(paths, PathMatcher) else PathMatcher(paths)
 
+    @instrumentation.traced("auth.authenticate")
     def authenticate(self, request):
         """Firebase Authentication for Requests
 
@@ -37,9 +179,21 @@ class FirebaseAuthentication: ## Inherit from DRF Authentication class if using
             raise ExceptionUtil.unauthorized_exception("No Authentication provided")
         token = token[7:]
         
-        ## User Validation from Firebase
+        ## User Validation from cache, or else from Firebase
+        decoded_token = self.token_cache.get(token) if self.token_cache is not None else None
+        if self.token_cache is not None:
+            instrumentation.count("auth_token_cache", result="miss" if decoded_token is None else "hit")
+        if decoded_token is not None:
+            user["uid"] = decoded_token["uid"]
+            user["is_authenticated"] = True
+            return (user, None)
         try:
-            decoded_token = auth.verify_id_token(token) ## Only UID and Auth data is decoded from this.
+            with instrumentation.span("auth.verify_id_token"):
+                decoded_token = auth.verify_id_token(token) ## Only UID and Auth data is decoded from this.
+            if self.token_cache is not None:
+                if self.token_cache.is_revoked(decoded_token):
+                    raise ExceptionUtil.unauthorized_exception("Token Revoked")
+                self.token_cache.put(token, decoded_token)
             uid = decoded_token["uid"]
             user["uid"] = uid
             user["is_authenticated"] = True
@@ -53,8 +207,9 @@ class FirebaseAuthentication: ## Inherit from DRF Authentication class if using
             return ExceptionUtil.unauthorized_exception("Authentication Failed")
 
 class UserRegistration:
-    def __init__(self):
+    def __init__(self, id_allocator: IdAllocator | None = None):
         self.db_interface = FirestoreUtil()
+        self.id_allocator = id_allocator if id_allocator is not None else IdAllocator.default()
     
     def register_user(self, data: dict):
         try:
@@ -66,14 +221,9 @@ class UserRegistration:
             if(role != "patient"):
                 data["patients"] = []
 
-            ## User ID Creation
+            ## User ID Creation; leased in blocks, so concurrent sign-ups don't race on the org document
             print("Creating User ID...")
-            org_data_ref = self.db_interface.fetch_data(org_id, "organizations", send_ref=True)
-            org_data = org_data_ref.get().to_dict()
-            print("Org Data:", org_data)
-
-            user_id = org_data["user_ids"][role]
-            org_data["user_ids"][role] += 1
+            user_id = self.id_allocator.next_id(org_id, role)
             data["user_id"] = user_id
 
             ## User Creation
@@ -83,13 +233,12 @@ class UserRegistration:
                 password=password
             )
             uid = user.uid
-            org_data["active_users"] += 1
 
             ## DB Updates
             print("Adding Data...")
             del data["password"]
             self.db_interface.insert_data("users", uid, data)
-            org_data_ref.update(org_data)
+            self.id_allocator.add_active_users(org_id)
         except Exception as e:
             print("Something went wrong while creating user!!")
             print(e)
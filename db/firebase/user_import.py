@@ -0,0 +1,233 @@
+from firebase_admin import auth
+
+from .firestore import FirestoreUtil
+from .id_allocator import IdAllocator
+from ...exception import MsgException
+from ...instrumentation import instrumentation
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Iterator
+import csv
+import hashlib
+import json
+import os
+import time
+import uuid
+
+class BulkUserRegistration:
+    '''
+    Streaming bulk counterpart of `UserRegistration.register_user`.
+
+    Users are read from a CSV or JSONL file row by row and processed in batches
+    of up to 1000 (the `auth.import_users` limit): password hashes are computed
+    locally in parallel, Auth accounts are created with one `import_users` call,
+    user IDs of the whole batch are reserved with one transaction per
+    organization and profiles are written through `FirestoreUtil.bulk_insert_data`.
+    Only one batch is held in memory, whatever the size of the file.
+
+    `import_users` doesn't check emails the way `create_user` does, so rows whose
+    email appears earlier in the import or belongs to an existing profile fail
+    before any ID or account is made for them.
+    '''
+    REQUIRED_FIELDS = ("email", "password", "role")
+
+    def __init__(
+            self,
+            batch_size: int = 1000,
+            hash_rounds: int = 10000,
+            hash_workers: int = 8,
+            id_allocator: IdAllocator | None = None,
+            db_interface: FirestoreUtil | None = None,
+        ):
+        '''
+        Parameters
+        ----------
+        batch_size : int
+            Users per batch; capped at 1000.
+        hash_rounds : int
+            PBKDF2-SHA256 rounds of the imported password hashes; hashing takes ~0.65 ms per 1000 rounds per core.
+        hash_workers : int
+            Threads computing password hashes; `hashlib` releases the GIL while hashing.
+        '''
+        self.batch_size = max(1, min(batch_size, self.Constants.max_import_users))
+        self.hash_rounds = hash_rounds
+        self.hash_workers = hash_workers
+        self.id_allocator = id_allocator if id_allocator is not None else IdAllocator.default()
+        self.db_interface = db_interface if db_interface is not None else FirestoreUtil()
+
+    def import_file(self, path: str, report_path: str | None = None) -> dict[str, object]:
+        """Import every user of a CSV or JSONL file
+
+        Args:
+            path (str): Path of a `.csv` (with header) or `.jsonl` file
+            report_path (str | None, optional): CSV file to which the result of every row is written. Defaults to None.
+
+        Returns:
+            dict: Summary with created/failed counts, elapsed seconds and users per second
+        """
+        summary = { "created": 0, "failed": 0 }
+        start = time.perf_counter()
+        report_file = open(report_path, "w", newline="") if report_path is not None else None
+        try:
+            writer = None
+            if report_file is not None:
+                writer = csv.DictWriter(report_file, fieldnames=["row", "email", "status", "uid", "user_id", "error"])
+                writer.writeheader()
+            for result in self.import_rows(self.read_rows(path)):
+                summary[result["status"]] += 1
+                if writer is not None:
+                    writer.writerow(result)
+        finally:
+            if report_file is not None:
+                report_file.close()
+        summary["elapsed"] = time.perf_counter() - start
+        summary["users_per_second"] = (summary["created"] + summary["failed"]) / summary["elapsed"] if summary["elapsed"] else 0.0
+        return summary
+
+    def import_rows(self, rows: Iterable[dict[str, object]]) -> Iterator[dict[str, object]]:
+        '''
+        Import users from an iterable of row dicts; yields one result per row
+        (`row`, `email`, `status` of "created" | "failed", `uid`, `user_id`, `error`) as batches complete.
+        '''
+        batch = []
+        for row_no, row in enumerate(rows, 1):
+            batch.append((row_no, row))
+            if len(batch) >= self.batch_size:
+                yield from self.__import_batch(batch)
+                batch = []
+        if batch:
+            yield from self.__import_batch(batch)
+
+    @staticmethod
+    def read_rows(path: str) -> Iterator[dict[str, object]]:
+        if path.endswith(".jsonl"):
+            with open(path) as f:
+                for line in f:
+                    if line.strip():
+                        yield json.loads(line)
+        else:
+            with open(path, newline="") as f:
+                yield from csv.DictReader(f)
+
+    def __import_batch(self, batch: list[tuple[int, dict[str, object]]]) -> list[dict[str, object]]:
+        results = { row_no: { "row": row_no, "email": row.get("email"), "status": "failed", "uid": None, "user_id": None, "error": None } for row_no, row in batch }
+
+        ## Validation
+        valid = []
+        for row_no, row in batch:
+            missing = [field for field in self.REQUIRED_FIELDS if not row.get(field)]
+            if missing:
+                results[row_no]["error"] = f"Missing fields: {', '.join(missing)}"
+            else:
+                valid.append((row_no, dict(row)))
+        valid = self.__unique_emails(valid, results)
+
+        ## User IDs; one transaction per organization for the whole batch
+        by_org: dict[str, dict[str, list[tuple[int, dict]]]] = {}
+        for row_no, data in valid:
+            data["role"] = str(data["role"]).lower()
+            org_id = str(data.get("organization", "freeplan"))
+            by_org.setdefault(org_id, {}).setdefault(data["role"], []).append((row_no, data))
+        for org_id, roles in by_org.items():
+            try:
+                reserved = self.id_allocator.reserve_batch(org_id, { role: len(rows) for role, rows in roles.items() })
+            except (Exception, MsgException) as e:
+                for rows in roles.values():
+                    for row_no, _ in rows:
+                        results[row_no]["error"] = f"User ID reservation failed: {e}"
+                continue
+            for role, rows in roles.items():
+                for (row_no, data), user_id in zip(rows, reserved[role]):
+                    data["user_id"] = user_id
+                    results[row_no]["user_id"] = user_id
+        valid = [(row_no, data) for row_no, data in valid if "user_id" in data]
+        if not valid:
+            return [results[row_no] for row_no, _ in batch]
+
+        ## Auth accounts; one import_users call
+        records = self.__hash_passwords(valid)
+        try:
+            import_result = auth.import_users(records, hash_alg=auth.UserImportHash.pbkdf2_sha256(rounds=self.hash_rounds))
+            auth_errors = { error.index: error.reason for error in import_result.errors }
+        except Exception as e:
+            auth_errors = { i: f"Auth import failed: {e}" for i in range(len(records)) }
+
+        ## Profiles; batched Firestore commits
+        profiles = []
+        for i, ((row_no, data), record) in enumerate(zip(valid, records)):
+            if i in auth_errors:
+                results[row_no]["error"] = auth_errors[i]
+                continue
+            results[row_no]["uid"] = record.uid
+            del data["password"]
+            if data["role"] != "patient":
+                data["patients"] = []
+            profiles.append((row_no, record.uid, data))
+        report = self.db_interface.bulk_insert_data("users", ((uid, data) for _, uid, data in profiles))
+        failed_uids = { uid: failure["error"] for failure in report.failures for uid in failure["doc_ids"] }
+
+        created_per_org: dict[str, int] = {}
+        for row_no, uid, data in profiles:
+            if uid in failed_uids:
+                results[row_no]["error"] = f"Profile write failed: {failed_uids[uid]}"
+                continue
+            results[row_no]["status"] = "created"
+            org_id = str(data.get("organization", "freeplan"))
+            created_per_org[org_id] = created_per_org.get(org_id, 0) + 1
+        for org_id, count in created_per_org.items():
+            self.id_allocator.add_active_users(org_id, count)
+
+        return [results[row_no] for row_no, _ in batch]
+
+    def __unique_emails(self, rows: list[tuple[int, dict[str, object]]], results: dict[int, dict[str, object]]) -> list[tuple[int, dict[str, object]]]:
+        '''
+        Rows whose email is new, both to the batch and to the `users` profiles; the others are failed.
+        '''
+        seen = set()
+        unique = []
+        for row_no, data in rows:
+            email = str(data["email"]).strip().lower() # Auth compares emails case-insensitively
+            if email in seen:
+                results[row_no]["error"] = "Duplicate email in the import"
+            else:
+                seen.add(email)
+                unique.append((row_no, data))
+        if not unique:
+            return unique
+
+        try:
+            existing = self.db_interface.fetch_many_by_field("users", "email", [data["email"] for _, data in unique], fields=["email"])
+        except Exception as e:
+            for row_no, _ in unique:
+                results[row_no]["error"] = f"Email check failed: {e}"
+            return []
+        new = []
+        for (row_no, data), matches in zip(unique, existing):
+            if matches:
+                results[row_no]["error"] = "Email already registered"
+            else:
+                new.append((row_no, data))
+        return new
+
+    def __hash_passwords(self, rows: list[tuple[int, dict[str, object]]]) -> list[auth.ImportUserRecord]:
+        def record(data: dict[str, object]) -> auth.ImportUserRecord:
+            salt = os.urandom(16)
+            password_hash = hashlib.pbkdf2_hmac("sha256", str(data["password"]).encode(), salt, self.hash_rounds)
+            return auth.ImportUserRecord(
+                uid=uuid.uuid4().hex[:28],
+                email=data["email"],
+                password_hash=password_hash,
+                password_salt=salt,
+            )
+
+        ## One slice per thread; hashing dominates the import, so keep scheduling overhead out of it
+        slices = [rows[i::self.hash_workers] for i in range(self.hash_workers)]
+        with ThreadPoolExecutor(max_workers=self.hash_workers) as executor:
+            hashed = list(executor.map(instrumentation.wrap(lambda part: [record(data) for _, data in part]), slices))
+        records = [None] * len(rows)
+        for i, part in enumerate(hashed):
+            records[i::self.hash_workers] = part
+        return records
+
+    class Constants:
+        max_import_users = 1000 # Firebase limit of users per import_users call
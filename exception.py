@@ -1,16 +1,13 @@
 class MsgException(BaseException):
-    def __init__(self, title: str, message: str, httpStatus: int):
+    '''
+    Error reported to the client as `title` and `message`, with `httpStatus` (500 unless given).
+    '''
+    def __init__(self, title: str, message: str, httpStatus: int = 500):
         super().__init__(message)
         self.title = title
         self.message = message
         self.httpStatus = httpStatus
     
-    def __init__(self, title: str, message: str):
-        super().__init__(message)
-        self.title = title
-        self.message = message
-        self.httpStatus = 500
-    
 
 class ExceptionUtil:
     @staticmethod
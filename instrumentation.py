@@ -0,0 +1,481 @@
+from typing import Any, Callable, Iterator
+import bisect
+import contextvars
+import functools
+import inspect
+import itertools
+import random
+import re
+import threading
+import time
+
+_current_span: contextvars.ContextVar = contextvars.ContextVar("current_span", default=None)
+_current_request: contextvars.ContextVar = contextvars.ContextVar("current_request", default=None)
+_span_ids = itertools.count(1)
+
+class Span:
+    '''
+    A timed operation. As a context manager it is the parent of the spans opened inside it, in the same
+    thread or task, and in threads running functions passed through `Instrumentation.wrap`.
+    '''
+    __slots__ = ("name", "attributes", "span_id", "parent", "request", "start_ns", "duration", "child_time", "error", "hook_data", "_owner", "_start", "_token")
+
+    def __init__(self, owner: "Instrumentation", name: str, attributes: dict[str, Any], parent: "Span | None", request: "RequestContext | None"):
+        self._owner = owner
+        self.name = name
+        self.attributes = attributes
+        self.span_id = next(_span_ids)
+        self.parent = parent
+        self.request = request
+        self.duration = 0.0
+        self.child_time = 0.0 # Time of the child spans; what's left is spent in this one
+        self.error: str | None = None
+        self.hook_data: dict = {} # Per-hook state, e.g. the matching OpenTelemetry span
+        self._token = None
+        self.start_ns = time.time_ns()
+        self._start = time.perf_counter()
+        owner._started(self)
+
+    @property
+    def trace_id(self) -> str:
+        '''
+        ID of the request, or of the root span outside requests.
+        '''
+        if self.request is not None:
+            return self.request.request_id
+        root = self
+        while root.parent is not None:
+            root = root.parent
+        return f"{root.span_id:016x}"
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self._start
+
+    def end(self, error: BaseException | None = None, duration: float | None = None) -> None:
+        self.duration = self.elapsed() if duration is None else duration
+        if error is not None:
+            self.error = type(error).__name__
+        self._owner._finished(self)
+
+    def __enter__(self) -> "Span":
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> bool:
+        _current_span.reset(self._token)
+        self.end(exc_value)
+        return False
+
+    def __repr__(self) -> str:
+        return f"Span({self.name!r}, {self.duration * 1000:.2f} ms, trace={self.trace_id})"
+
+class _NoopSpan:
+    '''
+    Returned while instrumentation is disabled: every method does nothing.
+    '''
+    __slots__ = ()
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        pass
+
+    def elapsed(self) -> float:
+        return 0.0
+
+    def end(self, error: BaseException | None = None, duration: float | None = None) -> None:
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> bool:
+        return False
+
+class _UnsampledSpan(_NoopSpan):
+    '''
+    Stands for a span left out by sampling, so that the spans inside it are left out as well.
+    '''
+    __slots__ = ("_token",)
+
+    def __enter__(self):
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> bool:
+        _current_span.reset(self._token)
+        return False
+
+_NOOP = _NoopSpan()
+
+class RequestContext:
+    '''
+    State of one request, propagated with `contextvars` to the spans it runs: ID, attributes, sampling
+    decision and the time spent per span name (`breakdown`).
+    '''
+    def __init__(self, owner: "Instrumentation", name: str, request_id: str | None, attributes: dict[str, Any]):
+        self.name = name
+        self.request_id = request_id or f"{random.getrandbits(64):016x}"
+        self.attributes = attributes
+        self.sampled = owner.enabled and owner._sample()
+        self.duration = 0.0
+        self.spans: dict[str, list] = {} # Span name -> [count, total, self time, errors]
+        self.__owner = owner
+        self.__token = None
+        self.__span = None
+        self.__start = 0.0
+
+    def breakdown(self) -> dict[str, dict[str, float]]:
+        '''
+        Time per span name, slowest first: calls, total and self (without child spans) milliseconds, errors.
+        '''
+        rows = sorted(self.spans.items(), key=lambda item: item[1][1], reverse=True)
+        return {
+            name: { "count": count, "total_ms": total * 1000, "self_ms": own * 1000, "errors": errors }
+            for name, (count, total, own, errors) in rows
+        }
+
+    def __enter__(self) -> "RequestContext":
+        self.__start = time.perf_counter()
+        if self.__owner.enabled:
+            self.__token = _current_request.set(self)
+            if self.sampled:
+                self.__span = Span(self.__owner, self.name, dict(self.attributes), None, self).__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> bool:
+        self.duration = time.perf_counter() - self.__start
+        if self.__token is not None:
+            _current_request.reset(self.__token)
+        if self.__span is not None:
+            self.__span.__exit__(exc_type, exc_value, traceback)
+            threshold = self.__owner.slow_request_threshold
+            if threshold is not None and self.duration >= threshold:
+                parts = ", ".join(f"{name} {row['total_ms']:.0f} ms" for name, row in itertools.islice(self.breakdown().items(), 1, 8))
+                print(f"Slow request {self.name} {self.request_id}: {self.duration * 1000:.0f} ms ({parts})")
+        return False
+
+class SpanHook:
+    '''
+    Receives every sampled span when it starts and ends; base class of exporters.
+    '''
+    def on_start(self, span: Span) -> None:
+        pass
+
+    def on_end(self, span: Span) -> None:
+        pass
+
+class OpenTelemetryHook(SpanHook):
+    '''
+    Mirror spans to an OpenTelemetry tracer, with their parents, attributes, errors and timestamps.
+    '''
+    def __init__(self, tracer=None):
+        ## Optional dependency, only needed with this hook
+        from opentelemetry import trace
+        self.__trace = trace
+        self.tracer = tracer if tracer is not None else trace.get_tracer(Instrumentation.Constants.tracer_name)
+
+    def on_start(self, span: Span) -> None:
+        parent = span.parent.hook_data.get(self) if span.parent is not None else None
+        context = self.__trace.set_span_in_context(parent) if parent is not None else None
+        span.hook_data[self] = self.tracer.start_span(span.name, context=context, start_time=span.start_ns)
+
+    def on_end(self, span: Span) -> None:
+        otel_span = span.hook_data.pop(self, None)
+        if otel_span is None:
+            return
+        otel_span.set_attributes({ key: value for key, value in span.attributes.items() if isinstance(value, (str, bool, int, float)) })
+        if span.request is not None:
+            otel_span.set_attribute("request.id", span.request.request_id)
+        if span.error is not None:
+            otel_span.set_status(self.__trace.Status(self.__trace.StatusCode.ERROR, span.error))
+        otel_span.end(end_time=span.start_ns + int(span.duration * 1e9))
+
+class _Histogram:
+    __slots__ = ("counts", "sum", "count", "errors")
+
+    def __init__(self, buckets: int):
+        self.counts = [0] * (buckets + 1) # The last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.errors = 0
+
+class Instrumentation:
+    '''
+    Timing spans and counters for the hot paths, off by default.
+
+    While disabled, `traced` functions cost one attribute check and `span`
+    returns a shared no-op. Once enabled with `configure`, spans record a
+    latency histogram per name, go to the registered hooks (e.g.
+    `OpenTelemetryHook`) and add up per request in `RequestContext.breakdown`.
+    Sampling is decided once per request (or per root span outside requests)
+    and inherited by the spans inside; counters are always exact.
+
+        instrumentation.configure(sample_rate=0.1, slow_request_threshold=2.0)
+        with instrumentation.request("chat", uid=uid) as request:
+            ...
+        request.breakdown()
+        instrumentation.prometheus_text() ## Body of a /metrics endpoint
+    '''
+    def __init__(self):
+        self.enabled = False
+        self.sample_rate = 1.0
+        self.slow_request_threshold: float | None = None
+        self.buckets = self.Constants.buckets
+        self.hooks: list[SpanHook] = []
+        self.__lock = threading.Lock()
+        self.__histograms: dict[str, _Histogram] = {}
+        self.__counters: dict[tuple, float] = {}
+        self.__rng = random.Random()
+
+    def configure(self, enabled: bool = True, sample_rate: float | None = None, slow_request_threshold: float | None = None, buckets: tuple[float, ...] | None = None) -> "Instrumentation":
+        '''
+        Parameters
+        ----------
+        enabled : bool
+            Record spans and counters; when False, instrumented code runs as if it weren't.
+        sample_rate : float | None
+            Share of requests (or root spans) whose spans are recorded.
+        slow_request_threshold : float | None
+            Print the breakdown of sampled requests taking at least this many seconds.
+        buckets : tuple[float, ...] | None
+            Upper bounds in seconds of the latency histograms; resets them.
+        '''
+        if sample_rate is not None:
+            self.sample_rate = min(1.0, max(0.0, sample_rate))
+        if slow_request_threshold is not None:
+            self.slow_request_threshold = slow_request_threshold
+        if buckets is not None:
+            with self.__lock:
+                self.buckets = tuple(sorted(buckets))
+                self.__histograms.clear()
+        self.enabled = enabled
+        return self
+
+    def add_hook(self, hook: SpanHook) -> SpanHook:
+        self.hooks = [*self.hooks, hook] # Copied, so spans ending meanwhile iterate a stable list
+        return hook
+
+    def remove_hook(self, hook: SpanHook) -> None:
+        self.hooks = [other for other in self.hooks if other is not hook]
+
+    ## Spans
+
+    def span(self, name: str, **attributes: Any) -> Span | _NoopSpan:
+        '''
+        Start a span; use it with `with`, or call `end()` when the operation finishes.
+        '''
+        if not self.enabled:
+            return _NOOP
+        request = _current_request.get()
+        if request is not None and not request.sampled:
+            return _NOOP # The request carries the decision for every span inside it
+        parent = _current_span.get()
+        if isinstance(parent, _UnsampledSpan):
+            return _UnsampledSpan()
+        if parent is None and request is None and not self._sample():
+            return _UnsampledSpan()
+        return Span(self, name, attributes, parent, request)
+
+    def request(self, name: str = "request", request_id: str | None = None, **attributes: Any) -> RequestContext:
+        '''
+        Context of a request: its spans share a trace ID and sampling decision, and add up in `breakdown()`.
+        '''
+        return RequestContext(self, name, request_id, attributes)
+
+    def traced(self, name: str | None = None, **attributes: Any) -> Callable:
+        '''
+        Decorator running a function, coroutine function or generator function in a span.
+        For generators only the time spent inside them counts, not the consumer's.
+        '''
+        def decorate(fn: Callable) -> Callable:
+            span_name = name or fn.__qualname__
+            if inspect.iscoroutinefunction(fn):
+                @functools.wraps(fn)
+                async def async_wrapper(*args, **kwargs):
+                    span = self.span(span_name, **attributes) if self.enabled else _NOOP
+                    if span is _NOOP:
+                        return await fn(*args, **kwargs)
+                    with span:
+                        return await fn(*args, **kwargs)
+                return async_wrapper
+            if inspect.isgeneratorfunction(fn):
+                @functools.wraps(fn)
+                def generator_wrapper(*args, **kwargs):
+                    if not self.enabled:
+                        return fn(*args, **kwargs)
+                    return self.__trace_generator(span_name, attributes, fn(*args, **kwargs))
+                return generator_wrapper
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                span = self.span(span_name, **attributes) if self.enabled else _NOOP
+                if span is _NOOP:
+                    return fn(*args, **kwargs)
+                with span:
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    def instrument(self, prefix: str) -> Callable[[type], type]:
+        '''
+        Class decorator tracing every public method defined in the class as `<prefix>.<method>`.
+        '''
+        def decorate(cls: type) -> type:
+            for attr, value in list(vars(cls).items()):
+                if attr.startswith("_") or not inspect.isfunction(value) or inspect.isasyncgenfunction(value):
+                    continue
+                setattr(cls, attr, self.traced(f"{prefix}.{attr}")(value))
+            return cls
+        return decorate
+
+    @staticmethod
+    def wrap(fn: Callable) -> Callable:
+        '''
+        Carry the current request and span over to the thread that will call `fn` (e.g. an executor).
+        '''
+        context = contextvars.copy_context()
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            return context.copy().run(fn, *args, **kwargs)
+        return wrapper
+
+    def __trace_generator(self, name: str, attributes: dict[str, Any], generator: Iterator) -> Iterator:
+        span = self.span(name, **attributes)
+        if not isinstance(span, Span):
+            yield from generator
+            return
+        elapsed, items, error = 0.0, 0, None
+        try:
+            while True:
+                token = _current_span.set(span)
+                start = time.perf_counter()
+                try:
+                    item = next(generator)
+                except StopIteration:
+                    break
+                finally:
+                    elapsed += time.perf_counter() - start
+                    _current_span.reset(token)
+                items += 1
+                yield item
+        except GeneratorExit:
+            raise
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            generator.close()
+            span.set_attribute("items", items)
+            span.end(error, duration=elapsed)
+
+    def _sample(self) -> bool:
+        return self.sample_rate >= 1.0 or self.__rng.random() < self.sample_rate
+
+    def _started(self, span: Span) -> None:
+        for hook in self.hooks:
+            try:
+                hook.on_start(span)
+            except Exception as e:
+                print("Instrumentation hook failed:", e)
+
+    def _finished(self, span: Span) -> None:
+        duration = span.duration
+        with self.__lock:
+            histogram = self.__histograms.get(span.name)
+            if histogram is None:
+                histogram = self.__histograms[span.name] = _Histogram(len(self.buckets))
+            histogram.counts[bisect.bisect_left(self.buckets, duration)] += 1
+            histogram.sum += duration
+            histogram.count += 1
+            histogram.errors += span.error is not None
+            if span.parent is not None:
+                span.parent.child_time += duration
+            if span.request is not None:
+                row = span.request.spans.get(span.name)
+                if row is None:
+                    row = span.request.spans[span.name] = [0, 0.0, 0.0, 0]
+                row[0] += 1
+                row[1] += duration
+                row[2] += max(0.0, duration - span.child_time)
+                row[3] += span.error is not None
+        for hook in self.hooks:
+            try:
+                hook.on_end(span)
+            except Exception as e:
+                print("Instrumentation hook failed:", e)
+
+    ## Counters
+
+    def count(self, name: str, value: float = 1, **labels: Any) -> None:
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self.__lock:
+            self.__counters[key] = self.__counters.get(key, 0) + value
+
+    ## Export
+
+    def stats(self) -> dict[str, object]:
+        with self.__lock:
+            spans = { name: { "count": h.count, "errors": h.errors, "mean_ms": h.sum / h.count * 1000 if h.count else 0.0 } for name, h in self.__histograms.items() }
+            counters = { name + "".join(f",{key}={value}" for key, value in labels): value for (name, labels), value in self.__counters.items() }
+        return { "enabled": self.enabled, "sample_rate": self.sample_rate, "spans": spans, "counters": counters }
+
+    def reset(self) -> None:
+        with self.__lock:
+            self.__histograms.clear()
+            self.__counters.clear()
+
+    def prometheus_text(self) -> str:
+        '''
+        Histograms and counters in the Prometheus text exposition format (version 0.0.4).
+        Span histograms only hold sampled spans; divide by the exported sample rate to estimate totals.
+        '''
+        with self.__lock:
+            buckets = self.buckets
+            histograms = { name: (list(h.counts), h.sum, h.count, h.errors) for name, h in self.__histograms.items() }
+            counters = dict(self.__counters)
+        prefix = self.Constants.namespace
+        lines = [
+            f"# HELP {prefix}_instrumentation_sample_rate Share of requests whose spans are recorded.",
+            f"# TYPE {prefix}_instrumentation_sample_rate gauge",
+            f"{prefix}_instrumentation_sample_rate {self.sample_rate:g}",
+        ]
+        if histograms:
+            metric = f"{prefix}_span_duration_seconds"
+            lines += [f"# HELP {metric} Duration of instrumented operations.", f"# TYPE {metric} histogram"]
+            for name, (counts, total, count, _) in sorted(histograms.items()):
+                label = f'span="{self.__escape(name)}"'
+                cumulative = 0
+                for bound, bucket in zip(buckets, counts):
+                    cumulative += bucket
+                    lines.append(f'{metric}_bucket{{{label},le="{bound:g}"}} {cumulative}')
+                lines.append(f'{metric}_bucket{{{label},le="+Inf"}} {count}')
+                lines.append(f"{metric}_sum{{{label}}} {total:.9g}")
+                lines.append(f"{metric}_count{{{label}}} {count}")
+            metric = f"{prefix}_span_errors_total"
+            lines += [f"# HELP {metric} Instrumented operations that raised.", f"# TYPE {metric} counter"]
+            lines += [f'{metric}{{span="{self.__escape(name)}"}} {errors}' for name, (_, _, _, errors) in sorted(histograms.items())]
+        by_name: dict[str, list] = {}
+        for (name, labels), value in counters.items():
+            by_name.setdefault(name, []).append((labels, value))
+        for name, series in sorted(by_name.items()):
+            metric = f"{prefix}_{re.sub(r'[^a-zA-Z0-9_]', '_', name)}_total"
+            lines.append(f"# TYPE {metric} counter")
+            for labels, value in sorted(series):
+                label = ",".join(f'{re.sub(r"[^a-zA-Z0-9_]", "_", key)}="{self.__escape(str(val))}"' for key, val in labels)
+                lines.append(f"{metric}{{{label}}} {value:.15g}" if label else f"{metric} {value:.15g}")
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def __escape(value: str) -> str:
+        return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+    class Constants:
+        namespace = "backend" # Prefix of the exported metric names
+        tracer_name = "backend-util"
+        buckets = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+## Shared by the whole process; instrumented modules import it
+instrumentation = Instrumentation()
@@ -1,39 +1,55 @@
-from langchain_core.prompts.chat import ChatPromptTemplate
-from langchain.chains import ConversationChain
-from langchain.memory import ConversationBufferMemory
-from langchain_community.document_loaders import Docx2txtLoader
-from langchain.text_splitter import TokenTextSplitter
-from langchain.chains.combine_documents import create_stuff_documents_chain
-from langchain.chains.retrieval import create_retrieval_chain
-from langchain_chroma import Chroma
-
-from .resource import RAG_Resources
-from .message_history import FileChatMessageHistory
+from langchain_core.chat_history import BaseChatMessageHistory
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.runnables import RunnableLambda
+from langchain_core.vectorstores import VectorStore
+
+from .resource import RAG_Resources, resources
+from .ingest import DocumentIngestor
+from .semantic_cache import CachedQAChain
+from .memory import TokenWindowMemory, last_messages
 from .manager import LLMManager
+from .callbacks import instrumentation_callback
 
-def setup_rag_agent(filepath: str):
-    print("Initializing Vector DB...")
-    ## Vector DB Initialization
-    vectordb = Chroma(
-        collection_name="alz_docs",
+def load_vectordb(collection_name: str = "alz_docs") -> VectorStore:
+    """Get the vector store of a collection; opened on first use and shared afterwards
+
+    Args:
+        collection_name (str): Name of the collection
+
+    Returns:
+        VectorStore: Store of the kind set in `RAG_Resources.vector_store`
+    """
+    store = RAG_Resources.vector_store
+    if store not in ("numpy", "chroma"):
+        raise Exception("No such vector store available!! Please check once again!!")
+    return resources.get(f"vectordb:{store}:{collection_name}", lambda: _open_vectordb(store, collection_name))
+
+def _open_vectordb(store: str, collection_name: str) -> VectorStore:
+    ## Only the chosen store's library is imported
+    if store == "numpy":
+        from .vectorstore import NumpyVectorStore
+        return NumpyVectorStore(
+            collection_name=collection_name,
+            embedding_function=RAG_Resources.embedding,
+            persist_directory=RAG_Resources.persist_directory,
+        )
+    from langchain_chroma import Chroma
+    return Chroma(
+        collection_name=collection_name,
         embedding_function=RAG_Resources.embedding,
         persist_directory=RAG_Resources.persist_directory,
     )
 
-    print("Documents available:", vectordb._collection.count())
-    ## If Vector DB is empty, reinitialize it.
-    if vectordb._collection.count() == 0:
-        ## Document Loading
-        loader = Docx2txtLoader(filepath)
-        data = loader.load()
-        text_splitter = TokenTextSplitter(
-            chunk_size=RAG_Resources.chunk_size,
-            chunk_overlap=RAG_Resources.chunk_overlap
-        )
-        split_data = text_splitter.split_documents(data)
+def setup_rag_agent(filepath: str | list[str], cache_responses: bool = True):
+    from langchain_classic.chains.combine_documents import create_stuff_documents_chain
+    from langchain_classic.chains.retrieval import create_retrieval_chain
 
-        ## Vector DB initialization
-        vectordb.add_documents(split_data)
+    print("Initializing Vector DB...")
+    ## Vector DB Initialization
+    vectordb = load_vectordb()
+    ## Embed only new or changed chunks, drop the stale ones
+    ingestor = DocumentIngestor(vectordb)
+    ingestor.ingest(filepath)
 
     print("Vector DB Initialized Successfully!!")
 
@@ -44,26 +60,47 @@ def setup_rag_agent(filepath: str):
         output_parser=RAG_Resources.output_parser,
     )
 
-    qa_chain = create_retrieval_chain(
-        vectordb.as_retriever(),
-        combine_docs_chain
-    )
+    ## Once configured the retriever is no longer a BaseRetriever, so it is handed the question itself
+    retriever = RunnableLambda(lambda inputs: inputs["input"]) | vectordb.as_retriever().with_config(callbacks=[instrumentation_callback])
+    qa_chain = create_retrieval_chain(retriever, combine_docs_chain)
+
+    ## Near-duplicate questions are answered from the cache until the documents change
+    if cache_responses:
+        qa_chain = CachedQAChain(qa_chain, RAG_Resources.embedding, version=ingestor.manifest.fingerprint())
 
     return qa_chain
 
-def construct_old_chain(manager: LLMManager, sys_prompt: str):
-        filemem = FileChatMessageHistory()
-        if(filemem.messages == []):
-            filemem.add_user_message(sys_prompt)
-            filemem.add_ai_message("")
-        memory = ConversationBufferMemory(
-            chat_memory=filemem
-        )
+def construct_old_chain(manager: LLMManager, sys_prompt: str, history: BaseChatMessageHistory, max_token_limit: int = 2000, summarize: bool = False):
+        """Build the conversation chain of the virtual assistant
+
+        Args:
+            manager (LLMManager): Manager providing the chat model
+            sys_prompt (str): System prompt; stored at the start of a new history and sent every turn
+            history (BaseChatMessageHistory): History of the session, e.g. `FileChatMessageHistory` or `FirebaseMessageHistory`
+            max_token_limit (int): Token budget of the history part of the prompt
+            summarize (bool): Fold turns leaving the budget into a rolling summary written by the same model.
+                Costs a model call whenever turns leave the window, and the summary is only kept in memory
+
+        Returns:
+            ConversationChain: Chain whose prompt size stays bounded however long the chat runs
+        """
+        from langchain_classic.chains import ConversationChain
+
+        pinned = [HumanMessage(content=sys_prompt), AIMessage(content="")]
+        ## Only the last message is read; a new history starts with the system prompt
+        if last_messages(history, 1) == []:
+            history.add_messages(pinned)
         chat_llm, output_parser = manager.load_default("virtual_assistant")
+        memory = TokenWindowMemory(
+            chat_memory=history,
+            pinned=pinned,
+            max_token_limit=max_token_limit,
+            summarizer=chat_llm if summarize else None,
+        )
         convchain = ConversationChain(
             llm = chat_llm,
             memory = memory,
             output_parser = output_parser,
         )
         print("Chain constructed successfully!!")
-        return convchain
\ No newline at end of file
+        return convchain
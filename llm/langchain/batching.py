@@ -0,0 +1,183 @@
+from langchain_core.runnables import Runnable, RunnableConfig
+
+from concurrent.futures import Future, ThreadPoolExecutor
+from collections import deque
+from typing import Any
+import asyncio
+import queue
+import threading
+import time
+import weakref
+
+class MicroBatcher(Runnable):
+    '''
+    Collects concurrent invocations of a model into batches.
+
+    Callers block in `invoke` (or await `ainvoke`) as usual. Requests arriving
+    within `max_wait` seconds of the first one, up to `max_batch_size`, are sent
+    together through the model's `batch`/`abatch` and every caller gets its own
+    result or exception back. At most `max_concurrent_batches` batches are in
+    flight; while they are, requests keep queueing and the next batch is fuller.
+
+    Requests only share a batch when their keyword arguments (e.g. `stop`) are
+    equal. Per-call `config` is not forwarded, the batch runs with the model's
+    own configuration.
+    '''
+
+    def __init__(self, model: Runnable, max_batch_size: int = 8, max_wait: float = 0.01, max_concurrent_batches: int = 4):
+        '''
+        Parameters
+        ----------
+        model : Runnable
+            Chat model (or any runnable) whose `batch`/`abatch` handles a list of inputs.
+        max_batch_size : int
+            Requests per batch.
+        max_wait : float
+            Seconds the first request of a batch waits for company.
+        max_concurrent_batches : int
+            Batches dispatched at once, per entry point (threads, and each event loop).
+        '''
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.max_concurrent_batches = max_concurrent_batches
+        self.__lock = threading.Lock()
+        self.__queue: queue.Queue = queue.Queue()
+        self.__thread: threading.Thread | None = None
+        self.__executor: ThreadPoolExecutor | None = None
+        self.__loops: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary() # event loop -> (asyncio.Queue, collector task)
+        self.__started = time.monotonic()
+        self.__counters = { "requests": 0, "batches": 0, "errors": 0 }
+        self.__sizes: dict[int, int] = {}
+        self.__waits: deque[float] = deque(maxlen=self.Constants.wait_samples)
+
+    ## Sync
+
+    def invoke(self, input: Any, config: RunnableConfig | None = None, **kwargs: Any) -> Any:
+        future: Future = Future()
+        self.__ensure_thread()
+        self.__queue.put((self.__key(kwargs), input, kwargs, future, time.monotonic()))
+        return future.result()
+
+    def __ensure_thread(self) -> None:
+        with self.__lock:
+            if self.__thread is None:
+                self.__executor = ThreadPoolExecutor(self.max_concurrent_batches, thread_name_prefix="micro-batch")
+                self.__thread = threading.Thread(target=self.__collect, name="micro-batch-collector", daemon=True)
+                self.__thread.start()
+
+    def __collect(self) -> None:
+        slots = threading.Semaphore(self.max_concurrent_batches)
+        while True:
+            pending = [self.__queue.get()]
+            deadline = pending[0][4] + self.max_wait
+            while len(pending) < self.max_batch_size:
+                timeout = deadline - time.monotonic()
+                try:
+                    pending.append(self.__queue.get(timeout=timeout) if timeout > 0 else self.__queue.get_nowait())
+                except queue.Empty:
+                    break
+            for group in self.__group(pending):
+                slots.acquire()
+                self.__executor.submit(self.__run, group).add_done_callback(lambda _: slots.release())
+
+    def __run(self, group: list[tuple]) -> None:
+        self.__record(group)
+        inputs = [item[1] for item in group]
+        try:
+            results = self.model.batch(inputs, return_exceptions=True, **group[0][2])
+        except Exception as e:
+            results = [e] * len(group)
+        self.__deliver(group, results)
+
+    ## Async
+
+    async def ainvoke(self, input: Any, config: RunnableConfig | None = None, **kwargs: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        with self.__lock:
+            if loop not in self.__loops or self.__loops[loop][1].done():
+                requests = asyncio.Queue()
+                self.__loops[loop] = (requests, loop.create_task(self.__acollect(requests)))
+            requests = self.__loops[loop][0]
+        future = loop.create_future()
+        requests.put_nowait((self.__key(kwargs), input, kwargs, future, time.monotonic()))
+        return await future
+
+    async def __acollect(self, requests: asyncio.Queue) -> None:
+        slots = asyncio.Semaphore(self.max_concurrent_batches)
+        tasks = set()
+        while True:
+            pending = [await requests.get()]
+            deadline = pending[0][4] + self.max_wait
+            while len(pending) < self.max_batch_size:
+                try:
+                    pending.append(await asyncio.wait_for(requests.get(), max(0.0, deadline - time.monotonic())))
+                except asyncio.TimeoutError:
+                    break
+            for group in self.__group(pending):
+                await slots.acquire()
+                task = asyncio.create_task(self.__arun(group))
+                tasks.add(task)
+                task.add_done_callback(lambda task: (tasks.discard(task), slots.release()))
+
+    async def __arun(self, group: list[tuple]) -> None:
+        self.__record(group)
+        inputs = [item[1] for item in group]
+        try:
+            results = await self.model.abatch(inputs, return_exceptions=True, **group[0][2])
+        except Exception as e:
+            results = [e] * len(group)
+        self.__deliver(group, results)
+
+    ## Metrics
+
+    def stats(self) -> dict[str, object]:
+        with self.__lock:
+            stats = dict(self.__counters)
+            sizes = dict(sorted(self.__sizes.items()))
+            waits = sorted(self.__waits)
+        elapsed = time.monotonic() - self.__started
+        stats["mean_batch_size"] = stats["requests"] / stats["batches"] if stats["batches"] else 0.0
+        stats["batch_sizes"] = sizes
+        stats["queue_wait_p50"] = waits[len(waits) // 2] if waits else 0.0
+        stats["queue_wait_p99"] = waits[min(len(waits) - 1, int(len(waits) * 0.99))] if waits else 0.0
+        stats["requests_per_second"] = stats["requests"] / elapsed if elapsed else 0.0
+        return stats
+
+    def __record(self, group: list[tuple]) -> None:
+        now = time.monotonic()
+        with self.__lock:
+            self.__counters["requests"] += len(group)
+            self.__counters["batches"] += 1
+            self.__sizes[len(group)] = self.__sizes.get(len(group), 0) + 1
+            self.__waits.extend(now - item[4] for item in group)
+
+    ## Helpers
+
+    def __deliver(self, group: list[tuple], results: list[Any]) -> None:
+        errors = 0
+        for (_, _, _, future, _), result in zip(group, results):
+            if future.done():
+                continue # Caller was cancelled
+            if isinstance(result, Exception):
+                errors += 1
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+        if errors:
+            with self.__lock:
+                self.__counters["errors"] += errors
+
+    @staticmethod
+    def __key(kwargs: dict[str, Any]) -> tuple:
+        return tuple(sorted((name, repr(value)) for name, value in kwargs.items()))
+
+    @staticmethod
+    def __group(pending: list[tuple]) -> list[list[tuple]]:
+        groups: dict[tuple, list[tuple]] = {}
+        for item in pending:
+            groups.setdefault(item[0], []).append(item)
+        return list(groups.values())
+
+    class Constants:
+        wait_samples = 10000 # Recent queue waits kept for the percentiles
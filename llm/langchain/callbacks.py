@@ -0,0 +1,99 @@
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+
+from ...instrumentation import Span, instrumentation
+
+from typing import Any
+from uuid import UUID
+
+class InstrumentationCallback(BaseCallbackHandler):
+    '''
+    Spans for the retrieval ("retrieval") and generation ("llm.generate") steps of LangChain runs,
+    with time to first token and token usage. Does nothing while instrumentation is disabled.
+
+    `LLMManager` attaches it to the chat models it builds; attach it to other runnables with
+    `runnable.with_config(callbacks=[instrumentation_callback])`.
+    '''
+    ## Called in the caller's thread or task, so the spans see its request and parent span
+    run_inline = True
+
+    def __init__(self):
+        self.__spans: dict[UUID, Span] = {}
+
+    ## Generation
+
+    def on_chat_model_start(self, serialized: dict[str, Any], messages: list, *, run_id: UUID, metadata: dict[str, Any] | None = None, **kwargs: Any) -> None:
+        self.__start(run_id, "llm.generate", self.__model(serialized, metadata))
+
+    def on_llm_start(self, serialized: dict[str, Any], prompts: list[str], *, run_id: UUID, metadata: dict[str, Any] | None = None, **kwargs: Any) -> None:
+        self.__start(run_id, "llm.generate", self.__model(serialized, metadata))
+
+    def on_llm_new_token(self, token: str, *, run_id: UUID, **kwargs: Any) -> None:
+        span = self.__spans.get(run_id)
+        if span is not None and "first_token_ms" not in span.attributes:
+            span.set_attribute("first_token_ms", span.elapsed() * 1000)
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        span = self.__spans.pop(run_id, None)
+        if span is None:
+            return
+        input_tokens, output_tokens = self.__usage(response)
+        model = span.attributes.get("model", "unknown")
+        if input_tokens or output_tokens:
+            span.set_attribute("input_tokens", input_tokens)
+            span.set_attribute("output_tokens", output_tokens)
+            instrumentation.count("llm_tokens", input_tokens, model=model, kind="input")
+            instrumentation.count("llm_tokens", output_tokens, model=model, kind="output")
+        span.end()
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self.__end(run_id, error)
+
+    ## Retrieval
+
+    def on_retriever_start(self, serialized: dict[str, Any], query: str, *, run_id: UUID, **kwargs: Any) -> None:
+        self.__start(run_id, "retrieval", {})
+
+    def on_retriever_end(self, documents: list, *, run_id: UUID, **kwargs: Any) -> None:
+        span = self.__spans.get(run_id)
+        if span is not None:
+            span.set_attribute("documents", len(documents))
+        self.__end(run_id)
+
+    def on_retriever_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self.__end(run_id, error)
+
+    def __start(self, run_id: UUID, name: str, attributes: dict[str, Any]) -> None:
+        if not instrumentation.enabled:
+            return
+        span = instrumentation.span(name, **attributes)
+        if isinstance(span, Span):
+            self.__spans[run_id] = span
+
+    def __end(self, run_id: UUID, error: BaseException | None = None) -> None:
+        span = self.__spans.pop(run_id, None)
+        if span is not None:
+            span.end(error)
+
+    @staticmethod
+    def __model(serialized: dict[str, Any] | None, metadata: dict[str, Any] | None) -> dict[str, Any]:
+        model = (metadata or {}).get("ls_model_name") or (serialized or {}).get("name")
+        return { "model": model } if model else {}
+
+    @staticmethod
+    def __usage(response: LLMResult) -> tuple[int, int]:
+        ## Chat models report usage on the message, older clients in `llm_output`
+        input_tokens = output_tokens = 0
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                if usage:
+                    input_tokens += usage.get("input_tokens", 0)
+                    output_tokens += usage.get("output_tokens", 0)
+        if not (input_tokens or output_tokens):
+            usage = (response.llm_output or {}).get("token_usage") or {}
+            input_tokens, output_tokens = usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+        return input_tokens, output_tokens
+
+## Shared by every model and retriever of the process
+instrumentation_callback = InstrumentationCallback()
@@ -0,0 +1,206 @@
+from langchain_core.embeddings import Embeddings
+
+from ...instrumentation import instrumentation
+
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+from array import array
+import hashlib
+import os
+import sqlite3
+import threading
+
+class CachedEmbeddings(Embeddings):
+    '''
+    Embeddings wrapper with a persistent cache in SQLite.
+
+    Vectors are stored as float32 blobs keyed by (model name, SHA-256 of the
+    text), so they survive restarts and are shared by every process using the
+    same file. Cache misses are de-duplicated, grouped into requests bounded by
+    `batch_size` texts and `max_batch_chars` characters, and sent to the
+    wrapped model concurrently.
+
+    Query vectors are one-off far more often than document vectors, so they are
+    only kept in memory, for the `max_queries` most recently used queries.
+    '''
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS embeddings (
+            model TEXT NOT NULL,
+            digest BLOB NOT NULL,
+            vector BLOB NOT NULL,
+            PRIMARY KEY (model, digest)
+        ) WITHOUT ROWID
+    '''
+
+    def __init__(
+            self,
+            embedding: Embeddings,
+            model_name: str | None = None,
+            path: str | None = None,
+            batch_size: int = 32,
+            max_batch_chars: int = 64000,
+            max_workers: int = 4,
+            max_queries: int = 1024,
+        ):
+        '''
+        Parameters
+        ----------
+        embedding : Embeddings
+            Model computing the cache misses.
+        model_name : str | None
+            Cache namespace; defaults to the `model_name`/`model` attribute of `embedding`.
+            Vectors of different models never mix.
+        path : str | None
+            SQLite file; None keeps the cache in memory for the lifetime of the object.
+        batch_size : int
+            Max texts per request to the wrapped model.
+        max_batch_chars : int
+            Max characters per request to the wrapped model.
+        max_workers : int
+            Requests sent concurrently.
+        max_queries : int
+            Query vectors kept in memory; the least recently used one is evicted beyond.
+        '''
+        self.embedding = embedding
+        self.model_name = model_name or getattr(embedding, "model_name", None) or getattr(embedding, "model", None) or type(embedding).__name__
+        self.path = path
+        self.batch_size = batch_size
+        self.max_batch_chars = max_batch_chars
+        self.max_workers = max_workers
+        self.max_queries = max_queries
+        self.__conn = None
+        self.__lock = threading.Lock()
+        self.__queries: OrderedDict[bytes, list[float]] = OrderedDict() # digest -> vector, least recently used first
+        self.__counters = dict.fromkeys(("hits", "misses", "remote_calls", "remote_texts"), 0)
+
+    @instrumentation.traced("embedding.embed_documents")
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self.__embed(texts, self.model_name, self.embedding.embed_documents)
+
+    @instrumentation.traced("embedding.embed_query")
+    def embed_query(self, text: str) -> list[float]:
+        ## Some models embed queries differently from documents; keep them apart
+        digest = hashlib.sha256(text.encode()).digest()
+        with self.__lock:
+            vector = self.__queries.get(digest)
+            if vector is not None:
+                self.__queries.move_to_end(digest)
+                self.__counters["hits"] += 1
+            else:
+                self.__counters["misses"] += 1
+        instrumentation.count("embedding_cache_lookups", 1, result="hit" if vector is not None else "miss")
+        if vector is not None:
+            return list(vector)
+
+        vector = list(self.embedding.embed_query(text))
+        with self.__lock:
+            self.__counters["remote_calls"] += 1
+            self.__counters["remote_texts"] += 1
+            self.__queries[digest] = vector
+            self.__queries.move_to_end(digest)
+            while len(self.__queries) > self.max_queries:
+                self.__queries.popitem(last=False)
+        return list(vector)
+
+    def stats(self) -> dict[str, object]:
+        with self.__lock:
+            entries, stored = self.__connect().execute("SELECT COUNT(*), COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings").fetchone()
+            counters = dict(self.__counters)
+        lookups = counters["hits"] + counters["misses"]
+        counters["hit_rate"] = counters["hits"] / lookups if lookups else 0.0
+        counters["entries"] = entries
+        counters["bytes_stored"] = stored
+        counters["query_entries"] = len(self.__queries)
+        return counters
+
+    def clear(self) -> None:
+        with self.__lock:
+            self.__queries.clear()
+            conn = self.__connect()
+            conn.execute("DELETE FROM embeddings")
+            conn.commit()
+
+    def __embed(self, texts: list[str], model: str, compute) -> list[list[float]]:
+        digests = [hashlib.sha256(text.encode()).digest() for text in texts]
+        found = self.__lookup(model, set(digests))
+
+        missing: dict[bytes, str] = {}
+        for digest, text in zip(digests, texts):
+            if digest not in found:
+                missing.setdefault(digest, text)
+        with self.__lock:
+            self.__counters["hits"] += len(texts) - len(missing)
+            self.__counters["misses"] += len(missing)
+        instrumentation.count("embedding_cache_lookups", len(texts) - len(missing), result="hit")
+        instrumentation.count("embedding_cache_lookups", len(missing), result="miss")
+
+        if missing:
+            computed = self.__compute(list(missing.items()), compute)
+            self.__store(model, computed)
+            found.update(computed)
+        return [found[digest] for digest in digests]
+
+    def __compute(self, items: list[tuple[bytes, str]], compute) -> dict[bytes, list[float]]:
+        batches, batch, chars = [], [], 0
+        for digest, text in items:
+            if batch and (len(batch) >= self.batch_size or chars + len(text) > self.max_batch_chars):
+                batches.append(batch)
+                batch, chars = [], 0
+            batch.append((digest, text))
+            chars += len(text)
+        batches.append(batch)
+
+        def run(batch: list[tuple[bytes, str]]) -> list[list[float]]:
+            return compute([text for _, text in batch])
+
+        with instrumentation.span("embedding.compute", texts=len(items), batches=len(batches)):
+            if len(batches) == 1:
+                results = [run(batches[0])]
+            else:
+                with ThreadPoolExecutor(max_workers=min(self.max_workers, len(batches))) as executor:
+                    results = list(executor.map(instrumentation.wrap(run), batches))
+        with self.__lock:
+            self.__counters["remote_calls"] += len(batches)
+            self.__counters["remote_texts"] += len(items)
+        return { digest: list(vector) for batch, vectors in zip(batches, results) for (digest, _), vector in zip(batch, vectors) }
+
+    def __lookup(self, model: str, digests: set[bytes]) -> dict[bytes, list[float]]:
+        found = {}
+        digests = list(digests)
+        with self.__lock:
+            conn = self.__connect()
+            ## Stay below SQLite's limit of bound parameters
+            for i in range(0, len(digests), self.Constants.max_params):
+                part = digests[i:i + self.Constants.max_params]
+                rows = conn.execute(
+                    f"SELECT digest, vector FROM embeddings WHERE model = ? AND digest IN ({','.join('?' * len(part))})",
+                    [model, *part],
+                )
+                for digest, blob in rows:
+                    found[digest] = array("f", blob).tolist()
+        return found
+
+    def __store(self, model: str, vectors: dict[bytes, list[float]]) -> None:
+        with self.__lock:
+            conn = self.__connect()
+            conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, digest, vector) VALUES (?, ?, ?)",
+                [(model, digest, array("f", vector).tobytes()) for digest, vector in vectors.items()],
+            )
+            conn.commit()
+
+    def __connect(self) -> sqlite3.Connection:
+        ## Opened lazily so that constructing the wrapper never touches the disk
+        if self.__conn is None:
+            if self.path is None:
+                self.__conn = sqlite3.connect(":memory:", check_same_thread=False)
+            else:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                self.__conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+                self.__conn.execute("PRAGMA journal_mode=WAL")
+                self.__conn.execute("PRAGMA synchronous=NORMAL")
+            self.__conn.execute(self.SCHEMA)
+        return self.__conn
+
+    class Constants:
+        max_params = 900 # SQLite allows 999 bound parameters in older builds
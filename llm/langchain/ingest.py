@@ -0,0 +1,419 @@
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+from langchain_text_splitters import TextSplitter
+
+from .resource import RAG_Resources
+from ...instrumentation import instrumentation
+
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from collections import deque
+from typing import Iterable
+import hashlib
+import json
+import multiprocessing
+import os
+import re
+import threading
+import time
+import zlib
+
+class IngestionManifest:
+    '''
+    JSON record of what has been indexed: the splitter settings, and for every
+    source file its content hash and the IDs of its chunks. Written atomically
+    (temporary file + `os.replace`), so an interrupted ingestion leaves either
+    the old or the new manifest behind, never a torn one.
+    '''
+    VERSION = 1
+
+    def __init__(self, path: str | None):
+        self.path = path
+        self.settings: dict[str, object] = {}
+        self.files: dict[str, dict[str, object]] = {} # path -> { sha256, chunks }
+        self.exists = False
+        if path is not None and os.path.exists(path):
+            with open(path) as f:
+                data = json.load(f)
+            if data.get("version") == self.VERSION:
+                self.settings = data.get("settings", {})
+                self.files = data.get("files", {})
+                self.exists = True
+
+    def save(self) -> None:
+        if self.path is None:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({ "version": self.VERSION, "settings": self.settings, "files": self.files }, f)
+        os.replace(tmp_path, self.path)
+        self.exists = True
+
+    def fingerprint(self) -> str:
+        '''
+        Digest of the indexed document set; changes whenever a file is added, edited or removed.
+        '''
+        return hashlib.sha256(
+            json.dumps([self.settings, sorted((path, entry["sha256"]) for path, entry in self.files.items())]).encode()
+        ).hexdigest()
+
+class DocumentIngestor:
+    '''
+    Incremental ingestion of documents into a vector store.
+
+    Every chunk gets a deterministic ID derived from its source, the splitter
+    settings and its text, so re-running an ingestion only embeds the chunks
+    that are new and deletes the ones that no longer exist. Unchanged files
+    (same SHA-256) are skipped without being parsed.
+
+    Text is first cut into sections at content-defined paragraph boundaries
+    and each section is split separately, so an edit only moves the chunks of
+    the section it falls in instead of shifting every chunk after it.
+
+    Ingestion runs as a streaming pipeline: files are hashed, changed ones are
+    parsed and split (optionally in a process pool), new chunks are embedded in
+    batches on a thread pool and written to the store by a single indexing
+    thread. The stages are connected by bounded windows, so at most
+    `parse_workers * 2` parsed files and `max_pending_batches` batches are in
+    memory at any time.
+    '''
+
+    def __init__(
+            self,
+            vectordb: VectorStore,
+            manifest_path: str | None = None,
+            splitter: TextSplitter | None = None,
+            batch_size: int = 64,
+            parse_workers: int = 0,
+            embed_workers: int = 4,
+            max_pending_batches: int = 16,
+        ):
+        '''
+        Parameters
+        ----------
+        vectordb : VectorStore
+            Store the chunks are indexed in; must support `delete(ids=...)`, and `reset_collection()` to rebuild.
+        manifest_path : str | None
+            Manifest location; defaults to `ingest_manifest.json` in `RAG_Resources.persist_directory`.
+        splitter : TextSplitter | None
+            Defaults to `RAG_Resources.splitter`, a `TokenTextSplitter` with its chunk settings. Must be picklable
+            when `parse_workers` > 0.
+        batch_size : int
+            Chunks per embedding request and per write to the store.
+        parse_workers : int
+            Processes parsing and splitting changed files, spawned (not forked, the process may hold gRPC
+            clients and threads) when the first of them is found. Defaults to 0, parsing in the calling thread.
+        embed_workers : int
+            Threads computing embeddings concurrently.
+        max_pending_batches : int
+            Batches split but not yet indexed; parsing waits beyond that.
+        '''
+        self.vectordb = vectordb
+        if manifest_path is None:
+            manifest_path = os.path.join(RAG_Resources.persist_directory, self.Constants.manifest_name)
+        self.manifest = IngestionManifest(manifest_path)
+        self.splitter = splitter if splitter is not None else RAG_Resources.splitter
+        self.batch_size = batch_size
+        self.parse_workers = parse_workers
+        self.embed_workers = embed_workers
+        self.max_pending_batches = max_pending_batches
+
+    @property
+    def settings(self) -> dict[str, object]:
+        return {
+            "splitter": type(self.splitter).__name__,
+            "chunk_size": getattr(self.splitter, "_chunk_size", None),
+            "chunk_overlap": getattr(self.splitter, "_chunk_overlap", None),
+            "section_min_chars": self.Constants.section_min_chars,
+            "section_max_chars": self.Constants.section_max_chars,
+        }
+
+    def ingest(self, sources: str | Iterable[str], prune: bool = True, rebuild: bool = False) -> dict[str, object]:
+        """Bring the vector store in line with the given files
+
+        Args:
+            sources (str | Iterable[str]): Files and/or directories; directories are searched recursively
+            prune (bool, optional): Remove the chunks of previously ingested files that are no longer among the sources. Defaults to True.
+            rebuild (bool, optional): Empty the whole collection first and index every file again; for stores
+                filled before the manifest existed, whose chunks can't be matched. Defaults to False.
+
+        Returns:
+            dict[str, object]: Counts of skipped/changed/removed files and added/deleted/kept chunks,
+                plus `timings` with the busy seconds of every stage and the wall time
+        """
+        start = time.perf_counter()
+        stats = dict.fromkeys(("files_skipped", "files_changed", "files_removed", "chunks_added", "chunks_deleted", "chunks_kept"), 0)
+        timings = dict.fromkeys(("parse", "embed", "index", "wait"), 0.0)
+        paths = self.expand_sources(sources)
+
+        settings = self.settings
+        if rebuild:
+            self.vectordb.reset_collection()
+            self.manifest.files = {}
+        elif self.manifest.files and self.__store_size() == 0:
+            ## The store was wiped or replaced since the manifest was written
+            self.manifest.files = {}
+        elif not self.manifest.exists and self.__store_size():
+            ## Chunks indexed before the manifest existed have random IDs and can't be matched; they stay
+            print("No ingestion manifest for a non-empty store; chunks indexed without it are kept, ingest with rebuild=True to replace them")
+        elif self.manifest.settings != settings:
+            print("Splitter settings changed, re-chunking every document")
+        self.manifest.settings = settings
+        prefix = json.dumps(settings, sort_keys=True)
+
+        lock = threading.Lock()
+        slots = threading.BoundedSemaphore(self.max_pending_batches)
+        pending: dict[str, list] = {} # path -> [batches left, digest, chunk IDs, stale IDs]
+        errors: list[BaseException] = []
+
+        ## Run on the pools; `instrumentation.wrap` keeps the caller's request and span on them
+        @instrumentation.wrap
+        def finish(path: str) -> None:
+            _, digest, ids, stale = pending.pop(path)
+            if stale:
+                self.vectordb.delete(ids=list(stale))
+            self.manifest.files[path] = { "sha256": digest, "settings": settings, "chunks": ids }
+            self.manifest.save()
+
+        @instrumentation.wrap
+        def index(path: str, batch: list[tuple[str, str, dict]], vectors: Future) -> None:
+            ## Runs on the single indexing thread, so writes and manifest updates are serialised
+            try:
+                if vectors.exception() is not None:
+                    raise vectors.exception()
+                t0 = time.perf_counter()
+                self.__add(batch, vectors.result())
+                with lock:
+                    timings["index"] += time.perf_counter() - t0
+                    pending[path][0] -= 1
+                    done = pending[path][0] == 0
+                if done:
+                    finish(path)
+            except BaseException as e:
+                errors.append(e)
+            finally:
+                slots.release()
+
+        @instrumentation.wrap
+        def embed(batch: list[tuple[str, str, dict]]) -> list[list[float]]:
+            t0 = time.perf_counter()
+            vectors = self.vectordb.embeddings.embed_documents([text for _, text, _ in batch])
+            with lock:
+                timings["embed"] += time.perf_counter() - t0
+            return vectors
+
+        parsed = self.__parse_all(paths, prefix)
+        with ThreadPoolExecutor(self.embed_workers) as embed_pool, ThreadPoolExecutor(1) as index_pool:
+            try:
+                for path, digest, chunks, elapsed in parsed:
+                    timings["parse"] += elapsed
+                    entry = self.manifest.files.get(path)
+                    if chunks is None:
+                        stats["files_skipped"] += 1
+                        stats["chunks_kept"] += len(entry["chunks"])
+                        continue
+
+                    ids = [chunk_id for chunk_id, _, _ in chunks]
+                    old_ids = set(entry["chunks"]) if entry is not None else set()
+                    new_chunks = [chunk for chunk in chunks if chunk[0] not in old_ids]
+                    stale = old_ids.difference(ids)
+                    batches = [new_chunks[i:i + self.batch_size] for i in range(0, len(new_chunks), self.batch_size)]
+
+                    stats["files_changed"] += 1
+                    stats["chunks_added"] += len(new_chunks)
+                    stats["chunks_deleted"] += len(stale)
+                    stats["chunks_kept"] += len(ids) - len(new_chunks)
+                    with lock:
+                        pending[path] = [len(batches), digest, ids, stale]
+                    if not batches:
+                        index_pool.submit(lambda path=path: finish(path))
+                    for batch in batches:
+                        ## Backpressure; parsing stalls while too many batches wait for embedding or indexing
+                        t0 = time.perf_counter()
+                        slots.acquire()
+                        timings["wait"] += time.perf_counter() - t0
+                        vectors = embed_pool.submit(embed, batch)
+                        vectors.add_done_callback(lambda vectors, path=path, batch=batch: index_pool.submit(index, path, batch, vectors))
+                    if errors:
+                        break
+            finally:
+                parsed.close() # Shuts the parse pool down
+                embed_pool.shutdown()
+        if errors:
+            raise errors[0]
+
+        if prune:
+            for path in set(self.manifest.files).difference(paths):
+                stale = self.manifest.files.pop(path)["chunks"]
+                if stale:
+                    self.vectordb.delete(ids=stale)
+                stats["files_removed"] += 1
+                stats["chunks_deleted"] += len(stale)
+        self.manifest.save()
+
+        timings["wall"] = time.perf_counter() - start
+        stats["timings"] = { stage: round(seconds, 3) for stage, seconds in timings.items() }
+        print(f"Ingestion finished in {timings['wall']:.2f}s:", stats)
+        return stats
+
+    def split(self, path: str) -> list[Document]:
+        '''
+        Load a file and split it into chunks carrying their deterministic IDs (`Document.id`).
+        '''
+        prefix = json.dumps(self.settings, sort_keys=True)
+        return [
+            Document(page_content=text, metadata=metadata, id=chunk_id)
+            for chunk_id, text, metadata in self.split_file(path, prefix, self.splitter)
+        ]
+
+    @classmethod
+    def split_file(cls, path: str, prefix: str, splitter: TextSplitter) -> list[tuple[str, str, dict]]:
+        chunks = []
+        seen: dict[str, int] = {}
+        prefix = json.dumps([path, prefix])
+        for doc in cls.load(path):
+            for section in cls.sections(doc.page_content):
+                for text in splitter.split_text(section):
+                    chunks.append((cls.chunk_id(prefix, text, seen), text, dict(doc.metadata)))
+        return chunks
+
+    @staticmethod
+    def chunk_id(prefix: str, text: str, seen: dict[str, int]) -> str:
+        ## Identical chunks of a file are told apart by their occurrence number
+        digest = hashlib.sha256(f"{prefix}\0{text}".encode()).hexdigest()
+        occurrence = seen.get(digest, 0)
+        seen[digest] = occurrence + 1
+        return digest if occurrence == 0 else f"{digest}-{occurrence}"
+
+    @classmethod
+    def sections(cls, text: str) -> list[str]:
+        '''
+        Group paragraphs into sections. A section closes after a paragraph whose
+        checksum hits 0 mod `section_boundary` once it holds `section_min_chars`,
+        or unconditionally at `section_max_chars`. Boundaries depend only on nearby
+        content, so they resynchronise right after an edit.
+        '''
+        sections = []
+        current, size = [], 0
+        for paragraph in re.split(r"\n\s*\n", text):
+            if not paragraph.strip():
+                continue
+            current.append(paragraph)
+            size += len(paragraph)
+            if size >= cls.Constants.section_max_chars or (
+                size >= cls.Constants.section_min_chars
+                and zlib.crc32(paragraph.encode()) % cls.Constants.section_boundary == 0
+            ):
+                sections.append("\n\n".join(current))
+                current, size = [], 0
+        if current:
+            sections.append("\n\n".join(current))
+        return sections
+
+    @staticmethod
+    def load(path: str) -> list[Document]:
+        if path.endswith(".docx"):
+            from langchain_community.document_loaders import Docx2txtLoader
+            return Docx2txtLoader(path).load()
+        from langchain_community.document_loaders import TextLoader
+        return TextLoader(path, encoding="utf-8").load()
+
+    @classmethod
+    def expand_sources(cls, sources: str | Iterable[str]) -> list[str]:
+        if isinstance(sources, str):
+            sources = [sources]
+        paths = []
+        for source in sources:
+            if os.path.isdir(source):
+                for root, _, files in os.walk(source):
+                    paths.extend(
+                        os.path.join(root, name) for name in files
+                        if os.path.splitext(name)[1].lower() in cls.Constants.extensions
+                    )
+            else:
+                paths.append(source)
+        return sorted({ os.path.abspath(path) for path in paths })
+
+    @staticmethod
+    def file_digest(path: str) -> str:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def __parse_all(self, paths: list[str], prefix: str):
+        '''
+        Yield (path, digest, chunks or None if unchanged, seconds) in path order. Files are hashed here;
+        changed ones go to the process pool, started for the first of them, at most two per worker at a time.
+        '''
+        known = { path: entry["sha256"] for path, entry in self.manifest.files.items() if entry.get("settings") == self.manifest.settings }
+        _init_worker(self.splitter)
+        pool = None
+        window: deque[tuple | Future] = deque() # Results and pending parses, in path order
+        try:
+            for path in paths:
+                start = time.perf_counter()
+                digest = self.file_digest(path)
+                if digest == known.get(path):
+                    window.append((path, digest, None, time.perf_counter() - start))
+                elif self.parse_workers <= 0:
+                    window.append(_parse_file(path, digest, prefix))
+                else:
+                    if pool is None:
+                        pool = ProcessPoolExecutor(
+                            self.parse_workers,
+                            mp_context=multiprocessing.get_context("spawn"),
+                            initializer=_init_worker,
+                            initargs=(self.splitter,),
+                        )
+                    window.append(pool.submit(_parse_file, path, digest, prefix))
+                while window and (not isinstance(window[0], Future) or len(window) >= self.parse_workers * 2):
+                    item = window.popleft()
+                    yield item.result() if isinstance(item, Future) else item
+            while window:
+                item = window.popleft()
+                yield item.result() if isinstance(item, Future) else item
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+
+    def __store_size(self) -> int | None:
+        if hasattr(self.vectordb, "_collection"): # Chroma
+            return self.vectordb._collection.count()
+        count = getattr(self.vectordb, "count", None)
+        return count() if callable(count) else None
+
+    def __add(self, batch: list[tuple[str, str, dict]], vectors: list[list[float]]) -> None:
+        '''
+        Write chunks with precomputed embeddings, so the store doesn't embed them again.
+        '''
+        ids = [chunk_id for chunk_id, _, _ in batch]
+        texts = [text for _, text, _ in batch]
+        metadatas = [metadata for _, _, metadata in batch]
+        add_embeddings = getattr(self.vectordb, "add_embeddings", None)
+        if add_embeddings is not None:
+            add_embeddings(list(zip(texts, vectors)), metadatas=metadatas, ids=ids)
+        elif hasattr(self.vectordb, "_collection"): # Chroma
+            self.vectordb._collection.upsert(ids=ids, embeddings=vectors, documents=texts, metadatas=metadatas)
+        else:
+            self.vectordb.add_documents([Document(page_content=text, metadata=metadata) for text, metadata in zip(texts, metadatas)], ids=ids)
+
+    class Constants:
+        manifest_name = "ingest_manifest.json"
+        extensions = (".docx", ".txt", ".md")
+        section_min_chars = 1500
+        section_max_chars = 6000
+        section_boundary = 4 # A section closes on ~1 in 4 paragraphs once past the minimum size
+
+## Process pool workers; the splitter is sent once per worker instead of once per file
+_worker_splitter: TextSplitter | None = None
+
+def _init_worker(splitter: TextSplitter) -> None:
+    global _worker_splitter
+    _worker_splitter = splitter
+
+def _parse_file(path: str, digest: str, prefix: str) -> tuple[str, str, list, float]:
+    start = time.perf_counter()
+    chunks = DocumentIngestor.split_file(path, prefix, _worker_splitter)
+    return path, digest, chunks, time.perf_counter() - start
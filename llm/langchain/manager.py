@@ -1,41 +1,258 @@
 from langchain_core.output_parsers import BaseOutputParser
+from langchain_core.language_models import BaseChatModel
 
-## Huggingface Libraries
-from langchain_huggingface import HuggingFaceEndpoint, ChatHuggingFace
+from .batching import MicroBatcher
+from .callbacks import instrumentation_callback
+from .parsers import ChatOutputParser, DeepseekOutputParser
+from .router import ModelRouter
 
-## Third-Party Integrations
-from langchain_ollama import ChatOllama
-from langchain_groq import ChatGroq
+from typing import Any, Callable
+import asyncio
+import httpx
+import threading
+import time
 
-from .parsers import ChatOutputParser, DeepseekOutputParser
+class ModelRegistry:
+    '''
+    Thread-safe registry of chat model clients keyed by (interface, model_id, params).
+
+    A client is built once and shared by every chain asking for the same key,
+    together with its keep-alive connections. Interfaces whose SDK accepts an
+    HTTP client (groq) get one pooled `httpx` client pair per interface, shared
+    across all their models.
+    '''
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__building: dict[tuple, threading.Lock] = {}
+        self.__clients: dict[tuple, BaseChatModel] = {}
+        self.__uses: dict[tuple, int] = {}
+        self.__http_clients: dict[str, tuple[httpx.Client, httpx.AsyncClient]] = {}
+        self.__closing: set[asyncio.Task] = set() # Keeps the closing tasks of `clear` alive
+        self.__counters = { "hits": 0, "misses": 0, "build_seconds": 0.0 }
+
+    @staticmethod
+    def key(interface: str, model_id: str, params: dict[str, Any]) -> tuple:
+        return (interface, model_id, tuple(sorted((name, repr(value)) for name, value in params.items())))
+
+    def get(self, interface: str, model_id: str, params: dict[str, Any], factory: Callable[[], BaseChatModel]) -> BaseChatModel:
+        key = self.key(interface, model_id, params)
+        with self.__lock:
+            if key in self.__clients:
+                self.__counters["hits"] += 1
+                self.__uses[key] += 1
+                return self.__clients[key]
+            building = self.__building.setdefault(key, threading.Lock())
+        ## Build outside the registry lock; concurrent callers of the same key wait for one build
+        with building:
+            with self.__lock:
+                if key in self.__clients:
+                    self.__counters["hits"] += 1
+                    self.__uses[key] += 1
+                    return self.__clients[key]
+            start = time.perf_counter()
+            client = factory()
+            with self.__lock:
+                self.__counters["misses"] += 1
+                self.__counters["build_seconds"] += time.perf_counter() - start
+                self.__clients[key] = client
+                self.__uses[key] = 1
+                self.__building.pop(key, None)
+            return client
+
+    def http_clients(self, interface: str) -> tuple[httpx.Client, httpx.AsyncClient]:
+        '''
+        Pooled keep-alive HTTP clients (sync, async) shared by every model of an interface.
+        '''
+        with self.__lock:
+            if interface not in self.__http_clients:
+                limits = httpx.Limits(
+                    max_connections=self.Constants.max_connections,
+                    max_keepalive_connections=self.Constants.max_keepalive_connections,
+                    keepalive_expiry=self.Constants.keepalive_expiry,
+                )
+                self.__http_clients[interface] = (
+                    httpx.Client(limits=limits, timeout=self.Constants.timeout),
+                    httpx.AsyncClient(limits=limits, timeout=self.Constants.timeout),
+                )
+            return self.__http_clients[interface]
+
+    def stats(self) -> dict[str, object]:
+        with self.__lock:
+            stats = dict(self.__counters)
+            stats["instances"] = len(self.__clients)
+            stats["uses"] = {}
+            for (interface, model_id, _), uses in self.__uses.items():
+                label = f"{interface}:{model_id}"
+                stats["uses"][label] = stats["uses"].get(label, 0) + uses
+            stats["connection_pools"] = len(self.__http_clients)
+            stats["open_connections"] = sum(
+                len(getattr(getattr(client._transport, "_pool", None), "connections", []))
+                for pair in self.__http_clients.values() for client in pair
+            )
+        return stats
+
+    def clear(self) -> None:
+        '''
+        Drop every client and close the connection pools. Inside a running event loop the
+        async clients are closed by a task of that loop; prefer `aclose` there.
+        '''
+        http_clients = self.__detach()
+        for sync_client, _ in http_clients:
+            sync_client.close()
+        async_clients = [async_client for _, async_client in http_clients]
+        if not async_clients:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            asyncio.run(self.__aclose(async_clients))
+        else:
+            task = loop.create_task(self.__aclose(async_clients))
+            self.__closing.add(task)
+            task.add_done_callback(self.__closing.discard)
+
+    async def aclose(self) -> None:
+        '''
+        Drop every client and close the connection pools, awaiting the async clients.
+        '''
+        http_clients = self.__detach()
+        for sync_client, _ in http_clients:
+            sync_client.close()
+        await self.__aclose([async_client for _, async_client in http_clients])
+
+    def __detach(self) -> list[tuple[httpx.Client, httpx.AsyncClient]]:
+        with self.__lock:
+            self.__clients.clear()
+            self.__uses.clear()
+            http_clients = list(self.__http_clients.values())
+            self.__http_clients.clear()
+        return http_clients
+
+    @staticmethod
+    async def __aclose(async_clients: list[httpx.AsyncClient]) -> None:
+        await asyncio.gather(*(client.aclose() for client in async_clients))
+
+    class Constants:
+        max_connections = 100
+        max_keepalive_connections = 20
+        keepalive_expiry = 60.0 # Seconds an idle connection is kept open
+        timeout = 120.0
 
 class LLMManager:
+    registry = ModelRegistry() # Shared by every manager of the process
+
     def load_default(self, key: str):
         if key not in self.Constants.default_settings:
             raise Exception("No such key available!! Please check once again!!")
         model_id = self.Constants.default_settings[key]["llm"]
-        llm = self.load_llm(model_id, self.Constants.default_settings[key]["interface"])
+        if self.Constants.default_settings[key]["interface"] == "auto":
+            llm = self.load_router(model_id)
+        else:
+            llm = self.load_llm(model_id, self.Constants.default_settings[key]["interface"])
         parser = self.load_parser_from_settings(key)
         return llm, parser
     
-    def load_llm(self, model_id: str, interface: str):
+    def load_llm(self, model_id: str, interface: str, **params: Any) -> BaseChatModel:
+        """Get the chat model client; clients are built once per (interface, model_id, params) and reused
+
+        Args:
+            model_id (str): Model ID on the interface
+            interface (str): One of "huggingface", "ollama" or "groq"
+            **params: Extra constructor arguments of the client, e.g. temperature
+
+        Returns:
+            BaseChatModel: Shared chat model client
+        """
+        if interface not in ("huggingface", "ollama", "groq"):
+            raise Exception("No such interface available!! Please check once again!!")
+        return self.registry.get(interface, model_id, params, lambda: self.__build_llm(model_id, interface, params))
+
+    def load_router(self, model: str, **params: Any) -> ModelRouter:
+        """Get a router over every interface serving a model of `Constants.llm_models`
+
+        Args:
+            model (str): Logical model name, e.g. "deepseek-r1:1.5b"
+            **params: Extra constructor arguments of the backend clients
+
+        Returns:
+            ModelRouter: Shared router, sending each request to the fastest healthy backend
+        """
+        if model not in self.Constants.llm_models:
+            raise Exception("No such model available!! Please check once again!!")
+        backends = self.Constants.llm_models[model]
+        return self.registry.get("auto", model, params, lambda: ModelRouter(
+            backends={ interface: self.load_llm(model_id, interface, **params) for interface, model_id in backends.items() }
+        ))
+
+    def load_batcher(self, model_id: str, interface: str, max_batch_size: int = 8, max_wait: float = 0.01, **params: Any) -> MicroBatcher:
+        """Get a micro-batcher sending concurrent requests to a model of `load_llm` in batches
+
+        Args:
+            model_id (str): Model ID on the interface
+            interface (str): One of "huggingface", "ollama" or "groq"
+            max_batch_size (int): Requests per batch
+            max_wait (float): Seconds the first request of a batch waits for more
+            **params: Extra constructor arguments of the client
+
+        Returns:
+            MicroBatcher: Shared batcher; use its invoke/ainvoke like the model's
+        """
+        chat = self.load_llm(model_id, interface, **params)
+        batching = { **params, "max_batch_size": max_batch_size, "max_wait": max_wait }
+        return self.registry.get(f"batch:{interface}", model_id, batching, lambda: MicroBatcher(
+            chat, max_batch_size=max_batch_size, max_wait=max_wait
+        ))
+
+    def warm_up(self, keys: list[str] | None = None) -> None:
+        '''
+        Build the clients of the given default settings (all by default) ahead of the first
+        request; Ollama models are also loaded into the server's memory.
+        '''
+        for key in keys if keys is not None else self.Constants.default_settings:
+            settings = self.Constants.default_settings[key]
+            if settings["interface"] == "auto":
+                self.load_router(settings["llm"])
+                continue
+            chat = self.load_llm(settings["llm"], settings["interface"])
+            if settings["interface"] == "ollama":
+                import ollama
+                try:
+                    ## A generate request without a prompt only loads the model
+                    ollama.Client(host=chat.base_url).generate(model=settings["llm"], keep_alive=chat.keep_alive)
+                except Exception as e:
+                    print(f"Warm-up of {settings['llm']} failed:", e)
+
+    def __build_llm(self, model_id: str, interface: str, params: dict[str, Any]) -> BaseChatModel:
+        ## Provider SDKs are imported here, so a worker only loads the one it uses
+        ## Generation spans and token counts; the callback does nothing while instrumentation is off
+        callbacks = {} if "callbacks" in params else { "callbacks": [instrumentation_callback] }
         if interface == "huggingface":
+            from langchain_huggingface import HuggingFaceEndpoint, ChatHuggingFace
             llm = HuggingFaceEndpoint(
                 repo_id=model_id,
                 task="text-generation",
+                **params,
             )
-            chat = ChatHuggingFace(llm=llm, verbose=False)
+            chat = ChatHuggingFace(llm=llm, verbose=False, **callbacks)
             return chat
         elif interface == "ollama":
+            from langchain_ollama import ChatOllama
             return ChatOllama(
                 model=model_id,
+                **params,
+                **callbacks,
             )
-        elif interface == "groq":
+        else:
+            from langchain_groq import ChatGroq
+            http_client, http_async_client = self.registry.http_clients("groq")
             return ChatGroq(
-                model_name=model_id
+                model_name=model_id,
+                http_client=http_client,
+                http_async_client=http_async_client,
+                **params,
+                **callbacks,
             )
-        else:
-            raise Exception("No such interface available!! Please check once again!!")
     
     def load_parser_from_settings(self, key: str) -> BaseOutputParser:
         default_parser: BaseOutputParser = self.Constants.default_settings[key]["parser"]
@@ -76,6 +293,7 @@ class LLMManager:
             }
         }
 
+        ## "interface": "auto" routes "llm", a key of llm_models, across all of its interfaces
         default_settings = {
             "virtual_assistant":{
                 "interface": "groq",
@@ -0,0 +1,229 @@
+from langchain_classic.base_memory import BaseMemory
+from langchain_core.chat_history import BaseChatMessageHistory
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage, get_buffer_string
+from langchain_core.runnables import Runnable
+from pydantic import PrivateAttr
+
+from collections import deque
+from typing import Any, Callable
+import threading
+
+def approximate_tokens(text: str) -> int:
+    '''
+    Token estimate of about four characters per token, close enough for English with the Llama and GPT tokenizers.
+    '''
+    return (len(text) + TokenWindowMemory.Constants.chars_per_token - 1) // TokenWindowMemory.Constants.chars_per_token
+
+def last_messages(history: BaseChatMessageHistory, k: int) -> list[BaseMessage]:
+    '''
+    Last `k` messages of a history; only the tail is read from histories having `get_last_messages`
+    (`FileChatMessageHistory`, `FirebaseMessageHistory`), the others are read whole.
+    '''
+    get_last_messages = getattr(history, "get_last_messages", None)
+    if get_last_messages is not None:
+        return get_last_messages(k)
+    return history.messages[-k:] if k > 0 else []
+
+class TokenWindowMemory(BaseMemory):
+    '''
+    Conversation memory sending a bounded prompt whatever the length of the chat.
+
+    The prompt holds the pinned messages (the system prompt stored at the start
+    of the history), an optional rolling summary of older turns, and the most
+    recent messages that fit in `max_token_limit` tokens along with them. Token
+    counts are computed once per message as it enters the window, which always
+    opens on a human message.
+
+    Only the tail of the history is read (see `last_messages`), so it works the
+    same with `FileChatMessageHistory` and `FirebaseMessageHistory`. With a
+    `summarizer` model, messages leaving the window are folded into the summary
+    a few turns at a time: the model only sees the previous summary and the
+    evicted lines, so the cost of an update doesn't grow with the chat either.
+    The summary is not written to the history: a new memory over the same
+    history starts without it.
+    '''
+    chat_memory: BaseChatMessageHistory
+    pinned: list[BaseMessage] = []
+    max_token_limit: int = 2000
+    summarizer: Runnable | None = None
+    max_summary_tokens: int = 300
+    summary: str = ""
+    token_counter: Callable[[str], int] = approximate_tokens
+    memory_key: str = "history"
+    input_key: str | None = None
+    return_messages: bool = False
+    human_prefix: str = "Human"
+    ai_prefix: str = "AI"
+
+    _window: deque = PrivateAttr(default_factory=deque) # (message, tokens), oldest first
+    _window_tokens: int = PrivateAttr(default=0)
+    _evicted: list = PrivateAttr(default_factory=list) # Messages waiting to be folded into the summary
+    _pinned_tokens: int | None = PrivateAttr(default=None)
+    _loaded: bool = PrivateAttr(default=False)
+    _lock: threading.RLock = PrivateAttr(default_factory=threading.RLock)
+
+    @property
+    def memory_variables(self) -> list[str]:
+        return [self.memory_key]
+
+    def load_memory_variables(self, inputs: dict[str, Any]) -> dict[str, Any]:
+        messages = self.buffer()
+        if self.return_messages:
+            return { self.memory_key: messages }
+        return { self.memory_key: get_buffer_string(messages, human_prefix=self.human_prefix, ai_prefix=self.ai_prefix) }
+
+    def save_context(self, inputs: dict[str, Any], outputs: dict[str, str]) -> None:
+        input_key = self.input_key or next(key for key in inputs if key not in (self.memory_key, "stop"))
+        output_key = next(iter(outputs)) if len(outputs) == 1 else "response"
+        messages = [HumanMessage(content=inputs[input_key]), AIMessage(content=outputs[output_key])]
+        with self._lock:
+            self.__load()
+            self.chat_memory.add_messages(messages)
+            for message in messages:
+                self.__push(message)
+            self.__trim()
+            self.__fold()
+
+    def clear(self) -> None:
+        with self._lock:
+            self.chat_memory.clear()
+            self.summary = ""
+            self._window.clear()
+            self._window_tokens = 0
+            self._evicted.clear()
+            self._loaded = False
+
+    def buffer(self) -> list[BaseMessage]:
+        '''
+        Messages sent to the model: pinned, summary, recent window.
+        '''
+        with self._lock:
+            self.__load()
+            summary = [SystemMessage(content=self.Constants.summary_prefix + self.summary)] if self.summary else []
+            return list(self.pinned) + summary + [message for message, _ in self._window]
+
+    def prompt_tokens(self) -> int:
+        with self._lock:
+            self.__load()
+            return self.__fixed_tokens() + self._window_tokens
+
+    ## Window
+
+    def __load(self) -> None:
+        '''
+        Fill the window from the tail of the history, reading more only while the budget isn't met.
+        '''
+        if self._loaded:
+            return
+        fetch = self.Constants.initial_fetch
+        while True:
+            messages = last_messages(self.chat_memory, fetch)
+            exhausted = len(messages) < fetch
+            if exhausted:
+                messages = messages[len(self.pinned):] # The pinned messages open the history
+            budget = self.max_token_limit - self.__fixed_tokens()
+            window, tokens = deque(), 0
+            for message in reversed(messages):
+                count = self.__count(message)
+                if tokens + count > budget:
+                    break
+                window.appendleft((message, count))
+                tokens += count
+            ## Done once the window stops before the fetched range, clear of the pinned messages
+            if exhausted or len(window) + len(self.pinned) < len(messages):
+                break
+            fetch *= 2
+        self._window, self._window_tokens = window, tokens
+        self.__align()
+        self._loaded = True
+
+    def __push(self, message: BaseMessage) -> None:
+        count = self.__count(message)
+        self._window.append((message, count))
+        self._window_tokens += count
+
+    def __trim(self) -> None:
+        budget = self.max_token_limit - self.__fixed_tokens()
+        if self._window_tokens <= budget:
+            return
+        if self.summarizer is not None:
+            ## Evict a few turns at once, so the summary is updated every few turns instead of every turn
+            budget = int(budget * self.Constants.low_water)
+        while self._window and self._window_tokens > budget:
+            message, count = self._window.popleft()
+            self._window_tokens -= count
+            self._evicted.append(message)
+        self._evicted.extend(self.__align())
+        if self.summarizer is None:
+            self._evicted.clear()
+
+    def __align(self) -> list[BaseMessage]:
+        '''
+        Drop the messages opening the window before its first human message (an answer without its question).
+        '''
+        dropped = []
+        while self._window and not isinstance(self._window[0][0], HumanMessage):
+            message, count = self._window.popleft()
+            self._window_tokens -= count
+            dropped.append(message)
+        return dropped
+
+    ## Summary
+
+    def __fold(self) -> None:
+        if self.summarizer is None or not self._evicted:
+            return
+        lines = get_buffer_string(self._evicted, human_prefix=self.human_prefix, ai_prefix=self.ai_prefix)
+        try:
+            result = self.summarizer.invoke(self.Constants.summary_prompt.format(summary=self.summary or "(empty)", new_lines=lines))
+        except Exception as e:
+            print("Summary update failed:", e)
+            ## Evicted lines are folded with the next ones, up to a window's worth
+            while len(self._evicted) > 1 and sum(self.__count(message) for message in self._evicted) > self.max_token_limit:
+                self._evicted.pop(0)
+            return
+        summary = result.content if isinstance(result, BaseMessage) else str(result)
+        ## Reasoning models think first; keep only the answer
+        summary = summary.split("</think>")[-1].strip()
+        self.summary = self.__truncate(summary, self.max_summary_tokens)
+        self._evicted.clear()
+        ## A longer summary leaves less room for the window; what it pushes out is folded next time
+        self.__trim()
+
+    def __truncate(self, text: str, tokens: int) -> str:
+        if self.token_counter(text) <= tokens:
+            return text
+        words = text.split()
+        low, high = 0, len(words)
+        while low < high:
+            middle = (low + high + 1) // 2
+            if self.token_counter(" ".join(words[:middle])) <= tokens:
+                low = middle
+            else:
+                high = middle - 1
+        return " ".join(words[:low])
+
+    ## Tokens
+
+    def __fixed_tokens(self) -> int:
+        if self._pinned_tokens is None:
+            self._pinned_tokens = sum(self.__count(message) for message in self.pinned)
+        summary = self.token_counter(self.Constants.summary_prefix + self.summary) + self.Constants.message_overhead if self.summary else 0
+        return self._pinned_tokens + summary
+
+    def __count(self, message: BaseMessage) -> int:
+        return self.token_counter(message.content if isinstance(message.content, str) else str(message.content)) + self.Constants.message_overhead
+
+    class Constants:
+        chars_per_token = 4
+        message_overhead = 4 # Role prefix and separators of a message
+        initial_fetch = 32 # Messages read when filling the window; doubled until the budget is met
+        low_water = 0.75 # With a summarizer, the window is trimmed to this share of its budget
+        summary_prefix = "Summary of the earlier conversation: "
+        summary_prompt = (
+            "Progressively summarize the lines of conversation provided, adding onto the previous summary. "
+            "Keep names, facts and open questions; be brief.\n\n"
+            "Current summary:\n{summary}\n\n"
+            "New lines of conversation:\n{new_lines}\n\n"
+            "New summary:"
+        )
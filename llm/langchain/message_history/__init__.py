@@ -1 +1,2 @@
-from .filechat import FileChatMessageHistory
\ No newline at end of file
+from .filechat import FileChatMessageHistory
+from .cache import MessageCache, message_cache
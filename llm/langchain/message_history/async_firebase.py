@@ -0,0 +1,144 @@
+from langchain_core.chat_history import BaseChatMessageHistory
+from langchain_core.messages.base import BaseMessage
+
+from google.cloud.firestore_v1.async_transaction import async_transactional
+
+from .sharding import ShardedLayout
+from .firebase import FirebaseMessageHistory
+from ....db.firebase.async_firestore import AsyncFirestoreInstance, AsyncFirestoreUtil
+from ....instrumentation import instrumentation
+
+from datetime import datetime
+import asyncio
+
+
+class AsyncFirebaseMessageHistory(ShardedLayout, BaseChatMessageHistory):
+    '''
+    Asyncio counterpart of `FirebaseMessageHistory` on Firestore's `AsyncClient`.
+
+    Uses the same document layout (`ShardedLayout`), so both classes can serve
+    the same conversations. Implements LangChain's `aget_messages`/
+    `aadd_messages`/`aclear`. The sync `messages`/`add_messages`/`clear` fall
+    back to a `FirebaseMessageHistory` of the same conversation on the sync
+    client, for sync runnables; they block, so don't call them from a coroutine.
+    '''
+    storage_path:  str
+    key: str
+    uid: str
+    shard_size: int | None
+    db_interface: AsyncFirestoreUtil
+
+    def __init__(self, key: str, uid: str, shard_size: int | None = 200):
+        self.storage_path = "history"
+        self.uid = uid
+        self.key = key
+        self.shard_size = shard_size
+        self.db_interface = AsyncFirestoreUtil()
+        self.doc_ref = None
+        self.db_data = None
+        self.meta = None
+        self.__lock = asyncio.Lock()
+        self.__sync = None
+
+    ## Sync fallback; either side reloads the layout after the other one wrote
+
+    @property
+    def messages(self):
+        return self.__sync_history().messages
+
+    def add_messages(self, messages: list[BaseMessage]) -> None:
+        self.__sync_history().add_messages(messages)
+        self.meta = None
+
+    def clear(self):
+        self.__sync_history().clear()
+        self.meta = None
+
+    async def aget_messages(self) -> list[BaseMessage]:
+        return await self.aget_last_messages()
+
+    @instrumentation.traced("history.firebase_async.get_last_messages")
+    async def aget_last_messages(self, k: int | None = None) -> list[BaseMessage]:
+        """Fetch the latest messages; only the buckets holding them are read
+
+        Args:
+            k (int | None, optional): Number of messages to be returned. Defaults to None (all messages).
+
+        Returns:
+            list[BaseMessage]: Up to `k` most recent messages, oldest first
+        """
+        try:
+            async with self.__lock:
+                await self.__load()
+                count = self.meta["count"]
+                first = 0 if k is None else max(0, count - k)
+                if first >= count:
+                    return []
+                shards = []
+                refs = [self._shard_ref(shard) for shard in self._shards_from(first)]
+                if refs:
+                    async for snapshot in AsyncFirestoreInstance().get_all(refs):
+                        if snapshot.exists:
+                            shards.append(snapshot.to_dict())
+                return self.messages_from_dict(self._collect(first, shards))
+        except Exception as e:
+            print(e)
+            return []
+
+    @instrumentation.traced("history.firebase_async.add_messages")
+    async def aadd_messages(self, messages: list[BaseMessage]) -> None:
+        for msg in messages:
+            msg.timestamp = datetime.now()
+        if not messages:
+            return
+        try:
+            async with self.__lock:
+                if self.meta is None:
+                    await self.__load()
+                serialized = self.messages_to_dict(messages, start=self.meta["count"] + 1)
+                first_bucket = await self.__transact(lambda transaction: self._append(transaction, serialized))
+                self.db_data[self.key].extend(first_bucket)
+                self.__synced()
+        except Exception as e:
+            print(e)
+            self.meta = None # Reload the layout before the next write
+
+    @instrumentation.traced("history.firebase_async.clear")
+    async def aclear(self) -> None:
+        try:
+            async with self.__lock:
+                if self.meta is None:
+                    await self.__load()
+                await self.__transact(self._clear)
+                self.__synced()
+        except Exception as e:
+            print(e)
+
+    async def __load(self):
+        if self.doc_ref is None:
+            self.doc_ref = await self.db_interface.fetch_data(self.uid, self.storage_path, send_ref = True)
+        snapshot = await self.doc_ref.get()
+        self._read_layout(snapshot.to_dict() if snapshot.exists else None)
+        if not snapshot.exists:
+            await self.doc_ref.set(self.db_data)
+
+    async def __transact(self, write):
+        '''
+        Re-read the layout and add `write(transaction)` in a transaction, retried on conflicts.
+        '''
+        @async_transactional
+        async def run(transaction):
+            snapshot = await self.doc_ref.get(transaction=transaction)
+            self._read_layout(snapshot.to_dict() if snapshot.exists else None)
+            return write(transaction)
+
+        return await run(AsyncFirestoreInstance().transaction())
+
+    def __sync_history(self) -> FirebaseMessageHistory:
+        if self.__sync is None:
+            self.__sync = FirebaseMessageHistory(self.key, self.uid, self.shard_size)
+        return self.__sync
+
+    def __synced(self) -> None:
+        if self.__sync is not None:
+            self.__sync.meta = None
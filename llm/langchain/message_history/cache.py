@@ -0,0 +1,121 @@
+from langchain_core.messages.base import BaseMessage
+
+from collections import OrderedDict
+import sys
+import threading
+
+
+class MessageCache:
+    '''
+    Process-wide LRU cache of deserialized chat histories.
+
+    Entries are stored against a validation stamp (e.g. the `(mtime_ns, size)` of
+    a session file). A lookup with a different stamp is a miss, so changes made
+    by other processes are picked up on the next read. Writers that know their
+    own change can extend an entry in place instead of dropping it.
+    '''
+    MESSAGE_OVERHEAD = 512 # Approx. bytes held by a message object besides its content
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        '''
+        Parameters
+        ----------
+        max_bytes : int
+            Memory budget of the cache; least recently used sessions are evicted beyond it.
+        '''
+        self.max_bytes = max_bytes
+        self.__entries: OrderedDict[str, tuple[object, list[BaseMessage], int]] = OrderedDict()
+        self.__bytes = 0
+        self.__lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str, stamp: object) -> list[BaseMessage] | None:
+        """Fetch cached messages of a session
+
+        Args:
+            key (str): Session key
+            stamp (object): Current validation stamp of the session
+
+        Returns:
+            list[BaseMessage] | None: Copy of the cached messages, None if missing or stale
+        """
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is None or entry[0] != stamp:
+                self.misses += 1
+                return None
+            self.__entries.move_to_end(key)
+            self.hits += 1
+            return list(entry[1])
+
+    def put(self, key: str, stamp: object, messages: list[BaseMessage]) -> None:
+        with self.__lock:
+            self.__store(key, stamp, list(messages))
+
+    def extend(self, key: str, old_stamp: object, new_stamp: object, messages: list[BaseMessage]) -> None:
+        '''
+        Append messages written by this process to a cached session. If the cached
+        entry doesn't match `old_stamp` someone else changed the session in between,
+        so the entry is dropped instead.
+        '''
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is None:
+                return
+            if entry[0] != old_stamp:
+                self.__remove(key)
+                return
+            self.__store(key, new_stamp, entry[1] + list(messages))
+
+    def invalidate(self, key: str) -> None:
+        with self.__lock:
+            self.__remove(key)
+
+    def resize(self, max_bytes: int) -> None:
+        with self.__lock:
+            self.max_bytes = max_bytes
+            self.__evict()
+
+    def clear(self) -> None:
+        with self.__lock:
+            self.__entries.clear()
+            self.__bytes = 0
+
+    def stats(self) -> dict[str, object]:
+        with self.__lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "sessions": len(self.__entries),
+                "bytes": self.__bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+    def __store(self, key: str, stamp: object, messages: list[BaseMessage]):
+        self.__remove(key)
+        size = sum(sys.getsizeof(message.content) + self.MESSAGE_OVERHEAD for message in messages)
+        if size > self.max_bytes:
+            return
+        self.__entries[key] = (stamp, messages, size)
+        self.__bytes += size
+        self.__evict()
+
+    def __remove(self, key: str):
+        entry = self.__entries.pop(key, None)
+        if entry is not None:
+            self.__bytes -= entry[2]
+
+    def __evict(self):
+        while self.__bytes > self.max_bytes and self.__entries:
+            _, (_, _, size) = self.__entries.popitem(last=False)
+            self.__bytes -= size
+            self.evictions += 1
+
+
+## Shared by every history in the process
+message_cache = MessageCache()
@@ -2,43 +2,175 @@ from langchain_core.chat_history import BaseChatMessageHistory
 from langchain_core.messages.base import BaseMessage
 from langchain_core.messages import HumanMessage, AIMessage
 
+from .cache import MessageCache, message_cache
+from ....instrumentation import instrumentation
+
 import json
 import os
+import struct
+import threading
 
 
 class FileChatMessageHistory(BaseChatMessageHistory):
+    '''
+    Chat history stored as an append-only log on local disk.
+
+    Every session is kept in two files inside ``storage_path``:
+
+    - ``<session_id>.jsonl``: one serialized message per line, only ever appended to.
+    - ``<session_id>.idx``: fixed-width byte offset of every line in the log.
+
+    Adding a message is a single append to both files, the message count is the
+    index size divided by the entry width and the last N messages are read by
+    seeking to their offsets. Sessions stored in the older ``<session_id>.json``
+    format are migrated on first access.
+
+    Parsed sessions are kept in a shared :class:`MessageCache`, validated against
+    the log's mtime and size, and extended in place by this process' own writes.
+    '''
     storage_path:  str
     session_id: str
+    fsync: bool
+    cache: MessageCache | None
 
-    def __init__(self, storage_path, session_id):
+    INDEX_ENTRY = struct.Struct("<Q") # Byte offset of a line in the log
+
+    ## Striped: sessions hash onto a fixed set of locks, so nothing grows with the number of sessions
+    __locks = tuple(threading.Lock() for _ in range(64))
+
+    def __init__(self, storage_path, session_id, fsync: bool = False, cache: MessageCache | None = message_cache):
+        '''
+        Parameters
+        ----------
+        storage_path : str
+            Directory holding the session files.
+        session_id : str
+            Session identifier; used as the file name.
+        fsync : bool
+            Force every append to disk before returning. Slower, but a message that
+            was added survives a power loss. Defaults to False.
+        cache : MessageCache | None
+            Cache for parsed sessions; defaults to the process-wide one. Send None to disable caching.
+        '''
         self.storage_path = storage_path
         self.session_id = session_id
+        self.fsync = fsync
+        self.cache = cache
+        with self.__lock():
+            self.__migrate_legacy()
+            self.__recover()
+
+    @property
+    def log_path(self) -> str:
+        return os.path.join(self.storage_path, self.session_id+".jsonl")
 
     @property
+    def index_path(self) -> str:
+        return os.path.join(self.storage_path, self.session_id+".idx")
+
+    @property
+    def legacy_path(self) -> str:
+        return os.path.join(self.storage_path, self.session_id+".json")
+
+    @property
+    @instrumentation.traced("history.file.messages")
     def messages(self):
-        try: 
-            with open(os.path.join(self.storage_path, self.session_id+".json"), 'r') as f:
-                messages = json.loads(f.read())
-            return self.messages_from_dict(messages)
+        try:
+            with open(self.log_path, 'rb') as f:
+                stamp = self.__stamp(os.fstat(f.fileno()))
+                if self.cache is not None:
+                    cached = self.cache.get(self.log_path, stamp)
+                    if cached is not None:
+                        return cached
+                ## Read up to the stamped size only, so the cached entry matches its stamp
+                messages = self.messages_from_dict(self.__parse_lines(f.read(stamp[1])))
         except FileNotFoundError:
             return []
-    
+        if self.cache is not None:
+            self.cache.put(self.log_path, stamp, messages)
+        return messages
+
+    def message_count(self) -> int:
+        '''
+        Number of stored messages; read from the index size without touching the log.
+        '''
+        try:
+            return os.path.getsize(self.index_path) // self.INDEX_ENTRY.size
+        except FileNotFoundError:
+            return 0
+
+    @instrumentation.traced("history.file.get_last_messages")
+    def get_last_messages(self, n: int) -> list[BaseMessage]:
+        """Fetch the last `n` messages without reading the whole log
+
+        Args:
+            n (int): Number of messages to be returned
+
+        Returns:
+            list[BaseMessage]: Up to `n` most recent messages, oldest first
+        """
+        if n <= 0:
+            return []
+        if self.cache is not None:
+            try:
+                cached = self.cache.get(self.log_path, self.__stamp(os.stat(self.log_path)))
+            except FileNotFoundError:
+                return []
+            if cached is not None:
+                return cached[-n:]
+        try:
+            with open(self.index_path, 'rb') as idx:
+                count = os.fstat(idx.fileno()).st_size // self.INDEX_ENTRY.size
+                if count == 0:
+                    return []
+                idx.seek(max(0, count - n) * self.INDEX_ENTRY.size)
+                (offset,) = self.INDEX_ENTRY.unpack(idx.read(self.INDEX_ENTRY.size))
+            with open(self.log_path, 'rb') as f:
+                f.seek(offset)
+                return self.messages_from_dict(self.__parse_lines(f.read()))
+        except FileNotFoundError:
+            return []
+
     def add_message(self, message):
         self.add_messages([message])
 
+    @instrumentation.traced("history.file.add_messages")
     def add_messages(self, messages: list[BaseMessage]) -> None:
-       all_messages = list(self.messages) # Existing messages
-       all_messages.extend(messages) # Add new messages
+        if not messages:
+            return
+        with self.__lock():
+            start = self.message_count() + 1
+            serialized = self.messages_to_dict(messages, start=start)
+            lines = [(json.dumps(dct) + "\n").encode("utf-8") for dct in serialized]
+
+            ## Log is written before the index; a crash in between is repaired by __recover
+            with open(self.log_path, 'ab') as f:
+                old_stamp = self.__stamp(os.fstat(f.fileno()))
+                offset = f.tell()
+                f.write(b"".join(lines))
+                self.__sync(f)
+                new_stamp = self.__stamp(os.fstat(f.fileno()))
 
-       serialized = self.messages_to_dict(all_messages)
-       # Can be further optimized by only writing new messages
-       # using append mode.
-       with open(os.path.join(self.storage_path, self.session_id+".json"), 'w') as f:
-           json.dump(serialized, f)
+            offsets = []
+            for line in lines:
+                offsets.append(self.INDEX_ENTRY.pack(offset))
+                offset += len(line)
+            with open(self.index_path, 'ab') as idx:
+                idx.write(b"".join(offsets))
+                self.__sync(idx)
 
+            if self.cache is not None:
+                self.cache.extend(self.log_path, old_stamp, new_stamp, messages)
+
+    @instrumentation.traced("history.file.clear")
     def clear(self):
-       with open(os.path.join(self.storage_path, self.session_id+".json"), 'w') as f:
-           f.write("[]")
+        with self.__lock():
+            for path in (self.index_path, self.log_path):
+                with open(path, 'wb') as f:
+                    self.__sync(f)
+                    stamp = self.__stamp(os.fstat(f.fileno()))
+            if self.cache is not None:
+                self.cache.put(self.log_path, stamp, [])
 
     def messages_from_dict(self, messages):
         final = []
@@ -49,11 +181,89 @@ class FileChatMessageHistory(BaseChatMessageHistory):
                 final.append(AIMessage(message["content"]))
         return final
 
-    
-    def messages_to_dict(self, messages):
+
+    def messages_to_dict(self, messages, start: int = 1):
         dct_list = []
-        for i in range(1, len(messages) + 1):
-            message = messages[i-1]
+        for i in range(start, len(messages) + start):
+            message = messages[i-start]
             key = "user" if type(message) is HumanMessage else "chatbot"
             dct_list.append({ "key":i, "index":i, "role":key, "content":message.content })
-        return dct_list
\ No newline at end of file
+        return dct_list
+
+    def __lock(self) -> threading.Lock:
+        return self.__locks[hash(os.path.abspath(self.log_path)) % len(self.__locks)]
+
+    def __stamp(self, stat: os.stat_result) -> tuple[int, int]:
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def __sync(self, f):
+        f.flush()
+        if self.fsync:
+            os.fsync(f.fileno())
+
+    def __parse_lines(self, data: bytes) -> list[dict]:
+        return [json.loads(line) for line in data.splitlines() if line]
+
+    def __migrate_legacy(self):
+        '''
+        Convert a `<session_id>.json` array into the log format. The log is moved into
+        place last, so an interrupted migration simply runs again on next access.
+        '''
+        if os.path.exists(self.log_path) or not os.path.exists(self.legacy_path):
+            return
+        with open(self.legacy_path, 'r') as f:
+            content = f.read().strip()
+        serialized = json.loads(content) if content else []
+
+        log_tmp, index_tmp = self.log_path + ".tmp", self.index_path + ".tmp"
+        offset = 0
+        with open(log_tmp, 'wb') as f, open(index_tmp, 'wb') as idx:
+            for dct in serialized:
+                line = (json.dumps(dct) + "\n").encode("utf-8")
+                f.write(line)
+                idx.write(self.INDEX_ENTRY.pack(offset))
+                offset += len(line)
+            f.flush()
+            idx.flush()
+            os.fsync(f.fileno())
+            os.fsync(idx.fileno())
+        os.replace(index_tmp, self.index_path)
+        os.replace(log_tmp, self.log_path)
+        os.remove(self.legacy_path)
+
+    def __recover(self):
+        '''
+        Bring the log and index back in sync after an interrupted append: drop torn
+        index entries and partially written lines, and index complete lines that were
+        logged but never indexed. Only the tail of both files is read.
+        '''
+        if not os.path.exists(self.log_path):
+            return
+        entry = self.INDEX_ENTRY.size
+        log_size = os.path.getsize(self.log_path)
+        with open(self.index_path, 'a+b') as idx, open(self.log_path, 'r+b') as f:
+            idx.seek(0, os.SEEK_END)
+            count = idx.tell() // entry
+            end = 0
+            while count:
+                idx.seek((count - 1) * entry)
+                (offset,) = self.INDEX_ENTRY.unpack(idx.read(entry))
+                f.seek(offset)
+                line = f.readline() if offset < log_size else b""
+                if line.endswith(b"\n"):
+                    end = offset + len(line)
+                    break
+                count -= 1
+            idx.truncate(count * entry)
+
+            ## Index complete lines which made it to the log only
+            f.seek(end)
+            offsets = []
+            for line in iter(f.readline, b""):
+                if not line.endswith(b"\n"):
+                    break
+                offsets.append(self.INDEX_ENTRY.pack(end))
+                end += len(line)
+            f.truncate(end)
+            idx.seek(0, os.SEEK_END)
+            idx.write(b"".join(offsets))
@@ -1,86 +1,225 @@
 from langchain_core.chat_history import BaseChatMessageHistory
 from langchain_core.messages.base import BaseMessage
-from langchain_core.messages import HumanMessage, AIMessage
+from langchain_core.messages import AIMessage
 
-from ....db.firebase.firestore import FirestoreUtil
+from firebase_admin import firestore
+
+from .sharding import ShardedLayout
+from ....db.firebase.firestore import FirestoreInstance, FirestoreUtil
+from ....instrumentation import instrumentation
 
 from datetime import datetime
+import atexit
+import threading
+import weakref
+
+
+class FirebaseMessageHistory(ShardedLayout, BaseChatMessageHistory):
+    '''
+    Chat history stored in Firestore under `history/{uid}`.
 
+    Messages are appended with `ArrayUnion`, so a write only carries the new
+    messages. The first `shard_size` messages live in the `{key}` array of the
+    history document; later ones spill into bucketed shard documents at
+    `history/{uid}/{key}/{shard_no}` (see `ShardedLayout`).
 
-class FirebaseMessageHistory(BaseChatMessageHistory):
+    In buffered mode the conversation is read once and then served from memory,
+    and added messages are held back and written together in a single batch:
+    when a turn ends (an AI message is added), every `flush_interval` seconds,
+    on leaving a `with` block, on `flush()` and at interpreter shutdown. A failed
+    flush keeps the messages for the next one; nothing is written on garbage
+    collection, so use a `with` block or call `flush()` when done.
+    '''
     storage_path:  str
     key: str
     uid: str
+    shard_size: int | None
+    buffered: bool
+    flush_interval: float | None
     db_interface: FirestoreUtil
 
-    def __init__(self, key: str, uid: str):
-        print("KEY:", key)
+    def __init__(self, key: str, uid: str, shard_size: int | None = 200, buffered: bool = False, flush_interval: float | None = None):
+        '''
+        Parameters
+        ----------
+        key : str
+            Conversation key inside the history document.
+        uid : str
+            User ID; the history document is named after it.
+        shard_size : int | None
+            Max messages per bucket document. Send None to keep every message in the history document.
+        buffered : bool
+            Serve reads from memory after the first load and coalesce writes. Defaults to False.
+        flush_interval : float | None
+            In buffered mode, max seconds an added message waits before being written. Defaults to None (turn boundaries only).
+        '''
         self.storage_path = "history"
         self.uid = uid
         self.key = key
+        self.shard_size = shard_size
         self.db_interface = FirestoreUtil()
         self.doc_ref = None
         self.db_data = None
+        self.meta = None
+        self.buffered = buffered
+        self.flush_interval = flush_interval
+        self.__local = None # Every serialized message; buffered mode only
+        self.__pending = []
+        self.__timer = None
+        self.__lock = threading.RLock()
+        if buffered:
+            _buffered_histories.add(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.flush()
 
     @property
     def messages(self):
+        return self.get_last_messages()
+
+    @instrumentation.traced("history.firebase.get_last_messages")
+    def get_last_messages(self, k: int | None = None) -> list[BaseMessage]:
+        """Fetch the latest messages; only the buckets holding them are read
+
+        Args:
+            k (int | None, optional): Number of messages to be returned. Defaults to None (all messages).
+
+        Returns:
+            list[BaseMessage]: Up to `k` most recent messages, oldest first
+        """
         try:
-            if self.doc_ref is None:
-                self.doc_ref = self.db_interface.fetch_data(self.uid, self.storage_path, send_ref = True)
-            snapshot = self.doc_ref.get()
-            if snapshot.exists:
-                self.db_data = snapshot.to_dict()
-                messages = self.db_data[self.key]
-                return self.messages_from_dict(messages)
-            else:
-                self.db_data = {self.key: []}
-                self.doc_ref.set(self.db_data)
-                return []
+            with self.__lock:
+                if self.__local is not None:
+                    local = self.__local if k is None else self.__local[max(0, len(self.__local) - k):]
+                    return self.messages_from_dict(local)
+                if self.buffered:
+                    self.flush()
+                    k = None # First read in buffered mode loads the whole conversation
+                serialized = self.__fetch(k)
+                if self.buffered:
+                    self.__local = serialized
+                return self.messages_from_dict(serialized)
         except Exception as e:
             print(e)
             return []
-    
+
     def add_message(self, message):
         message.timestamp = datetime.now()
         print(message, message.timestamp)
         self.add_messages([message])
 
+    @instrumentation.traced("history.firebase.add_messages")
     def add_messages(self, messages: list[BaseMessage]) -> None:
         for msg in messages:
             msg.timestamp = datetime.now()
-        all_messages = list(self.messages) # Existing messages
-        all_messages.extend(messages) # Add new messages
-
-        serialized = self.messages_to_dict(all_messages)
-        self.db_data[self.key] = serialized
+        if not messages:
+            return
         try:
-           self.doc_ref.update(self.db_data)
+            with self.__lock:
+                if self.meta is None:
+                    self.__load()
+                serialized = self.messages_to_dict(messages, start=self.meta["count"] + 1)
+                self.meta["count"] += len(serialized)
+                if not self.buffered:
+                    self.__write(serialized)
+                    return
+                if self.__local is not None:
+                    self.__local.extend(serialized)
+                self.__pending.extend(serialized)
+                if isinstance(messages[-1], AIMessage):
+                    self.flush()
+                elif self.flush_interval is not None and self.__timer is None:
+                    self.__timer = threading.Timer(self.flush_interval, self.flush)
+                    self.__timer.daemon = True
+                    self.__timer.start()
         except Exception as e:
-           print(e)
-       
+            print(e)
+            self.meta = None # Reload the layout before the next write
+
+    @instrumentation.traced("history.firebase.flush")
+    def flush(self) -> None:
+        '''
+        Write buffered messages in one batch; kept for the next flush if the write fails.
+        '''
+        with self.__lock:
+            if self.__timer is not None:
+                self.__timer.cancel()
+                self.__timer = None
+            if not self.__pending:
+                return
+            pending, self.__pending = self.__pending, []
+            try:
+                self.__write(pending)
+            except Exception as e:
+                print(e)
+                self.__pending = pending + self.__pending
 
+    @instrumentation.traced("history.firebase.clear")
     def clear(self):
         try:
-            prompts = self.db_data[self.key][:2]
-            self.db_data[self.key] = prompts
-            self.doc_ref.update(self.db_data)
+            with self.__lock:
+                self.flush()
+                if self.doc_ref is None:
+                    self.__load()
+                prompts = self.__transact(self._clear)
+                if self.__local is not None:
+                    self.__local = list(prompts)
         except Exception as e:
             print(e)
 
-    def messages_from_dict(self, messages: dict[str, object]):
-        final = []
-        for message in messages:
-            if message["role"] == "user":
-                final.append(HumanMessage(message["content"], timestamp=message["timestamp"]))
-            else:
-                final.append(AIMessage(message["content"], timestamp=message["timestamp"]))
-        return final
-
-    
-    def messages_to_dict(self, messages: list[BaseMessage]):
-        dct_list = []
-        for i in range(1, len(messages) + 1):
-            message = messages[i-1]
-            key = "user" if type(message) is HumanMessage else "chatbot"
-            dct_list.append({"index":i, "role":key, "content":message.content, "timestamp":message.timestamp })
-        return dct_list
\ No newline at end of file
+    def __fetch(self, k: int | None) -> list[dict]:
+        '''
+        Read the last `k` serialized messages (all if None) from Firestore.
+        '''
+        self.__load()
+        count = self.meta["count"]
+        first = 0 if k is None else max(0, count - k)
+        if first >= count:
+            return []
+        shards = self._shards_from(first)
+        snapshots = FirestoreInstance().get_all([self._shard_ref(shard) for shard in shards]) if shards else []
+        return self._collect(first, [snapshot.to_dict() for snapshot in snapshots if snapshot.exists])
+
+    def __write(self, serialized: list[dict]):
+        '''
+        Append serialized messages after the committed ones, renumbering them, in one transaction.
+        '''
+        if self.doc_ref is None:
+            self.__load()
+        first_bucket = self.__transact(lambda transaction: self._append(transaction, serialized))
+        self.db_data[self.key].extend(first_bucket)
+
+    def __transact(self, write):
+        '''
+        Re-read the layout and add `write(transaction)` in a transaction, retried on conflicts.
+        '''
+        @firestore.transactional
+        def run(transaction):
+            snapshot = self.doc_ref.get(transaction=transaction)
+            self._read_layout(snapshot.to_dict() if snapshot.exists else None)
+            return write(transaction)
+
+        return run(FirestoreInstance().transaction())
+
+    def __load(self):
+        '''
+        Read the history document: the first bucket and the bucket layout.
+        '''
+        if self.doc_ref is None:
+            self.doc_ref = self.db_interface.fetch_data(self.uid, self.storage_path, send_ref = True)
+        snapshot = self.doc_ref.get()
+        self._read_layout(snapshot.to_dict() if snapshot.exists else None)
+        if not snapshot.exists:
+            self.doc_ref.set(self.db_data)
+
+
+## Buffered histories still holding messages are flushed at interpreter shutdown
+_buffered_histories: "weakref.WeakSet[FirebaseMessageHistory]" = weakref.WeakSet()
+
+@atexit.register
+def _flush_buffered_histories():
+    for history in list(_buffered_histories):
+        history.flush()
@@ -0,0 +1,135 @@
+from langchain_core.messages.base import BaseMessage
+from langchain_core.messages import HumanMessage, AIMessage
+
+from google.cloud.firestore_v1 import ArrayUnion, Increment
+from google.cloud.firestore_v1.field_path import FieldPath
+
+
+class ShardedLayout:
+    '''
+    Firestore layout of a conversation, shared by `FirebaseMessageHistory` and
+    `AsyncFirebaseMessageHistory`; they only differ in the client making the calls.
+
+    The first `base` messages live in the `{key}` array of the history document,
+    later ones in bucket documents of `shard_size` messages at
+    `history/{uid}/{key}/{shard_no}`. The message count and the bucket layout are
+    kept in the `_meta` map of the history document, so an existing conversation
+    keeps the bucket size it was created with. Documents written in the older
+    single-array layout are read as-is and spill once they grow further.
+
+    Writes run in a transaction on the history document: message indexes are
+    numbered from the committed count and the count is advanced with
+    `Increment`, so concurrent writers never reuse an index.
+
+    Works on the `key`, `shard_size`, `doc_ref`, `db_data` and `meta` attributes
+    of the history.
+    '''
+    META_FIELD = "_meta"
+
+    def messages_from_dict(self, messages: dict[str, object]):
+        final = []
+        for message in messages:
+            if message["role"] == "user":
+                final.append(HumanMessage(message["content"], timestamp=message["timestamp"]))
+            else:
+                final.append(AIMessage(message["content"], timestamp=message["timestamp"]))
+        return final
+
+    def messages_to_dict(self, messages: list[BaseMessage], start: int = 1):
+        dct_list = []
+        for i in range(start, len(messages) + start):
+            message = messages[i-start]
+            key = "user" if type(message) is HumanMessage else "chatbot"
+            dct_list.append({"index":i, "role":key, "content":message.content, "timestamp":message.timestamp })
+        return dct_list
+
+    def _read_layout(self, db_data: dict | None) -> None:
+        '''
+        Take the first bucket and the bucket layout from the history document (None if missing).
+        '''
+        self.db_data = db_data if db_data is not None else {}
+        self.db_data.setdefault(self.key, [])
+        meta = self.db_data.get(self.META_FIELD, {}).get(self.key)
+        if meta is None:
+            ## Single-array layout; whatever is in the document stays the first bucket
+            legacy_count = len(self.db_data[self.key])
+            base = None if self.shard_size is None else max(legacy_count, self.shard_size)
+            meta = { "count": legacy_count, "base": base, "shard_size": self.shard_size }
+        self.meta = dict(meta)
+
+    def _shards_from(self, first: int) -> list[int]:
+        '''
+        Bucket documents holding the messages from (0-based) position `first` on.
+        '''
+        last_shard = self._shard_of(self.meta["count"] - 1)
+        return list(range(max(1, self._shard_of(first)), last_shard + 1))
+
+    def _collect(self, first: int, shards: list[dict]) -> list[dict]:
+        '''
+        Serialized messages from position `first` on, out of the first bucket and the `shards` read.
+        '''
+        count = self.meta["count"]
+        serialized = list(self.db_data[self.key][first:]) if self._shard_of(first) == 0 else []
+        for shard in shards:
+            serialized.extend(shard.get("messages", []))
+        serialized.sort(key=lambda message: message["index"])
+        return serialized[-(count - first):]
+
+    def _append(self, batch, serialized: list[dict]) -> list[dict]:
+        '''
+        Number new messages after the layout just read in `batch` (a transaction) and add their
+        writes; returns those of the first bucket.
+        '''
+        stored = self.db_data.get(self.META_FIELD, {}).get(self.key) is not None
+        start = self.meta["count"] + 1
+        for i, dct in enumerate(serialized):
+            dct["index"] = start + i
+        self.meta["count"] += len(serialized)
+
+        ## Only the new messages are sent; grouped by the bucket they fall in
+        buckets: dict[int, list[dict]] = {}
+        for dct in serialized:
+            buckets.setdefault(self._shard_of(dct["index"] - 1), []).append(dct)
+
+        if stored:
+            root_update = { FieldPath(self.META_FIELD, self.key, "count").to_api_repr(): Increment(len(serialized)) }
+        else:
+            ## No layout stored yet (new or single-array document); the transaction guards the absolute count
+            root_update = { FieldPath(self.META_FIELD, self.key).to_api_repr(): dict(self.meta) }
+        for shard, dcts in buckets.items():
+            if shard == 0:
+                root_update[FieldPath(self.key).to_api_repr()] = ArrayUnion(dcts)
+            else:
+                batch.set(self._shard_ref(shard), { "messages": ArrayUnion(dcts) }, merge=True)
+        batch.update(self.doc_ref, root_update)
+        return buckets.get(0, [])
+
+    def _clear(self, batch) -> list[dict]:
+        '''
+        Reset the layout just read to the two prompt messages and add the matching writes to `batch`
+        (a transaction); returns the prompts.
+        '''
+        prompts = self.db_data[self.key][:2]
+        last_shard = self._shard_of(self.meta["count"] - 1) if self.meta["count"] else 0
+        self.db_data[self.key] = prompts
+        self.meta = { "count": len(prompts), "base": self.shard_size, "shard_size": self.shard_size }
+
+        for shard in range(1, last_shard + 1):
+            batch.delete(self._shard_ref(shard))
+        batch.update(self.doc_ref, {
+            FieldPath(self.key).to_api_repr(): prompts,
+            FieldPath(self.META_FIELD, self.key).to_api_repr(): self.meta,
+        })
+        return prompts
+
+    def _shard_of(self, i: int) -> int:
+        '''
+        Bucket number of the message at (0-based) position `i`; bucket 0 is the history document.
+        '''
+        base = self.meta["base"]
+        if base is None or i < base:
+            return 0
+        return 1 + (i - base) // self.meta["shard_size"]
+
+    def _shard_ref(self, shard: int):
+        return self.doc_ref.collection(self.key).document(f"{shard:06d}")
@@ -1,8 +1,231 @@
 from langchain_core.exceptions import OutputParserException
-from langchain_core.output_parsers import BaseLLMOutputParser, BaseOutputParser
+from langchain_core.messages import BaseMessage
+from langchain_core.output_parsers import BaseTransformOutputParser
 from langchain_core.outputs import ChatGeneration, Generation
+from langchain_core.runnables import RunnableConfig
+
+from abc import abstractmethod
+from typing import Any, AsyncIterator, Awaitable, Callable, Iterator
+
+class StreamCutter:
+    '''
+    Incremental text filter shared by the streaming parsers.
+
+    `feed` takes the next piece of the generation and returns what can be shown
+    so far; text that might still turn out to be the start of a marker or
+    trailing whitespace is held back. `done` is set once a stop marker has been
+    seen, after which the rest of the generation is not needed.
+
+    With `think_tags`, a generation that doesn't open with the think tag is held
+    back until the closing tag shows up or the generation ends, since chat
+    templates may open the think block in the prompt (same as `parse`).
+    '''
+
+    def __init__(self, stop_markers: tuple[str, ...], stop_at_newline: bool = False, think_tags: tuple[str, str] | None = None):
+        self.stop_markers = stop_markers + (("\n",) if stop_at_newline else ())
+        self.think_tags = think_tags
+        self.state = "start" if think_tags else "answer"
+        self.buffer = ""
+        self.think = ""
+        self.started = False
+        self.done = False
+
+    def feed(self, text: str) -> str:
+        if self.done:
+            return ""
+        self.buffer += text
+        if self.state == "start":
+            ## The think block, if any, opens the generation
+            opening = self.think_tags[0]
+            head = self.buffer.lstrip()
+            if opening.startswith(head):
+                return "" # Can't tell yet
+            if head.startswith(opening):
+                self.state = "think"
+                self.buffer = head[len(opening):]
+            else:
+                self.state = "unopened"
+        if self.state == "unopened":
+            ## Reasoning until proven otherwise: only the closing tag or the end of the generation tells
+            end = self.buffer.find(self.think_tags[1])
+            if end == -1:
+                return ""
+            think = self.buffer[:end]
+            start = think.find(self.think_tags[0])
+            self.think += think[start + len(self.think_tags[0]):] if start != -1 else think
+            self.buffer = self.buffer[end + len(self.think_tags[1]):]
+            self.state = "answer"
+        if self.state == "think":
+            closing = self.think_tags[1]
+            end = self.buffer.find(closing)
+            if end == -1:
+                ## Keep what may be the beginning of the closing tag
+                keep = self.__partial(self.buffer, (closing,))
+                self.think += self.buffer[:len(self.buffer) - keep]
+                self.buffer = self.buffer[len(self.buffer) - keep:]
+                return ""
+            self.think += self.buffer[:end]
+            self.buffer = self.buffer[end + len(closing):]
+            self.state = "answer"
+        return self.__answer()
+
+    def finish(self) -> str:
+        '''
+        Flush at the end of the generation; an unterminated think block yields nothing.
+        '''
+        if self.done or self.state == "think":
+            return ""
+        text = ""
+        if self.state != "answer":
+            ## No closing tag came: all of it was the answer
+            self.state = "answer"
+            text = self.__answer()
+            if self.done:
+                return text
+        self.done = True
+        return text + self.buffer.rstrip()
+
+    def __answer(self) -> str:
+        if not self.started:
+            self.buffer = self.buffer.lstrip()
+            if not self.buffer:
+                return ""
+            self.started = True
+        cuts = [i for i in (self.buffer.find(marker) for marker in self.stop_markers) if i != -1]
+        if cuts:
+            self.done = True
+            return self.buffer[:min(cuts)].rstrip()
+        safe = len(self.buffer[:len(self.buffer) - self.__partial(self.buffer, self.stop_markers)].rstrip())
+        text, self.buffer = self.buffer[:safe], self.buffer[safe:]
+        return text
+
+    @staticmethod
+    def __partial(text: str, markers: tuple[str, ...]) -> int:
+        '''
+        Length of the longest suffix of `text` that is a proper prefix of a marker.
+        '''
+        longest = 0
+        for marker in markers:
+            for k in range(min(len(marker) - 1, len(text)), longest, -1):
+                if text.endswith(marker[:k]):
+                    longest = k
+                    break
+        return longest
+
+class _Upstream:
+    '''
+    Iterator over the upstream chunks that can be cut off: once stopped it ends
+    immediately and closes its source, so LangChain doesn't drain the rest of
+    the generation for tracing and the model's stream is closed.
+    '''
+
+    def __init__(self, source: Iterator | AsyncIterator):
+        self.source = source
+        self.stopped = False
+
+    def __iter__(self):
+        self.source = iter(self.source)
+        return self
+
+    def __next__(self):
+        if self.stopped:
+            raise StopIteration
+        return next(self.source)
+
+    def __aiter__(self):
+        self.source = aiter(self.source)
+        return self
+
+    async def __anext__(self):
+        if self.stopped:
+            raise StopAsyncIteration
+        return await anext(self.source)
+
+    def stop(self) -> None:
+        self.stopped = True
+        if hasattr(self.source, "close"):
+            self.source.close()
+
+    async def astop(self) -> None:
+        self.stopped = True
+        if hasattr(self.source, "aclose"):
+            await self.source.aclose()
+
+class _StreamingParser(BaseTransformOutputParser[str]):
+    '''
+    Runs a `StreamCutter` over the chunks of a streamed generation and closes the
+    upstream stream as soon as the cutter is done, which stops the model from
+    generating tokens that would be thrown away.
+    '''
+
+    @abstractmethod
+    def cutter(self) -> StreamCutter:
+        '''
+        New cutter for one generation.
+        '''
+
+    def on_stream_end(self, cutter: StreamCutter) -> None:
+        pass
+
+    def transform(self, input: Iterator[str | BaseMessage], config: RunnableConfig | None = None, **kwargs: Any) -> Iterator[str]:
+        upstream = _Upstream(input)
+        yield from self._transform_stream_with_config(
+            iter(upstream), lambda chunks: self.__cut(chunks, upstream.stop), config, run_type="parser"
+        )
+
+    async def atransform(self, input: AsyncIterator[str | BaseMessage], config: RunnableConfig | None = None, **kwargs: Any) -> AsyncIterator[str]:
+        upstream = _Upstream(input)
+        async for chunk in self._atransform_stream_with_config(
+            aiter(upstream), lambda chunks: self.__acut(chunks, upstream.astop), config, run_type="parser"
+        ):
+            yield chunk
+
+    def _transform(self, input: Iterator[str | BaseMessage]) -> Iterator[str]:
+        yield from self.__cut(input, lambda: None)
+
+    async def _atransform(self, input: AsyncIterator[str | BaseMessage]) -> AsyncIterator[str]:
+        async for chunk in self.__acut(input, self.__anoop):
+            yield chunk
+
+    def __cut(self, input: Iterator[str | BaseMessage], stop: Callable[[], None]) -> Iterator[str]:
+        cutter = self.cutter()
+        try:
+            for chunk in input:
+                text = cutter.feed(chunk.content if isinstance(chunk, BaseMessage) else chunk)
+                if text:
+                    yield text
+                if cutter.done:
+                    stop()
+                    return
+            text = cutter.finish()
+            if text:
+                yield text
+        finally:
+            self.on_stream_end(cutter)
+
+    async def __acut(self, input: AsyncIterator[str | BaseMessage], stop: Callable[[], Awaitable[None]]) -> AsyncIterator[str]:
+        cutter = self.cutter()
+        try:
+            async for chunk in input:
+                text = cutter.feed(chunk.content if isinstance(chunk, BaseMessage) else chunk)
+                if text:
+                    yield text
+                if cutter.done:
+                    await stop()
+                    return
+            text = cutter.finish()
+            if text:
+                yield text
+        finally:
+            self.on_stream_end(cutter)
+
+    @staticmethod
+    async def __anoop() -> None:
+        pass
+
+class ChatOutputParser(_StreamingParser):
+    stop_markers: tuple[str, ...] = ("Human:", "AI:")
 
-class ChatOutputParser(BaseLLMOutputParser):
     def parse_result(self, result: list[Generation], *, partial: bool = False):
         """Parse a list of model Generations into a specific format.
 
@@ -24,20 +247,27 @@ class ChatOutputParser(BaseLLMOutputParser):
             raise OutputParserException(
                 "This output parser can only be used with a chat generation."
             )
-        content = generation.message.content
-        content = content.strip()
-        if "AI:" not in content and "Human:" not in content:
+        return self.parse(generation.message.content)
+
+    def parse(self, text: str) -> str:
+        content = text.strip()
+        indices = [content.index(marker) for marker in self.stop_markers if marker in content]
+        if not indices:
             ## Cut the content if it is generated too long.
             if "\n" in content:
                 content = content.split("\n")[0]
             return content.strip()
         ## Remove generated conversation from the response
-        human_index = content.index("Human:")
-        ai_index = content.index("AI:")
-        index = min(human_index, ai_index)
-        return content[:index].strip()
+        return content[:min(indices)].strip()
+
+    def cutter(self) -> StreamCutter:
+        ## While streaming, a line break ends the answer even if a speaker marker only follows later
+        return StreamCutter(self.stop_markers, stop_at_newline=True)
+
+class DeepseekOutputParser(_StreamingParser):
+    stop_markers: tuple[str, ...] = ()
+    think_tags: tuple[str, str] = ("<think>", "</think>")
 
-class DeepseekOutputParser(BaseOutputParser):
     def parse(self, result: list[Generation], *, partial: bool = False):
         """Parse a list of model Generations into a specific format.
 
@@ -49,7 +279,7 @@ class DeepseekOutputParser(BaseOutputParser):
             partial: Whether to allow partial results. This is used for parsers
                      that support streaming
         """
-        if type(result) is not str:
+        if not isinstance(result, str):
             if len(result) != 1:
                 raise NotImplementedError(
                     "This output parser can only be used with a single generation."
@@ -63,11 +293,24 @@ class DeepseekOutputParser(BaseOutputParser):
             content = generation.message.content
         else:
             content = result
-        start_idx = content.index("<think>")
-        end_idx = content.index("</think>")
+        opening, closing = self.think_tags
+        ## Some chat templates open the think block in the prompt, so only the closing tag is generated
+        end_idx = content.find(closing)
+        if end_idx != -1:
+            start_idx = content.find(opening)
+            think_cloud = content[start_idx + len(opening) if start_idx != -1 else 0: end_idx]
+            print("Think Cloud:", think_cloud)
+            content = content[end_idx + len(closing):]
+        elif content.lstrip().startswith(opening):
+            return "" # Unterminated think block; no answer yet
+
+        cut = [content.index(marker) for marker in self.stop_markers if marker in content]
+        response = content[:min(cut)] if cut else content
+        return response.strip()
 
-        think_cloud = content[start_idx + 7: end_idx]
-        print("Think Cloud:", think_cloud)
-        response = content[end_idx + 8: ]
+    def cutter(self) -> StreamCutter:
+        return StreamCutter(self.stop_markers, think_tags=self.think_tags)
 
-        return response.strip()
\ No newline at end of file
+    def on_stream_end(self, cutter: StreamCutter) -> None:
+        if cutter.think:
+            print("Think Cloud:", cutter.think)
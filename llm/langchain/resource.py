@@ -1,7 +1,143 @@
-from langchain_community.embeddings import HuggingFaceInferenceAPIEmbeddings
-from langchain_core.prompts.chat import ChatPromptTemplate
-
+from typing import Any, Callable
 import os
+import threading
+import time
+
+class ResourceRegistry:
+    '''
+    Named resources (prompt templates, embedding clients, vector stores) built
+    by their factory on first use and memoized.
+
+    Factories import what they need themselves, so importing a module that
+    declares resources costs nothing until one is used. Concurrent first uses
+    of the same resource wait for a single build.
+    '''
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__factories: dict[str, Callable[[], Any]] = {}
+        self.__values: dict[str, Any] = {}
+        self.__building: dict[str, threading.Lock] = {}
+        self.__build_seconds: dict[str, float] = {}
+
+    def register(self, name: str, factory: Callable[[], Any]) -> None:
+        '''
+        Declare a resource; registering a name again replaces the factory and drops a built value.
+        '''
+        with self.__lock:
+            self.__factories[name] = factory
+            self.__values.pop(name, None)
+
+    def get(self, name: str, factory: Callable[[], Any] | None = None) -> Any:
+        """Get a resource, building it on first use
+
+        Args:
+            name (str): Name of the resource
+            factory (Callable[[], Any] | None): Registered for `name` if it isn't known yet
+
+        Returns:
+            Any: The memoized resource
+        """
+        with self.__lock:
+            if name in self.__values:
+                return self.__values[name]
+            if name not in self.__factories:
+                if factory is None:
+                    raise Exception("No such resource available!! Please check once again!!")
+                self.__factories[name] = factory
+            building = self.__building.setdefault(name, threading.Lock())
+        with building:
+            with self.__lock:
+                if name in self.__values:
+                    return self.__values[name]
+                factory = self.__factories[name]
+            start = time.perf_counter()
+            value = factory()
+            with self.__lock:
+                self.__values[name] = value
+                self.__build_seconds[name] = time.perf_counter() - start
+                self.__building.pop(name, None)
+            return value
+
+    def set(self, name: str, value: Any) -> None:
+        '''
+        Provide a resource directly, e.g. a stub in tests.
+        '''
+        with self.__lock:
+            self.__factories.setdefault(name, lambda: value)
+            self.__values[name] = value
+
+    def reset(self, name: str | None = None) -> None:
+        '''
+        Drop a built resource (all by default); it is built again on next use.
+        '''
+        with self.__lock:
+            if name is None:
+                self.__values.clear()
+            else:
+                self.__values.pop(name, None)
+
+    def stats(self) -> dict[str, object]:
+        with self.__lock:
+            return {
+                "registered": sorted(self.__factories),
+                "built": sorted(self.__values),
+                "build_seconds": dict(self.__build_seconds),
+            }
+
+    def attribute(self, name: str, factory: Callable[[], Any]) -> "LazyResource":
+        '''
+        Register a resource and return a class attribute resolving to it.
+        '''
+        self.register(name, factory)
+        return LazyResource(self, name)
+
+class LazyResource:
+    '''
+    Class attribute standing for a registry resource; reading it builds the resource on first use.
+    '''
+
+    def __init__(self, registry: ResourceRegistry, name: str):
+        self.registry = registry
+        self.name = name
+
+    def __get__(self, instance: Any, owner: type) -> Any:
+        return self.registry.get(self.name)
+
+## Shared by every module of the process
+resources = ResourceRegistry()
+
+def _read_template() -> str:
+    with open(RAG_Resources.template_path) as file:
+        return file.read()
+
+def _build_prompt_template():
+    from langchain_core.prompts.chat import ChatPromptTemplate
+    return ChatPromptTemplate.from_template(RAG_Resources.template_str)
+
+def _build_embedding():
+    from langchain_community.embeddings import HuggingFaceInferenceAPIEmbeddings
+    from .embeddings import CachedEmbeddings
+    ## Embeddings are cached on disk, only unseen texts reach the API
+    return CachedEmbeddings(
+        HuggingFaceInferenceAPIEmbeddings(
+            model_name="sentence-transformers/all-mpnet-base-v2",
+            api_key=os.getenv("HF_TOKEN")
+        ),
+        path=os.path.join(RAG_Resources.persist_directory, "embedding_cache.sqlite"),
+    )
+
+def _build_splitter():
+    from langchain_text_splitters import TokenTextSplitter
+    return TokenTextSplitter(
+        chunk_size=RAG_Resources.chunk_size,
+        chunk_overlap=RAG_Resources.chunk_overlap
+    )
+
+def _build_rag_model() -> tuple:
+    from .manager import LLMManager
+    ## Clients are shared through the manager's registry, so the model and its parser are built once
+    return LLMManager().load_default(RAG_Resources.rag_settings)
 
 class RAG_Resources:
     chunk_size = 100 # No of tokens allowed in a chunk
@@ -9,15 +145,14 @@ class RAG_Resources:
 
     ## Declaring Static Resources
     persist_directory = "ai_chaperone/docs/chroma/"
+    vector_store = "chroma" # "chroma" or "numpy" (in-process, memory-mapped; see vectorstore.py)
+    template_path = "ai_chaperone/utils/chat/rag_prompt_template.txt"
+    rag_settings = "enquiry_chatbot" # Key of `LLMManager.Constants.default_settings` answering the RAG questions
 
-    template_str = ""
-    with open("ai_chaperone/utils/chat/rag_prompt_template.txt") as file:
-        template_str = file.read()
-
-    rag_prompt_template = ChatPromptTemplate.from_template(template_str)
-
-    ## Model Initialization
-    embedding = HuggingFaceInferenceAPIEmbeddings(
-        model_name="sentence-transformers/all-mpnet-base-v2",
-        api_key=os.getenv("HF_TOKEN")
-    )
\ No newline at end of file
+    ## Built on first access (see `resources`), so importing this module stays cheap
+    template_str = resources.attribute("template_str", _read_template)
+    rag_prompt_template = resources.attribute("rag_prompt_template", _build_prompt_template)
+    embedding = resources.attribute("embedding", _build_embedding)
+    splitter = resources.attribute("splitter", _build_splitter)
+    llm = resources.attribute("llm", lambda: _build_rag_model()[0])
+    output_parser = resources.attribute("output_parser", lambda: _build_rag_model()[1])
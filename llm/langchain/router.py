@@ -0,0 +1,264 @@
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import ConfigDict, PrivateAttr
+
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Iterator
+import asyncio
+import threading
+import time
+
+class BackendStats:
+    '''
+    Exponentially weighted latency (of successful requests) and error rate of one backend.
+    '''
+
+    def __init__(self, alpha: float):
+        self.alpha = alpha
+        self.latency: float | None = None # Seconds; None until the first success
+        self.error_rate = 0.0
+        self.requests = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.failed_at = 0.0
+
+    def record(self, latency: float | None, error: bool) -> None:
+        self.requests += 1
+        self.error_rate += self.alpha * ((1.0 if error else 0.0) - self.error_rate)
+        if error:
+            self.errors += 1
+            self.failed_at = time.monotonic()
+        elif latency is not None:
+            if self.latency is None:
+                self.latency = latency
+            else:
+                ## Samples are clipped, so one stray slow request doesn't stretch the hedge delay;
+                ## a lasting slowdown still raises the average by up to 40% per request
+                latency = min(latency, self.Constants.max_jump * self.latency)
+                self.latency += self.alpha * (latency - self.latency)
+
+    class Constants:
+        max_jump = 3.0
+
+class ModelRouter(BaseChatModel):
+    '''
+    Chat model routing every request to the fastest healthy backend among
+    several serving the same model (e.g. `deepseek-r1:1.5b` on Ollama and
+    Hugging Face).
+
+    Backends are ranked by EWMA latency, penalised by their EWMA error rate;
+    untried backends rank first so each gets measured. A backend whose error
+    rate exceeds `max_error_rate` is skipped until `cooldown` seconds after
+    its last failure. When the chosen backend hasn't answered after
+    `hedge_factor` times its usual latency (at least `min_hedge_delay`), the
+    next one is started as well and the first answer wins; on an error or
+    after `timeout` the request fails over to the next backend.
+    '''
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    backends: dict[str, BaseChatModel]
+    alpha: float = 0.2
+    hedge_factor: float = 2.0
+    min_hedge_delay: float = 0.5
+    max_hedges: int = 1
+    timeout: float = 60.0
+    max_error_rate: float = 0.5
+    cooldown: float = 30.0
+
+    _stats: dict[str, BackendStats] = PrivateAttr(default_factory=dict)
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+    _executor: ThreadPoolExecutor | None = PrivateAttr(default=None)
+
+    def model_post_init(self, context: Any) -> None:
+        self._stats = { name: BackendStats(self.alpha) for name in self.backends }
+
+    @property
+    def _llm_type(self) -> str:
+        return "model-router"
+
+    def stats(self) -> dict[str, dict[str, object]]:
+        with self._lock:
+            return {
+                name: {
+                    "latency": stats.latency,
+                    "error_rate": stats.error_rate,
+                    "requests": stats.requests,
+                    "errors": stats.errors,
+                    "in_flight": stats.in_flight,
+                    "healthy": self.__healthy(stats),
+                }
+                for name, stats in self._stats.items()
+            }
+
+    def ranked(self) -> list[str]:
+        '''
+        Backends in the order they would be tried: healthy ones first, fastest first.
+        '''
+        with self._lock:
+            def score(name: str) -> tuple:
+                stats = self._stats[name]
+                latency = 0.0 if stats.latency is None else stats.latency
+                return (not self.__healthy(stats), latency * (1 + 4 * stats.error_rate), stats.in_flight)
+            return sorted(self.backends, key=score)
+
+    ## Sync
+
+    def _generate(self, messages: list[BaseMessage], stop: list[str] | None = None, run_manager: CallbackManagerForLLMRun | None = None, **kwargs: Any) -> ChatResult:
+        executor = self.__get_executor()
+        order = self.ranked()
+        running: dict[Future, tuple[str, float]] = {}
+        last_error: BaseException | None = None
+
+        def launch() -> None:
+            name = order.pop(0)
+            with self._lock:
+                self._stats[name].in_flight += 1
+            running[executor.submit(self.backends[name].invoke, messages, stop=stop, **kwargs)] = (name, time.monotonic())
+
+        launch()
+        hedges = 0
+        while running:
+            now = time.monotonic()
+            started = max(start for _, start in running.values())
+            wait_for = min(start + self.timeout for _, start in running.values()) - now
+            can_hedge = order and hedges < self.max_hedges
+            if can_hedge:
+                wait_for = min(wait_for, started + self.__hedge_delay(running) - now)
+            done, _ = wait(running, timeout=max(0.0, wait_for), return_when=FIRST_COMPLETED)
+
+            for future in done:
+                name, start = running.pop(future)
+                error = future.exception()
+                self.__record(name, time.monotonic() - start, error)
+                if error is None:
+                    self.__abandon(running)
+                    message = future.result()
+                    message.response_metadata = { **message.response_metadata, "backend": name }
+                    return ChatResult(generations=[ChatGeneration(message=message)])
+                last_error = error
+                if order and not running:
+                    launch() # Failover
+            if done:
+                continue
+
+            now = time.monotonic()
+            for future, (name, start) in list(running.items()):
+                if now - start >= self.timeout:
+                    ## Timed out; its thread can't be stopped, but nobody waits for it any more
+                    running.pop(future)
+                    self.__record(name, None, TimeoutError(f"{name} timed out"))
+                    last_error = TimeoutError(f"{name} timed out after {self.timeout}s")
+            if order and (not running or (can_hedge and now - started >= self.__hedge_delay(running))):
+                hedges += bool(running)
+                launch()
+
+        raise last_error if last_error is not None else RuntimeError("No backend available")
+
+    def _stream(self, messages: list[BaseMessage], stop: list[str] | None = None, run_manager: CallbackManagerForLLMRun | None = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        '''
+        Streams from the best backend; fails over only until the first chunk was emitted.
+        '''
+        last_error = None
+        for name in self.ranked():
+            with self._lock:
+                self._stats[name].in_flight += 1
+            start = time.monotonic()
+            emitted = False
+            try:
+                for chunk in self.backends[name].stream(messages, stop=stop, **kwargs):
+                    emitted = True
+                    if run_manager is not None:
+                        run_manager.on_llm_new_token(chunk.content, chunk=chunk)
+                    yield ChatGenerationChunk(message=chunk if isinstance(chunk, AIMessageChunk) else AIMessageChunk(content=chunk.content))
+            except GeneratorExit:
+                ## The consumer stopped reading; says nothing about the backend
+                with self._lock:
+                    self._stats[name].in_flight -= 1
+                raise
+            except Exception as e:
+                self.__record(name, None, e)
+                if emitted:
+                    raise
+                last_error = e
+                continue
+            self.__record(name, time.monotonic() - start, None)
+            return
+        raise last_error if last_error is not None else RuntimeError("No backend available")
+
+    ## Async
+
+    async def _agenerate(self, messages: list[BaseMessage], stop: list[str] | None = None, run_manager: AsyncCallbackManagerForLLMRun | None = None, **kwargs: Any) -> ChatResult:
+        order = self.ranked()
+        running: dict[asyncio.Task, tuple[str, float]] = {}
+        last_error: BaseException | None = None
+
+        def launch() -> None:
+            name = order.pop(0)
+            with self._lock:
+                self._stats[name].in_flight += 1
+            task = asyncio.ensure_future(asyncio.wait_for(self.backends[name].ainvoke(messages, stop=stop, **kwargs), self.timeout))
+            running[task] = (name, time.monotonic())
+
+        launch()
+        hedges = 0
+        try:
+            while running:
+                started = max(start for _, start in running.values())
+                can_hedge = order and hedges < self.max_hedges
+                wait_for = max(0.0, started + self.__hedge_delay(running) - time.monotonic()) if can_hedge else None
+                done, _ = await asyncio.wait(running, timeout=wait_for, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    name, start = running.pop(task)
+                    error = task.exception()
+                    self.__record(name, time.monotonic() - start, error)
+                    if error is None:
+                        message: AIMessage = task.result()
+                        message.response_metadata = { **message.response_metadata, "backend": name }
+                        return ChatResult(generations=[ChatGeneration(message=message)])
+                    last_error = error
+                if order and (not running or (not done and can_hedge)):
+                    hedges += bool(running)
+                    launch()
+        finally:
+            ## Losing hedges are cancelled, unlike threads
+            for task, (name, _) in running.items():
+                task.cancel()
+                with self._lock:
+                    self._stats[name].in_flight -= 1
+        raise last_error if last_error is not None else RuntimeError("No backend available")
+
+    ## Helpers
+
+    def __hedge_delay(self, running: dict) -> float:
+        with self._lock:
+            latencies = [self._stats[name].latency for name, _ in running.values() if self._stats[name].latency is not None]
+        return max(self.min_hedge_delay, self.hedge_factor * max(latencies)) if latencies else self.timeout
+
+    def __healthy(self, stats: BackendStats) -> bool:
+        return stats.error_rate <= self.max_error_rate or time.monotonic() - stats.failed_at >= self.cooldown
+
+    def __record(self, name: str, latency: float | None, error: BaseException | None) -> None:
+        with self._lock:
+            stats = self._stats[name]
+            stats.in_flight -= 1
+            stats.record(latency, error is not None)
+
+    def __abandon(self, running: dict[Future, tuple[str, float]]) -> None:
+        ## Losing hedges still finish in the background; record them when they do
+        for future, (name, start) in running.items():
+            if not future.cancel():
+                future.add_done_callback(lambda future, name=name, start=start: self.__record(name, time.monotonic() - start, future.exception()))
+            else:
+                with self._lock:
+                    self._stats[name].in_flight -= 1
+
+    def __get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.Constants.max_workers, thread_name_prefix="model-router")
+            return self._executor
+
+    class Constants:
+        max_workers = 64 # Concurrent backend calls of the sync path, hedges included
@@ -0,0 +1,202 @@
+from langchain_core.embeddings import Embeddings
+from langchain_core.runnables import Runnable, RunnableConfig
+
+from collections import OrderedDict
+from typing import Any
+import re
+import threading
+import time
+
+import numpy as np
+
+class SemanticCache:
+    '''
+    Response cache looked up by question similarity.
+
+    Questions are kept as L2-normalised vectors in one preallocated matrix, so a
+    lookup is a single matrix-vector product. A lookup hits when the closest
+    live question has a cosine similarity of at least `threshold`; identical
+    questions (after case and whitespace normalisation) hit without an embedding.
+    Entries expire after `ttl` seconds, the least recently used one is evicted
+    beyond `max_entries`, and every entry is dropped when the document set
+    version changes.
+    '''
+
+    def __init__(self, threshold: float = 0.92, ttl: float | None = 86400, max_entries: int = 2000):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.version = None
+        self.__lock = threading.Lock()
+        self.__vectors = None # (max_entries, dim) matrix; row i belongs to slot i
+        self.__entries: OrderedDict[int, dict[str, Any]] = OrderedDict() # slot -> entry, least recently used first
+        self.__by_text: dict[str, int] = {}
+        self.__free = list(range(max_entries - 1, -1, -1))
+        self.__counters = dict.fromkeys(("hits", "exact_hits", "misses", "evictions", "expirations", "invalidations"), 0)
+        self.__saved = 0.0
+
+    @staticmethod
+    def normalise(question: str) -> str:
+        return re.sub(r"\s+", " ", question).strip().lower().rstrip("?!. ")
+
+    def set_version(self, version: str | None) -> None:
+        '''
+        Record the version of the document set; a different version clears the cache.
+        '''
+        with self.__lock:
+            if version != self.version:
+                if self.version is not None and self.__entries:
+                    self.__counters["invalidations"] += 1
+                self.__clear()
+                self.version = version
+
+    def lookup_text(self, question: str) -> dict[str, Any] | None:
+        with self.__lock:
+            slot = self.__by_text.get(self.normalise(question))
+            if slot is None or not self.__valid(slot):
+                return None
+            self.__counters["exact_hits"] += 1
+            return self.__hit(slot, 1.0)
+
+    def lookup(self, vector: list[float]) -> dict[str, Any] | None:
+        '''
+        Closest cached entry with a similarity of at least `threshold`, as
+        `{ question, response, similarity }`, or None.
+        '''
+        query = self.__normalise_vector(vector)
+        with self.__lock:
+            if self.__entries and self.__vectors.shape[1] == len(query):
+                slots = np.fromiter(self.__entries.keys(), dtype=np.int64)
+                scores = self.__vectors[slots] @ query
+                for i in np.argsort(-scores):
+                    if scores[i] < self.threshold:
+                        break
+                    if self.__valid(int(slots[i])):
+                        return self.__hit(int(slots[i]), float(scores[i]))
+            self.__counters["misses"] += 1
+            return None
+
+    def put(self, question: str, vector: list[float], response: Any, cost: float = 0.0) -> None:
+        '''
+        Store a response; `cost` is the time it took to produce, credited as saved on every hit.
+        '''
+        vector = self.__normalise_vector(vector)
+        with self.__lock:
+            if self.__vectors is None or self.__vectors.shape[1] != len(vector):
+                self.__clear()
+                self.__vectors = np.zeros((self.max_entries, len(vector)), dtype=np.float32)
+            text = self.normalise(question)
+            if text in self.__by_text:
+                self.__drop(self.__by_text[text])
+            if not self.__free:
+                self.__drop(next(iter(self.__entries)))
+                self.__counters["evictions"] += 1
+            slot = self.__free.pop()
+            self.__vectors[slot] = vector
+            self.__entries[slot] = { "question": question, "text": text, "response": response, "cost": cost, "created": time.monotonic() }
+            self.__by_text[text] = slot
+
+    def clear(self) -> None:
+        with self.__lock:
+            self.__clear()
+
+    def stats(self) -> dict[str, float]:
+        with self.__lock:
+            stats = dict(self.__counters)
+            stats["entries"] = len(self.__entries)
+            stats["saved_seconds"] = self.__saved
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+    def __hit(self, slot: int, similarity: float) -> dict[str, Any]:
+        entry = self.__entries[slot]
+        self.__entries.move_to_end(slot)
+        self.__counters["hits"] += 1
+        self.__saved += entry["cost"]
+        return { "question": entry["question"], "response": entry["response"], "similarity": similarity }
+
+    def __valid(self, slot: int) -> bool:
+        if self.ttl is not None and time.monotonic() - self.__entries[slot]["created"] > self.ttl:
+            self.__drop(slot)
+            self.__counters["expirations"] += 1
+            return False
+        return True
+
+    def __drop(self, slot: int) -> None:
+        entry = self.__entries.pop(slot)
+        del self.__by_text[entry["text"]]
+        self.__free.append(slot)
+
+    def __clear(self) -> None:
+        self.__entries.clear()
+        self.__by_text.clear()
+        self.__free = list(range(self.max_entries - 1, -1, -1))
+
+    @staticmethod
+    def __normalise_vector(vector: list[float]) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+class CachedQAChain(Runnable):
+    '''
+    Runs a retrieval QA chain (as built by `create_retrieval_chain`) behind a
+    `SemanticCache`: on a hit the stored answer and context are returned without
+    retrieval or generation. Input and output are the wrapped chain's dicts.
+    '''
+
+    def __init__(self, chain: Runnable, embedding: Embeddings, cache: SemanticCache | None = None, version: str | None = None, input_key: str = "input"):
+        '''
+        Parameters
+        ----------
+        chain : Runnable
+            Retrieval chain taking `{input_key: question}`.
+        embedding : Embeddings
+            Model embedding the questions; ideally the retriever's, so the query embedding is shared.
+        cache : SemanticCache | None
+            Defaults to a cache of its own: answers of another chain (model, prompt or documents)
+            are never served. Pass one cache to chains that may share their answers.
+        version : str | None
+            Version of the document set the chain answers from; a new version invalidates the cache.
+        '''
+        self.chain = chain
+        self.embedding = embedding
+        self.cache = cache if cache is not None else SemanticCache()
+        self.input_key = input_key
+        self.cache.set_version(version)
+
+    def invoke(self, input: dict[str, Any], config: RunnableConfig | None = None, **kwargs: Any) -> dict[str, Any]:
+        question = input[self.input_key]
+        hit = self.cache.lookup_text(question)
+        if hit is not None:
+            return self.__answer(hit, question)
+        vector = self.embedding.embed_query(question)
+        hit = self.cache.lookup(vector)
+        if hit is not None:
+            return self.__answer(hit, question)
+        start = time.perf_counter()
+        response = self.chain.invoke(input, config, **kwargs)
+        if response.get("answer"):
+            self.cache.put(question, vector, response, time.perf_counter() - start)
+        return response
+
+    async def ainvoke(self, input: dict[str, Any], config: RunnableConfig | None = None, **kwargs: Any) -> dict[str, Any]:
+        question = input[self.input_key]
+        hit = self.cache.lookup_text(question)
+        if hit is not None:
+            return self.__answer(hit, question)
+        vector = await self.embedding.aembed_query(question)
+        hit = self.cache.lookup(vector)
+        if hit is not None:
+            return self.__answer(hit, question)
+        start = time.perf_counter()
+        response = await self.chain.ainvoke(input, config, **kwargs)
+        if response.get("answer"):
+            self.cache.put(question, vector, response, time.perf_counter() - start)
+        return response
+
+    def __answer(self, hit: dict[str, Any], question: str) -> dict[str, Any]:
+        response = dict(hit["response"])
+        response[self.input_key] = question
+        return response
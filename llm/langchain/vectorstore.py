@@ -0,0 +1,410 @@
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+from ...instrumentation import instrumentation
+
+from typing import Any, Callable, Iterable, Sequence
+import json
+import os
+import shutil
+import threading
+import uuid
+
+import numpy as np
+
+class NumpyVectorStore(VectorStore):
+    '''
+    In-process vector store on a memory-mapped float32 matrix.
+
+    Layout of a collection directory:
+        vectors.f32   row-major matrix of L2-normalised embeddings
+        docs.jsonl    one `{"id", "text", "metadata"}` line per row
+        docs.idx      uint64 offset of every row's line in docs.jsonl
+        ids.jsonl     the ID of every row, one JSON string per line
+        alive.u8      one byte per row, 0 once the row is deleted or replaced
+        ivf.npz       optional coarse quantiser (centroids and row assignments)
+        meta.json     embedding dimension
+
+    `ivf_threshold` and `n_probe` are not stored; they are taken from the
+    constructor on every open. The number of IVF lists is that of `ivf.npz`.
+
+    Rows are append-only; upserts and deletes mark old rows dead and `compact()`
+    reclaims them. Searches are exact cosine top-k over the whole matrix, or over
+    the `n_probe` closest IVF lists once the collection has `ivf_threshold` live
+    rows. Only the IDs are read at open; documents are read for the hits only.
+    '''
+
+    def __init__(
+            self,
+            collection_name: str,
+            embedding_function: Embeddings,
+            persist_directory: str,
+            ivf_threshold: int | None = 50000,
+            n_probe: int = 8,
+        ):
+        '''
+        Parameters
+        ----------
+        collection_name : str
+            Subdirectory of `persist_directory` holding the collection.
+        embedding_function : Embeddings
+            Model embedding documents and queries.
+        persist_directory : str
+            Root directory of the collections.
+        ivf_threshold : int | None
+            Live rows from which an IVF index is built and used; None always searches exhaustively.
+        n_probe : int
+            IVF lists scanned per query; more lists, better recall and slower queries.
+        '''
+        self.collection_name = collection_name
+        self.embedding_function = embedding_function
+        self.path = os.path.join(persist_directory, collection_name)
+        self.ivf_threshold = ivf_threshold
+        self.n_probe = n_probe
+        self.__lock = threading.RLock()
+        ## Bumped whenever the files are reopened: row numbers of an older generation mean nothing
+        self.__generation = 0
+        if not os.path.exists(self.path) and os.path.exists(self.path + ".old"):
+            os.rename(self.path + ".old", self.path) # Interrupted compaction
+        os.makedirs(self.path, exist_ok=True)
+        self.__open()
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self.embedding_function
+
+    def count(self) -> int:
+        return len(self.__rows)
+
+    ## Writes
+
+    def add_texts(self, texts: Iterable[str], metadatas: list[dict] | None = None, *, ids: list[str] | None = None, **kwargs: Any) -> list[str]:
+        texts = list(texts)
+        vectors = self.embedding_function.embed_documents(texts)
+        return self.add_embeddings(list(zip(texts, vectors)), metadatas=metadatas, ids=ids)
+
+    def add_embeddings(self, text_embeddings: Iterable[tuple[str, list[float]]], metadatas: list[dict] | None = None, ids: list[str] | None = None, **kwargs: Any) -> list[str]:
+        '''
+        Add texts with precomputed embeddings; existing IDs are replaced.
+        '''
+        text_embeddings = list(text_embeddings)
+        if not text_embeddings:
+            return []
+        ids = list(ids) if ids is not None else [uuid.uuid4().hex for _ in text_embeddings]
+        metadatas = metadatas if metadatas is not None else [{}] * len(text_embeddings)
+        ## Within one call the last occurrence of an ID wins
+        latest = { doc_id: i for i, doc_id in enumerate(ids) }
+        keep = sorted(latest.values())
+
+        matrix = self.__normalise(np.asarray([text_embeddings[i][1] for i in keep], dtype=np.float32))
+        with self.__lock:
+            if self.__dim is None:
+                self.__dim = matrix.shape[1]
+                self.__save_meta()
+            elif matrix.shape[1] != self.__dim:
+                raise ValueError(f"Expected embeddings of dimension {self.__dim}, got {matrix.shape[1]}")
+
+            self.__kill([ids[i] for i in keep if ids[i] in self.__rows])
+            first = self.__size
+            lines = [
+                (json.dumps({ "id": ids[i], "text": text_embeddings[i][0], "metadata": metadatas[i] }) + "\n").encode()
+                for i in keep
+            ]
+            offsets = np.cumsum([0] + [len(line) for line in lines[:-1]], dtype=np.uint64) + np.uint64(self.__docs_size)
+            ## Vectors last: rows only count as written once their vector is on disk (see __open)
+            self.__append("docs.jsonl", b"".join(lines))
+            self.__append("docs.idx", offsets.tobytes())
+            self.__append("ids.jsonl", "".join(json.dumps(ids[i]) + "\n" for i in keep).encode())
+            self.__append("alive.u8", b"\x01" * len(keep))
+            self.__append("vectors.f32", matrix.tobytes())
+            self.__docs_size += sum(len(line) for line in lines)
+            self.__alive = np.concatenate([self.__alive, np.ones(len(keep), dtype=bool)])
+
+            for row, i in enumerate(keep, first):
+                self.__rows[ids[i]] = row
+            self.__size += len(keep)
+            if self.__ivf is not None:
+                assign = self.__assign(matrix, self.__ivf["centroids"])
+                self.__ivf["assign"] = np.concatenate([self.__ivf["assign"], assign])
+                self.__ivf["lists"] = None
+        return ids
+
+    def delete(self, ids: list[str] | None = None, **kwargs: Any) -> bool | None:
+        if ids is None:
+            self.reset_collection()
+            return True
+        with self.__lock:
+            self.__kill(ids)
+            if self.__dead > max(self.Constants.min_compact_rows, len(self.__rows)):
+                self.compact()
+        return True
+
+    def reset_collection(self) -> None:
+        with self.__lock:
+            for name in os.listdir(self.path):
+                os.remove(os.path.join(self.path, name))
+            self.__open()
+
+    def compact(self) -> None:
+        '''
+        Rewrite the collection without dead rows, into a new directory swapped in when complete.
+        '''
+        with self.__lock:
+            tmp_path, old_path = self.path + ".compact", self.path + ".old"
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            target = NumpyVectorStore(os.path.basename(tmp_path), self.embedding_function, os.path.dirname(self.path), ivf_threshold=None)
+            rows = sorted(self.__rows.values())
+            matrix = self.__matrix()
+            for i in range(0, len(rows), self.Constants.scan_rows):
+                block = rows[i:i + self.Constants.scan_rows]
+                docs = self.__read_docs(block)
+                target.add_embeddings(
+                    [(doc["text"], vector) for doc, vector in zip(docs, matrix[block])],
+                    metadatas=[doc["metadata"] for doc in docs],
+                    ids=[doc["id"] for doc in docs],
+                )
+            if self.__ivf is not None:
+                target.build_index(len(self.__ivf["centroids"]))
+            self.__map = None
+            os.rename(self.path, old_path)
+            os.rename(tmp_path, self.path)
+            shutil.rmtree(old_path)
+            self.__open()
+
+    ## Reads
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> list[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, **kwargs)]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> list[tuple[Document, float]]:
+        return self.similarity_search_by_vector_with_score(self.embedding_function.embed_query(query), k, **kwargs)
+
+    def similarity_search_by_vector(self, embedding: list[float], k: int = 4, **kwargs: Any) -> list[Document]:
+        return [doc for doc, _ in self.similarity_search_by_vector_with_score(embedding, k, **kwargs)]
+
+    @instrumentation.traced("vectorstore.search")
+    def similarity_search_by_vector_with_score(self, embedding: list[float], k: int = 4, filter: dict | None = None, **kwargs: Any) -> list[tuple[Document, float]]:
+        '''
+        Cosine top-k; `filter` keeps documents whose metadata contains all the given key/values.
+        '''
+        query = self.__normalise(np.asarray(embedding, dtype=np.float32)[None, :])[0]
+        while True:
+            results = self.__search(query, k, filter)
+            if results is not None:
+                return results
+
+    def __search(self, query: np.ndarray, k: int, filter: dict | None) -> list[tuple[Document, float]] | None:
+        '''
+        One search over the rows as they are now; None if a compaction swapped them in the meantime.
+        '''
+        with self.__lock:
+            if not self.__rows:
+                return []
+            generation = self.__generation
+            matrix = self.__matrix()
+            alive = self.__alive.copy()
+            candidates = self.__candidates(query)
+
+        ## Over-fetch when filtering; metadata lives on disk and is only read for the hits
+        fetch = k if filter is None else k * self.Constants.filter_overfetch
+        while True:
+            if candidates is None:
+                scores = matrix @ query
+                scores[~alive] = -np.inf
+                rows = self.__top(scores, fetch)
+                hits, scores = rows, scores[rows]
+            else:
+                candidates = candidates[alive[candidates]]
+                scores = matrix[candidates] @ query
+                order = self.__top(scores, fetch)
+                hits, scores = candidates[order], scores[order]
+            hits, scores = hits[np.isfinite(scores)], scores[np.isfinite(scores)]
+            with self.__lock:
+                if self.__generation != generation:
+                    return None
+                docs = self.__read_docs(hits)
+            results = [
+                (Document(page_content=doc["text"], metadata=doc["metadata"], id=doc["id"]), float(score))
+                for doc, score in zip(docs, scores)
+                if filter is None or all(doc["metadata"].get(key) == value for key, value in filter.items())
+            ]
+            if len(results) >= k or fetch >= len(matrix):
+                return results[:k]
+            fetch *= self.Constants.filter_overfetch
+
+    def get_by_ids(self, ids: Sequence[str], /) -> list[Document]:
+        with self.__lock:
+            docs = self.__read_docs([self.__rows[doc_id] for doc_id in ids if doc_id in self.__rows])
+        return [Document(page_content=doc["text"], metadata=doc["metadata"], id=doc["id"]) for doc in docs]
+
+    def _select_relevance_score_fn(self) -> Callable[[float], float]:
+        return lambda score: score
+
+    @classmethod
+    def from_texts(cls, texts: list[str], embedding: Embeddings, metadatas: list[dict] | None = None, *, ids: list[str] | None = None, **kwargs: Any) -> "NumpyVectorStore":
+        store = cls(
+            collection_name=kwargs.pop("collection_name", "langchain"),
+            embedding_function=embedding,
+            persist_directory=kwargs.pop("persist_directory"),
+            **kwargs,
+        )
+        store.add_texts(texts, metadatas, ids=ids)
+        return store
+
+    ## IVF index
+
+    def build_index(self, n_lists: int | None = None, iterations: int = 10, sample_size: int = 100000) -> None:
+        '''
+        Build the coarse quantiser: spherical k-means on a sample of the live rows, then
+        every row is assigned to its nearest centroid. Defaults to ~4 * sqrt(rows) lists.
+        '''
+        with self.__lock:
+            rows = np.fromiter(self.__rows.values(), dtype=np.int64)
+            if len(rows) == 0:
+                return
+            n_lists = n_lists or max(1, int(4 * np.sqrt(len(rows))))
+            n_lists = min(n_lists, len(rows))
+            matrix = self.__matrix()
+            rng = np.random.default_rng(0)
+            sample = matrix[np.sort(rng.choice(rows, size=min(sample_size, len(rows)), replace=False))]
+            centroids = sample[rng.choice(len(sample), size=n_lists, replace=False)].copy()
+            for _ in range(iterations):
+                assign = self.__assign(sample, centroids)
+                sums = np.zeros_like(centroids)
+                np.add.at(sums, assign, sample)
+                empty = ~sums.any(axis=1)
+                sums[empty] = centroids[empty]
+                centroids = self.__normalise(sums)
+            assign = np.concatenate([
+                self.__assign(matrix[i:i + self.Constants.scan_rows], centroids)
+                for i in range(0, self.__size, self.Constants.scan_rows)
+            ])
+            self.__ivf = { "centroids": centroids, "assign": assign, "lists": None }
+            np.savez(os.path.join(self.path, "ivf.npz"), centroids=centroids, assign=assign)
+
+    def __candidates(self, query: np.ndarray) -> np.ndarray | None:
+        if self.ivf_threshold is None or len(self.__rows) < self.ivf_threshold:
+            return None
+        if self.__ivf is None:
+            self.build_index()
+        ivf = self.__ivf
+        if ivf["lists"] is None:
+            ## Rows sorted by list, plus the boundaries of every list
+            order = np.argsort(ivf["assign"], kind="stable")
+            bounds = np.searchsorted(ivf["assign"][order], np.arange(len(ivf["centroids"]) + 1))
+            ivf["lists"] = (order, bounds)
+        order, bounds = ivf["lists"]
+        probe = self.__top(ivf["centroids"] @ query, self.n_probe)
+        return np.concatenate([order[bounds[i]:bounds[i + 1]] for i in probe])
+
+    @classmethod
+    def __assign(cls, vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+        return np.argmax(vectors @ centroids.T, axis=1).astype(np.int32)
+
+    ## Storage
+
+    def __open(self) -> None:
+        self.__generation += 1
+        meta_path = os.path.join(self.path, "meta.json")
+        meta = {}
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+        self.__dim = meta.get("dim")
+        self.__map = None
+        self.__ivf = None
+
+        ## A crash can leave a partial append behind; only rows present in every file count
+        id_lines = []
+        if os.path.exists(os.path.join(self.path, "ids.jsonl")):
+            with open(os.path.join(self.path, "ids.jsonl"), "rb") as f:
+                id_lines = f.read().split(b"\n")[:-1]
+        size = min(
+            self.__file_size("docs.idx") // 8,
+            len(id_lines),
+            self.__file_size("alive.u8"),
+            self.__file_size("vectors.f32") // (4 * self.__dim) if self.__dim else 0,
+        )
+        for name, width in (("docs.idx", 8), ("alive.u8", 1), ("vectors.f32", 4 * (self.__dim or 0))):
+            if self.__file_size(name) > size * width:
+                os.truncate(os.path.join(self.path, name), size * width)
+        if len(id_lines) > size:
+            os.truncate(os.path.join(self.path, "ids.jsonl"), sum(len(line) + 1 for line in id_lines[:size]))
+        self.__size = size
+        ## Torn document lines are skipped over, as offsets are absolute
+        self.__docs_size = self.__file_size("docs.jsonl")
+
+        self.__alive = np.fromfile(os.path.join(self.path, "alive.u8"), dtype=np.uint8, count=size).astype(bool) if size else np.zeros(0, dtype=bool)
+        self.__rows: dict[str, int] = { json.loads(id_lines[row]): row for row in np.flatnonzero(self.__alive).tolist() }
+        self.__dead = size - len(self.__rows)
+
+        ivf_path = os.path.join(self.path, "ivf.npz")
+        if size and os.path.exists(ivf_path):
+            ivf = np.load(ivf_path)
+            centroids, assign = ivf["centroids"], ivf["assign"][:size]
+            ## Rows added since the index was built are assigned now
+            if len(assign) < size:
+                assign = np.concatenate([assign, self.__assign(self.__matrix()[len(assign):], centroids)])
+            self.__ivf = { "centroids": centroids, "assign": assign, "lists": None }
+
+    def __matrix(self) -> np.ndarray:
+        if self.__map is None or len(self.__map) < self.__size:
+            self.__map = np.memmap(os.path.join(self.path, "vectors.f32"), dtype=np.float32, mode="r", shape=(self.__size, self.__dim)) if self.__size else np.empty((0, self.__dim or 0), dtype=np.float32)
+        return self.__map[:self.__size]
+
+    def __kill(self, ids: Iterable[str]) -> None:
+        ## Unknown and repeated IDs are skipped
+        rows = [row for row in (self.__rows.pop(doc_id, None) for doc_id in dict.fromkeys(ids)) if row is not None]
+        if not rows:
+            return
+        with open(os.path.join(self.path, "alive.u8"), "r+b") as f:
+            for row in rows:
+                f.seek(row)
+                f.write(b"\x00")
+                self.__alive[row] = False
+        self.__dead += len(rows)
+
+    def __read_docs(self, rows: Iterable[int]) -> list[dict]:
+        rows = [int(row) for row in rows]
+        if not rows:
+            return []
+        offsets = np.memmap(os.path.join(self.path, "docs.idx"), dtype=np.uint64, mode="r", shape=(self.__size,))
+        docs = []
+        with open(os.path.join(self.path, "docs.jsonl"), "rb") as f:
+            for row in rows:
+                f.seek(int(offsets[row]))
+                docs.append(json.loads(f.readline()))
+        return docs
+
+    def __append(self, name: str, data: bytes) -> None:
+        with open(os.path.join(self.path, name), "ab") as f:
+            f.write(data)
+
+    def __file_size(self, name: str) -> int:
+        path = os.path.join(self.path, name)
+        return os.path.getsize(path) if os.path.exists(path) else 0
+
+    def __save_meta(self) -> None:
+        tmp_path = os.path.join(self.path, "meta.json.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump({ "dim": self.__dim }, f)
+        os.replace(tmp_path, os.path.join(self.path, "meta.json"))
+
+    @staticmethod
+    def __normalise(matrix: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        return (matrix / norms).astype(np.float32)
+
+    @staticmethod
+    def __top(scores: np.ndarray, k: int) -> np.ndarray:
+        if k >= len(scores):
+            return np.argsort(-scores)
+        top = np.argpartition(-scores, k)[:k]
+        return top[np.argsort(-scores[top])]
+
+    class Constants:
+        min_compact_rows = 1000 # Compact once dead rows outnumber live ones and this
+        filter_overfetch = 4
+        scan_rows = 65536 # Rows per block when assigning rows to IVF lists
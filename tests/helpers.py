@@ -0,0 +1,17 @@
+'''
+Shared helpers for the tests.
+
+The benchmarks directory is put on `sys.path`, so the tests share its
+`import_repo` (modules are imported through the repo directory as the package
+name, since they use relative imports from the repo root) and its fakes
+(`fakes`, `fake_llm`).
+'''
+from pathlib import Path
+import sys
+
+BENCHMARKS = Path(__file__).resolve().parents[1] / "benchmarks"
+
+if str(BENCHMARKS) not in sys.path:
+    sys.path.insert(0, str(BENCHMARKS))
+
+from common import REPO_ROOT, import_repo # noqa: E402
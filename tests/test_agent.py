@@ -0,0 +1,61 @@
+from helpers import import_repo
+from fake_llm import FakeEmbeddings, StubChatModel
+
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts.chat import ChatPromptTemplate
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+import pytest
+
+agent = import_repo("llm.langchain.agent")
+resource = import_repo("llm.langchain.resource")
+ingest = import_repo("llm.langchain.ingest")
+agent.print = ingest.print = lambda *args, **kwargs: None
+
+def reply(messages) -> str:
+    ## Answers with the retrieved context, so the test sees what was retrieved
+    return "ANSWER " + messages[-1].content
+
+@pytest.fixture
+def stubs(tmp_path, monkeypatch):
+    monkeypatch.setattr(resource.RAG_Resources, "vector_store", "numpy")
+    monkeypatch.setattr(resource.RAG_Resources, "persist_directory", str(tmp_path / "store"))
+    model = StubChatModel(reply=reply)
+    resources = resource.resources
+    resources.set("embedding", FakeEmbeddings(size=32))
+    resources.set("splitter", RecursiveCharacterTextSplitter(chunk_size=200, chunk_overlap=0)) # The token splitter downloads its encoding
+    resources.set("llm", model)
+    resources.set("output_parser", StrOutputParser())
+    resources.set("rag_prompt_template", ChatPromptTemplate.from_template("Context:\n{context}\n\nQuestion: {input}"))
+    yield model
+    resources.reset()
+
+@pytest.fixture
+def document(tmp_path):
+    path = tmp_path / "care.txt"
+    path.write_text("\n\n".join([
+        "Keep a steady daily routine with regular meals.",
+        "Sleep improves with a fixed bedtime and less caffeine in the afternoon.",
+        "Memory exercises help when they are short and frequent.",
+    ]))
+    return str(path)
+
+def test_setup_rag_agent_builds_a_working_chain(stubs, document):
+    chain = agent.setup_rag_agent(document)
+    response = chain.invoke({ "input": "How can sleep be improved?" })
+    assert response["answer"].startswith("ANSWER Context:")
+    assert "fixed bedtime" in response["answer"]
+    assert response["context"] and stubs.calls == 1
+
+    ## Same question again: served by the semantic cache
+    again = chain.invoke({ "input": "how can sleep be improved" })
+    assert again["answer"] == response["answer"] and stubs.calls == 1
+
+def test_setup_rag_agent_without_cache(stubs, document):
+    chain = agent.setup_rag_agent(document, cache_responses=False)
+    chain.invoke({ "input": "How can sleep be improved?" })
+    chain.invoke({ "input": "How can sleep be improved?" })
+    assert stubs.calls == 2
+
+def test_rag_model_resources_are_registered():
+    registered = resource.resources.stats()["registered"]
+    assert { "llm", "output_parser", "splitter" } <= set(registered)
@@ -0,0 +1,122 @@
+from helpers import import_repo
+
+from langchain_core.runnables import Runnable
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import threading
+import time
+import pytest
+
+batching = import_repo("llm.langchain.batching")
+
+class RecordingModel(Runnable):
+    '''
+    Answers every input with itself and the `stop` it was called with; inputs containing "bad" fail.
+    Records the batches it gets and how many ran at once.
+    '''
+    def __init__(self, latency: float = 0.02, fail_batches: bool = False):
+        self.latency = latency
+        self.fail_batches = fail_batches
+        self.batches: list[tuple[list, dict]] = []
+        self.running = 0
+        self.peak = 0
+        self.lock = threading.Lock()
+
+    def invoke(self, input, config=None, **kwargs):
+        return self.answer(input, kwargs)
+
+    def batch(self, inputs, config=None, *, return_exceptions=False, **kwargs):
+        self.start(inputs, kwargs)
+        try:
+            time.sleep(self.latency)
+        finally:
+            self.finish()
+        return self.answers(inputs, kwargs)
+
+    async def abatch(self, inputs, config=None, *, return_exceptions=False, **kwargs):
+        self.start(inputs, kwargs)
+        try:
+            await asyncio.sleep(self.latency)
+        finally:
+            self.finish()
+        return self.answers(inputs, kwargs)
+
+    def start(self, inputs, kwargs):
+        with self.lock:
+            self.batches.append((list(inputs), kwargs))
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+
+    def finish(self):
+        with self.lock:
+            self.running -= 1
+
+    def answers(self, inputs, kwargs) -> list:
+        if self.fail_batches:
+            raise RuntimeError("server unavailable")
+        return [self.answer(input, kwargs) for input in inputs]
+
+    @staticmethod
+    def answer(input, kwargs):
+        if "bad" in input:
+            return ValueError(f"rejected {input}")
+        return f"{input}|{kwargs.get('stop')}"
+
+def call_all(batcher, requests: list[tuple[str, dict]]) -> list:
+    '''
+    Send every request from its own thread at the same time; returns results or raised exceptions.
+    '''
+    barrier = threading.Barrier(len(requests))
+    def call(request):
+        barrier.wait()
+        try:
+            return batcher.invoke(request[0], **request[1])
+        except Exception as e:
+            return e
+    with ThreadPoolExecutor(len(requests)) as pool:
+        return list(pool.map(call, requests))
+
+def acall_all(batcher, requests: list[tuple[str, dict]]) -> list:
+    async def main():
+        return await asyncio.gather(*(batcher.ainvoke(input, **kwargs) for input, kwargs in requests), return_exceptions=True)
+    return asyncio.run(main())
+
+@pytest.fixture(params=["threads", "asyncio"])
+def send(request):
+    return call_all if request.param == "threads" else acall_all
+
+def test_requests_share_batches_only_with_equal_kwargs(send):
+    model = RecordingModel()
+    batcher = batching.MicroBatcher(model, max_batch_size=16, max_wait=0.1)
+    requests = [(f"q{i}", { "stop": ["###"] } if i % 2 else {}) for i in range(12)]
+    results = send(batcher, requests)
+
+    assert results == [f"q{i}|{['###'] if i % 2 else None}" for i in range(12)]
+    assert len(model.batches) < len(requests)
+    for inputs, kwargs in model.batches:
+        assert all((int(input[1:]) % 2 == 1) == ("stop" in kwargs) for input in inputs)
+    assert batcher.stats()["requests"] == 12
+
+def test_each_caller_gets_its_own_exception(send):
+    model = RecordingModel()
+    batcher = batching.MicroBatcher(model, max_batch_size=16, max_wait=0.1)
+    results = send(batcher, [("q0", {}), ("bad1", {}), ("q2", {}), ("bad3", {})])
+
+    assert results[0] == "q0|None" and results[2] == "q2|None"
+    assert isinstance(results[1], ValueError) and str(results[1]) == "rejected bad1"
+    assert isinstance(results[3], ValueError) and str(results[3]) == "rejected bad3"
+    assert batcher.stats()["errors"] == 2
+
+def test_a_failed_batch_fails_its_callers(send):
+    batcher = batching.MicroBatcher(RecordingModel(fail_batches=True), max_batch_size=16, max_wait=0.05)
+    results = send(batcher, [("q0", {}), ("q1", {})])
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+def test_concurrent_batches_are_bounded(send):
+    model = RecordingModel(latency=0.03)
+    batcher = batching.MicroBatcher(model, max_batch_size=1, max_wait=0.0, max_concurrent_batches=2)
+    results = send(batcher, [(f"q{i}", {}) for i in range(10)])
+
+    assert results == [f"q{i}|None" for i in range(10)]
+    assert len(model.batches) == 10
+    assert model.peak == 2
@@ -0,0 +1,106 @@
+from helpers import import_repo
+from fakes import AsyncFakeFirestore, FakeFirestore
+
+from google.api_core.exceptions import Aborted, InvalidArgument, ServiceUnavailable
+import asyncio
+import pytest
+
+firestore = import_repo("db.firebase.firestore")
+async_firestore = import_repo("db.firebase.async_firestore")
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(firestore.FirestoreUtil.Constants, "base_backoff", 0.0)
+
+def records(count: int, start: int = 0):
+    for i in range(start, start + count):
+        yield (f"doc-{i:05d}", { "n": i })
+
+def stored(db: FakeFirestore) -> set[str]:
+    return { doc.id for doc in db.collection("items").stream() }
+
+def test_chunks_are_capped_at_the_batch_limit():
+    db = FakeFirestore()
+    report = firestore.FirestoreUtil(db).bulk_insert_data("items", records(1201), chunk_size=1000)
+
+    assert report and report.written == 1201 and report.failed == 0
+    assert report.chunks == 3
+    assert len(stored(db)) == 1201
+    assert db.collection("items").document("doc-01200").get().to_dict() == { "n": 1200 }
+
+def test_plain_dicts_get_generated_ids():
+    db = FakeFirestore()
+    report = firestore.FirestoreUtil(db).bulk_insert_data("items", ({ "n": i } for i in range(7)), chunk_size=3)
+    assert report.written == 7 and report.chunks == 3
+    assert sorted(doc.to_dict()["n"] for doc in db.collection("items").stream()) == list(range(7))
+
+def test_retryable_errors_are_retried():
+    db = FakeFirestore()
+    db.fail_next(ServiceUnavailable("unavailable"), Aborted("contention"))
+    report = firestore.FirestoreUtil(db).bulk_insert_data("items", records(10), chunk_size=5, max_workers=1)
+
+    assert report and report.written == 10
+    assert report.retries == 2
+    assert len(stored(db)) == 10
+
+def test_failed_chunks_are_reported_and_the_rest_written():
+    db = FakeFirestore()
+    db.fail_next(InvalidArgument("bad document"))
+    report = firestore.FirestoreUtil(db).bulk_insert_data("items", records(12), chunk_size=5, max_workers=1)
+
+    assert not report
+    assert (report.written, report.failed, report.chunks) == (7, 5, 3)
+    assert report.failures[0]["chunk"] == 0
+    assert report.failures[0]["doc_ids"] == [f"doc-{i:05d}" for i in range(5)]
+    assert "bad document" in report.failures[0]["error"]
+    assert stored(db) == { f"doc-{i:05d}" for i in range(5, 12) }
+
+def test_retries_are_bounded():
+    db = FakeFirestore()
+    db.fail_next(*[ServiceUnavailable("unavailable")] * 3)
+    report = firestore.FirestoreUtil(db).bulk_insert_data("items", records(4), chunk_size=4, max_retries=2)
+    assert report.failed == 4 and report.retries == 0
+    assert "unavailable" in report.failures[0]["error"]
+
+def test_a_none_record_does_not_end_the_write():
+    db = FakeFirestore()
+    report = firestore.FirestoreUtil(db).bulk_insert_data("items", [("a", { "n": 1 }), None, ("b", { "n": 2 })], chunk_size=1, max_workers=1)
+    assert report.chunks == 3
+    assert (report.written, report.failed) == (2, 1)
+    assert stored(db) == { "a", "b" }
+
+def test_records_are_read_no_further_than_the_pending_chunks_allow():
+    db = FakeFirestore(latency=0.002)
+    chunk_size, max_workers = 10, 2
+    ahead = []
+
+    def tracked():
+        for i, record in enumerate(records(300)):
+            ahead.append(i - db.writes)
+            yield record
+
+    report = firestore.FirestoreUtil(db).bulk_insert_data("items", tracked(), chunk_size=chunk_size, max_workers=max_workers)
+    assert report.written == 300
+    ## Pending chunks, plus the one being filled
+    assert max(ahead) <= (2 * max_workers + 1) * chunk_size
+
+async def async_items(count: int):
+    for record in records(count):
+        yield record
+
+def test_async_bulk_insert_retries():
+    db = FakeFirestore()
+    db.fail_next(ServiceUnavailable("unavailable"), Aborted("contention"))
+    util = async_firestore.AsyncFirestoreUtil(AsyncFakeFirestore(db))
+    report = asyncio.run(util.bulk_insert_data("items", async_items(1201), chunk_size=1000, max_concurrency=1))
+    assert report and (report.written, report.chunks, report.retries) == (1201, 3, 2)
+    assert len(stored(db)) == 1201
+
+def test_async_bulk_insert_reports_failed_chunks():
+    db = FakeFirestore()
+    db.fail_next(InvalidArgument("bad document"))
+    util = async_firestore.AsyncFirestoreUtil(AsyncFakeFirestore(db))
+    report = asyncio.run(util.bulk_insert_data("items", records(15), chunk_size=5, max_concurrency=1))
+    assert (report.written, report.failed, report.chunks) == (10, 5, 3)
+    assert report.failures[0]["doc_ids"] == [f"doc-{i:05d}" for i in range(5)]
+    assert len(stored(db)) == 10
@@ -0,0 +1,34 @@
+from helpers import import_repo
+from fake_llm import FakeEmbeddings
+
+import sqlite3
+
+embeddings = import_repo("llm.langchain.embeddings")
+
+def test_queries_are_kept_in_a_bounded_lru(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite")
+    remote = FakeEmbeddings(size=32)
+    cached = embeddings.CachedEmbeddings(remote, path=path, max_queries=3)
+    for i in range(10):
+        assert cached.embed_query(f"question {i}") == remote.vector(f"question {i}")
+    assert cached.stats()["query_entries"] == 3
+
+    calls = remote.calls
+    cached.embed_query("question 9")
+    assert remote.calls == calls
+    cached.embed_query("question 0") # Evicted
+    assert remote.calls == calls + 1
+
+    ## Nothing of the queries reaches the file
+    with sqlite3.connect(path) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0] == 0
+
+def test_documents_are_persisted(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite")
+    remote = FakeEmbeddings(size=32)
+    texts = [f"note {i}" for i in range(5)]
+    first = embeddings.CachedEmbeddings(remote, path=path).embed_documents(texts)
+    calls = remote.calls
+    again = embeddings.CachedEmbeddings(remote, path=path)
+    assert [[round(x, 5) for x in v] for v in again.embed_documents(texts)] == [[round(x, 5) for x in v] for v in first]
+    assert remote.calls == calls
@@ -0,0 +1,66 @@
+from helpers import import_repo
+from fakes import FakeFirestore
+
+import random
+import pytest
+
+firestore = import_repo("db.firebase.firestore")
+
+@pytest.fixture
+def db():
+    db = FakeFirestore()
+    for i in range(250):
+        db.collection("items").document(f"doc-{i:03d}").set({ "n": i, "group": i % 70, "name": f"item {i}" })
+    db.reset_counters()
+    return db
+
+def test_fetch_many_keeps_the_order_across_chunks(db):
+    ids = [f"doc-{i:03d}" for i in range(250)]
+    random.Random(0).shuffle(ids)
+    ids[10:10] = ["missing-1", ids[0], "missing-2"]
+
+    found = firestore.FirestoreUtil(db).fetch_many("items", ids)
+    assert [data["n"] if data is not None else None for data in found] == [
+        int(doc_id[4:]) if doc_id.startswith("doc-") else None for doc_id in ids
+    ]
+    ## 252 distinct IDs in `get_all` calls of 100
+    assert db.round_trips == 3
+
+def test_fetch_many_projects_fields(db):
+    found = firestore.FirestoreUtil(db).fetch_many("items", ["doc-005", "doc-001"], fields=["name"])
+    assert found == [{ "name": "item 5" }, { "name": "item 1" }]
+
+def test_fetch_many_by_field_keeps_the_order_across_chunks(db):
+    groups = list(range(75)) # 70..74 match nothing
+    random.Random(1).shuffle(groups)
+    groups.append(groups[0])
+
+    found = firestore.FirestoreUtil(db).fetch_many_by_field("items", "group", groups, fields=["n"])
+    assert len(found) == len(groups)
+    for group, docs in zip(groups, found):
+        assert sorted(doc["n"] for doc in docs) == [n for n in range(250) if n % 70 == group]
+        assert all(set(doc) == { "n", "group" } for doc in docs)
+    ## 75 distinct values in `in` queries of 30
+    assert db.round_trips == 3
+
+def test_fetch_many_by_nested_field():
+    db = FakeFirestore()
+    for i in range(40):
+        db.collection("items").document(f"doc-{i}").set({ "owner": { "id": f"owner-{i % 4}" } })
+    found = firestore.FirestoreUtil(db).fetch_many_by_field("items", "owner.id", ["owner-3", "owner-9", "owner-0"])
+    assert [len(docs) for docs in found] == [10, 0, 10]
+    assert all(doc["owner"]["id"] == "owner-3" for doc in found[0])
+
+def test_fetch_users_reads_only_uncached_profiles(db):
+    for i in range(150):
+        db.collection("users").document(f"uid-{i}").set({ "user_id": i })
+    firestore.FirestoreUtil.enable_user_cache()
+    try:
+        util = firestore.FirestoreUtil(db)
+        util.fetch_users([f"uid-{i}" for i in range(0, 150, 2)])
+        db.reset_counters()
+        found = util.fetch_users([f"uid-{i}" for i in range(150)])
+        assert [data["user_id"] for data in found] == list(range(150))
+        assert db.reads == 75 and db.round_trips == 1
+    finally:
+        firestore.FirestoreUtil.disable_user_cache()
@@ -0,0 +1,44 @@
+from helpers import import_repo
+
+from langchain_core.messages import AIMessage, HumanMessage
+from concurrent.futures import ThreadPoolExecutor
+import json
+
+message_history = import_repo("llm.langchain.message_history")
+
+History = message_history.FileChatMessageHistory
+
+def test_concurrent_appends_keep_log_and_index_aligned(tmp_path):
+    def write(worker: int):
+        ## A history per call, like a request handler would create
+        for i in range(25):
+            History(str(tmp_path), f"session-{worker % 3}", cache=None).add_messages(
+                [HumanMessage(f"question {worker}-{i}"), AIMessage(f"answer {worker}-{i}")]
+            )
+
+    with ThreadPoolExecutor(max_workers=12) as executor:
+        list(executor.map(write, range(12)))
+
+    for session in range(3):
+        history = History(str(tmp_path), f"session-{session}", cache=None)
+        messages = history.messages
+        assert history.message_count() == len(messages) == 4 * 25 * 2
+        ## Every turn was appended in one piece
+        for question, answer in zip(messages[::2], messages[1::2]):
+            assert answer.content == question.content.replace("question", "answer")
+        assert [message.content for message in history.get_last_messages(2)] == [message.content for message in messages[-2:]]
+
+def test_locks_do_not_grow_with_sessions(tmp_path):
+    locks = History._FileChatMessageHistory__locks
+    for i in range(500):
+        History(str(tmp_path), f"session-{i}", cache=None).add_messages([HumanMessage("hello")])
+    assert History._FileChatMessageHistory__locks is locks and len(locks) == 64
+
+def test_legacy_session_is_migrated_quietly(tmp_path, capsys):
+    legacy = [{ "key": i, "index": i, "role": "user" if i % 2 else "chatbot", "content": f"message {i}" } for i in range(1, 6)]
+    (tmp_path / "old.json").write_text(json.dumps(legacy))
+    history = History(str(tmp_path), "old", cache=None)
+
+    assert [message.content for message in history.messages] == [f"message {i}" for i in range(1, 6)]
+    assert not (tmp_path / "old.json").exists()
+    assert capsys.readouterr().out == ""
@@ -0,0 +1,143 @@
+from helpers import import_repo
+from fakes import AsyncFakeFirestore, FakeFirestore, install_firestore
+
+from langchain_core.messages import AIMessage, HumanMessage
+import asyncio
+import pytest
+
+firebase = import_repo("llm.langchain.message_history.firebase")
+async_firebase = import_repo("llm.langchain.message_history.async_firebase")
+async_firestore = import_repo("db.firebase.async_firestore")
+firebase.print = async_firebase.print = lambda *args, **kwargs: None
+
+def turn(i: int) -> list:
+    return [HumanMessage(f"question {i}"), AIMessage(f"answer {i}")]
+
+@pytest.fixture
+def db():
+    db = FakeFirestore()
+    install_firestore(db)
+    async_firestore.AsyncFirestoreInstance._AsyncFirestoreInstance__instance = AsyncFakeFirestore(db)
+    yield db
+    install_firestore(None)
+    async_firestore.AsyncFirestoreInstance._AsyncFirestoreInstance__instance = None
+
+def contents(messages) -> list[str]:
+    return [message.content for message in messages]
+
+def test_sync_and_async_share_the_layout(db):
+    history = firebase.FirebaseMessageHistory("chat-1", "user-1", shard_size=4)
+    for i in range(5):
+        history.add_messages(turn(i))
+    expected = [content for i in range(5) for content in (f"question {i}", f"answer {i}")]
+
+    async def read():
+        history = async_firebase.AsyncFirebaseMessageHistory("chat-1", "user-1", shard_size=4)
+        return await history.aget_messages(), await history.aget_last_messages(3)
+
+    everything, last = asyncio.run(read())
+    assert contents(everything) == expected
+    assert contents(last) == expected[-3:]
+    assert contents(history.get_last_messages(5)) == expected[-5:]
+    ## 4 messages in the history document, the rest in buckets of 4
+    assert len(db.collection("history").document("user-1").get().to_dict()["chat-1"]) == 4
+    assert len(db.collection("history").document("user-1").collection("chat-1").get()) == 2
+
+def test_async_history_sync_fallback(db):
+    history = async_firebase.AsyncFirebaseMessageHistory("chat-1", "user-1", shard_size=4)
+    history.add_messages(turn(0))
+    asyncio.run(history.aadd_messages(turn(1)))
+    history.add_messages(turn(2))
+    asyncio.run(history.aadd_messages(turn(3)))
+    expected = [content for i in range(4) for content in (f"question {i}", f"answer {i}")]
+    assert contents(history.messages) == expected
+    assert contents(asyncio.run(history.aget_messages())) == expected
+
+    history.clear()
+    assert contents(asyncio.run(history.aget_messages())) == ["question 0", "answer 0"]
+    asyncio.run(history.aadd_messages(turn(4)))
+    assert contents(history.messages) == ["question 0", "answer 0", "question 4", "answer 4"]
+
+def stored(db, key: str = "chat-1", uid: str = "user-1") -> tuple[list[int], dict]:
+    '''
+    Indexes of every stored message, in storage order, and the stored layout.
+    '''
+    doc = db.collection("history").document(uid).get().to_dict()
+    indexes = [message["index"] for message in doc[key]]
+    for shard in db.collection("history").document(uid).collection(key).get():
+        indexes.extend(message["index"] for message in shard.to_dict()["messages"])
+    return indexes, doc["_meta"][key]
+
+def test_writers_with_stale_layouts_never_reuse_an_index(db):
+    first = firebase.FirebaseMessageHistory("chat-1", "user-1", shard_size=4)
+    second = firebase.FirebaseMessageHistory("chat-1", "user-1", shard_size=4)
+    first.add_messages(turn(0))
+    second.add_messages(turn(1)) # Loaded before its first write, so it has seen turn 0
+    for i in range(2, 6):
+        (first if i % 2 == 0 else second).add_messages(turn(i))
+
+    indexes, meta = stored(db)
+    assert sorted(indexes) == list(range(1, 13))
+    assert meta["count"] == 12
+    assert contents(first.get_last_messages(2)) == ["question 5", "answer 5"]
+
+def test_conflicting_write_is_retried_after_the_other(db):
+    first = firebase.FirebaseMessageHistory("chat-1", "user-1", shard_size=4)
+    second = firebase.FirebaseMessageHistory("chat-1", "user-1", shard_size=4)
+    first.add_messages(turn(0))
+    second.add_messages(turn(1))
+
+    ## The other writer commits between the first attempt's read and its commit
+    read_layout = first._read_layout
+    def interleaved(db_data):
+        read_layout(db_data)
+        if not interleaved.done:
+            interleaved.done = True
+            second.add_messages(turn(2))
+    interleaved.done = False
+    first._read_layout = interleaved
+    first.add_messages(turn(3))
+
+    indexes, meta = stored(db)
+    assert sorted(indexes) == list(range(1, 9))
+    assert meta["count"] == 8
+    assert contents(first.get_last_messages(2)) == ["question 3", "answer 3"]
+
+def test_single_array_document_gets_a_layout_then_increments(db):
+    legacy = [
+        { "index": i + 1, "role": "user" if i % 2 == 0 else "chatbot", "content": f"legacy {i}", "timestamp": None }
+        for i in range(6)
+    ]
+    db.collection("history").document("user-1").set({ "chat-1": legacy })
+    history = firebase.FirebaseMessageHistory("chat-1", "user-1", shard_size=4)
+    history.add_messages(turn(0))
+    history.add_messages(turn(1))
+
+    indexes, meta = stored(db)
+    assert sorted(indexes) == list(range(1, 11))
+    assert meta == { "count": 10, "base": 6, "shard_size": 4 }
+    assert contents(history.get_last_messages(3)) == ["answer 0", "question 1", "answer 1"]
+
+def test_async_writers_never_reuse_an_index(db):
+    async def write():
+        histories = [async_firebase.AsyncFirebaseMessageHistory("chat-1", "user-1", shard_size=4) for _ in range(3)]
+        await asyncio.gather(*(history.aadd_messages(turn(i)) for i, history in enumerate(histories)))
+        await asyncio.gather(*(history.aadd_messages(turn(i + 3)) for i, history in enumerate(histories)))
+
+    asyncio.run(write())
+    indexes, meta = stored(db)
+    assert sorted(indexes) == list(range(1, 13))
+    assert meta["count"] == 12
+
+def test_buffered_history_writes_on_exit_not_on_collection(db):
+    with firebase.FirebaseMessageHistory("chat-1", "user-1", buffered=True) as history:
+        history.add_messages([HumanMessage("question 0")])
+        writes = db.writes
+    assert db.writes > writes
+    assert contents(history.get_last_messages()) == ["question 0"]
+
+    history = firebase.FirebaseMessageHistory("chat-2", "user-1", buffered=True)
+    history.add_messages([HumanMessage("question 0")])
+    writes = db.writes
+    del history
+    assert db.writes == writes
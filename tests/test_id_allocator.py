@@ -0,0 +1,73 @@
+from helpers import import_repo
+from fakes import FakeFirestore
+
+from concurrent.futures import ThreadPoolExecutor
+import collections
+import pytest
+
+id_allocator = import_repo("db.firebase.id_allocator")
+exception = import_repo("exception")
+
+ORG, ROLE = "org-1", "patient"
+
+def new_db(latency: float = 0.0) -> FakeFirestore:
+    db = FakeFirestore(latency=latency)
+    db.collection("organizations").document(ORG).set({ "user_ids": { ROLE: 1, "doctor": 1 } })
+    return db
+
+def test_concurrent_reserve_gives_unique_ids():
+    db = new_db(latency=0.001)
+    allocator = id_allocator.IdAllocator(db, block_size=7)
+
+    def reserve(slot: int) -> list[int]:
+        ids = []
+        for count in (1, 3, 10, 1, 2):
+            reserved = allocator.reserve(ORG, ROLE, count)
+            assert reserved == sorted(reserved) and len(reserved) == count
+            ids.extend(reserved)
+        return ids
+
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        ids = [user_id for chunk in executor.map(reserve, range(32)) for user_id in chunk]
+    assert len(ids) == 32 * 17
+    assert [user_id for user_id, count in collections.Counter(ids).items() if count > 1] == []
+    ## Only leased ranges are handed out
+    assert max(ids) < db.collection("organizations").document(ORG).get().to_dict()["user_ids"][ROLE]
+
+def test_roles_have_their_own_sequence():
+    allocator = id_allocator.IdAllocator(new_db(), block_size=5)
+    assert allocator.reserve(ORG, ROLE, 3) == [1, 2, 3]
+    assert allocator.reserve(ORG, "doctor", 2) == [1, 2]
+    assert allocator.reserve(ORG, ROLE, 5) == [4, 5, 6, 7, 8]
+
+def test_unknown_role():
+    allocator = id_allocator.IdAllocator(new_db())
+    with pytest.raises(exception.MsgException) as error:
+        allocator.next_id(ORG, "nurse")
+    assert error.value.httpStatus == 400
+
+def test_active_users_reach_the_organization_document():
+    db = new_db(latency=0.001)
+    db.collection("organizations").document(ORG).update({ "active_users": 4 })
+    allocator = id_allocator.IdAllocator(db, block_size=3)
+
+    def register(slot: int):
+        for _ in range(5):
+            allocator.next_id(ORG, ROLE)
+            allocator.add_active_users(ORG)
+        allocator.add_active_users(ORG, 2)
+
+    def org_field() -> int:
+        return db.collection("organizations").document(ORG).get().to_dict()["active_users"]
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(register, range(16)))
+    total = 4 + 16 * 7
+    assert allocator.active_users(ORG) == total
+    ## Leases kept adding to the field; the next one catches it up, later ones don't count twice
+    assert 4 < org_field() <= total
+    allocator.reserve_batch(ORG, { ROLE: 1 })
+    assert org_field() == total
+    allocator.reserve_batch(ORG, { ROLE: 1 })
+    id_allocator.IdAllocator(db).reserve_batch(ORG, { "doctor": 1 })
+    assert org_field() == allocator.active_users(ORG) == total
@@ -0,0 +1,101 @@
+from helpers import import_repo
+from fake_llm import FakeEmbeddings
+
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+import pytest
+
+ingest = import_repo("llm.langchain.ingest")
+vectorstore = import_repo("llm.langchain.vectorstore")
+ingest.print = lambda *args, **kwargs: None
+
+def paragraphs(name: str, count: int) -> list[str]:
+    return [f"{name} paragraph {i}: " + " ".join(f"{name}{i}w{j}" for j in range(60)) for i in range(count)]
+
+@pytest.fixture
+def corpus(tmp_path):
+    sources = tmp_path / "docs"
+    sources.mkdir()
+    for name in ("care", "sleep", "diet"):
+        (sources / f"{name}.txt").write_text("\n\n".join(paragraphs(name, 40)))
+    return sources
+
+def make(tmp_path, chunk_size: int = 300):
+    embeddings = FakeEmbeddings(size=32)
+    store = vectorstore.NumpyVectorStore("docs", embeddings, str(tmp_path / "store"), ivf_threshold=None)
+    splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=0)
+    return store, ingest.DocumentIngestor(store, str(tmp_path / "manifest.json"), splitter, parse_workers=0)
+
+def chunk_ids(ingestor) -> set[str]:
+    return { chunk_id for entry in ingestor.manifest.files.values() for chunk_id in entry["chunks"] }
+
+def test_unchanged_rerun_embeds_nothing(tmp_path, corpus):
+    store, ingestor = make(tmp_path)
+    first = ingestor.ingest(str(corpus))
+    assert first["files_changed"] == 3 and store.count() == first["chunks_added"] > 0
+    ## A new process over the same store and manifest
+    store, again = make(tmp_path)
+    stats = again.ingest(str(corpus))
+    assert stats["files_skipped"] == 3 and stats["chunks_added"] == stats["chunks_deleted"] == 0
+    assert store.embeddings.texts == 0 and store.count() == first["chunks_added"]
+
+def test_paragraph_edit_reindexes_its_section(tmp_path, corpus):
+    store, ingestor = make(tmp_path)
+    total = ingestor.ingest(str(corpus))["chunks_added"]
+    text = paragraphs("sleep", 40)
+    text[20] = "sleep paragraph 20 was rewritten entirely"
+    (corpus / "sleep.txt").write_text("\n\n".join(text))
+    stats = ingestor.ingest(str(corpus))
+    assert stats["files_changed"] == 1 and stats["files_skipped"] == 2
+    assert 0 < stats["chunks_added"] < total / 6
+    assert 0 < stats["chunks_deleted"] < total / 6
+    assert store.count() == len(chunk_ids(ingestor))
+    assert any("rewritten entirely" in doc.page_content for doc in store.get_by_ids(sorted(chunk_ids(ingestor))))
+
+def test_removed_file_is_pruned(tmp_path, corpus):
+    store, ingestor = make(tmp_path)
+    ingestor.ingest(str(corpus))
+    diet = set(ingestor.manifest.files[str(corpus / "diet.txt")]["chunks"])
+    (corpus / "diet.txt").unlink()
+    stats = ingestor.ingest(str(corpus))
+    assert stats["files_removed"] == 1 and stats["chunks_deleted"] == len(diet)
+    assert store.get_by_ids(sorted(diet)) == []
+    assert store.count() == len(chunk_ids(ingestor))
+
+def test_splitter_change_rechunks_everything(tmp_path, corpus):
+    store, ingestor = make(tmp_path, chunk_size=300)
+    old = ingestor.ingest(str(corpus))["chunks_added"]
+    store, ingestor = make(tmp_path, chunk_size=800)
+    stats = ingestor.ingest(str(corpus))
+    assert stats["files_changed"] == 3 and stats["chunks_deleted"] == old
+    assert store.count() == stats["chunks_added"] < old
+
+def test_missing_manifest_keeps_the_store(tmp_path, corpus):
+    store, ingestor = make(tmp_path)
+    store.add_texts(["indexed before the manifest existed"], ids=["legacy"])
+    ingestor.ingest(str(corpus / "care.txt"))
+    assert store.get_by_ids(["legacy"])
+    ## Rebuilding is explicit
+    stats = ingestor.ingest(str(corpus), rebuild=True)
+    assert store.get_by_ids(["legacy"]) == []
+    assert store.count() == stats["chunks_added"] == len(chunk_ids(ingestor))
+
+def test_parse_pool_matches_inline_and_starts_only_for_changed_files(tmp_path, corpus, monkeypatch):
+    _, inline = make(tmp_path / "inline")
+    inline.ingest(str(corpus))
+
+    pools = []
+    executor = ingest.ProcessPoolExecutor
+    def counting(*args, **kwargs):
+        pools.append(kwargs["mp_context"].get_start_method())
+        return executor(*args, **kwargs)
+    monkeypatch.setattr(ingest, "ProcessPoolExecutor", counting)
+
+    store, pooled = make(tmp_path / "pooled")
+    pooled.parse_workers = 2
+    pooled.ingest(str(corpus))
+    assert pools == ["spawn"]
+    assert chunk_ids(pooled) == chunk_ids(inline)
+    assert store.count() == len(chunk_ids(inline))
+    ## Nothing changed: no process is started
+    pooled.ingest(str(corpus))
+    assert pools == ["spawn"]
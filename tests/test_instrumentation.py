@@ -0,0 +1,62 @@
+from helpers import import_repo
+from fake_llm import FakeEmbeddings
+from fakes import FakeFirestore
+
+import threading
+
+instrumentation_module = import_repo("instrumentation")
+instrumentation = instrumentation_module.instrumentation
+embeddings = import_repo("llm.langchain.embeddings")
+firestore = import_repo("db.firebase.firestore")
+
+class Recorder(instrumentation_module.SpanHook):
+    def __init__(self):
+        self.spans = []
+        self.threads = set()
+
+    def on_end(self, span):
+        self.spans.append(span)
+        self.threads.add(threading.get_ident())
+
+def record(fn) -> Recorder:
+    recorder = instrumentation.add_hook(Recorder())
+    instrumentation.configure(enabled=True, sample_rate=1.0)
+    try:
+        with instrumentation.request("test") as context:
+            fn()
+    finally:
+        instrumentation.configure(enabled=False)
+        instrumentation.remove_hook(recorder)
+        instrumentation.reset()
+    recorder.context = context
+    return recorder
+
+class TracedEmbeddings(FakeEmbeddings):
+    @instrumentation.traced("remote.embed")
+    def embed_documents(self, texts):
+        return super().embed_documents(texts)
+
+def test_pool_spans_keep_request_and_parent():
+    cached = embeddings.CachedEmbeddings(TracedEmbeddings(size=16, latency=0.01), batch_size=2, max_workers=4)
+    recorder = record(lambda: cached.embed_documents([f"text {i}" for i in range(8)]))
+    remote = [span for span in recorder.spans if span.name == "remote.embed"]
+    assert len(remote) == 4
+    assert len(recorder.threads) > 1
+    assert all(span.request is recorder.context for span in remote)
+    assert all(span.parent is not None and span.parent.name == "embedding.compute" for span in remote)
+
+def test_bulk_insert_commits_under_the_request():
+    db = FakeFirestore()
+    commits = []
+    commit = db._commit
+
+    def traced_commit(writes, reads=None):
+        with instrumentation.span("fake.commit") as span:
+            commits.append(span)
+            return commit(writes, reads)
+
+    db._commit = traced_commit
+    util = firestore.FirestoreUtil(db)
+    recorder = record(lambda: util.bulk_insert_data("events", ({ "n": i } for i in range(50)), chunk_size=10, max_workers=4))
+    assert len(commits) == 5
+    assert all(span.request is recorder.context and span.parent is not None and span.parent.name == "firestore.bulk_insert_data" for span in commits)
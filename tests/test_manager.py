@@ -0,0 +1,34 @@
+from helpers import import_repo
+
+import asyncio
+
+manager = import_repo("llm.langchain.manager")
+
+def open_pools(registry) -> list:
+    return [client for interface in ("groq", "other") for client in registry.http_clients(interface)]
+
+def test_clear_closes_every_http_client():
+    registry = manager.ModelRegistry()
+    clients = open_pools(registry)
+    registry.clear()
+    assert all(client.is_closed for client in clients)
+    assert registry.stats()["connection_pools"] == 0
+
+def test_clear_inside_event_loop():
+    registry = manager.ModelRegistry()
+    clients = open_pools(registry)
+
+    async def main():
+        registry.clear()
+        await asyncio.sleep(0.01) # Let the closing task run
+
+    asyncio.run(main())
+    assert all(client.is_closed for client in clients)
+
+def test_aclose_closes_every_http_client():
+    registry = manager.ModelRegistry()
+    clients = open_pools(registry)
+    asyncio.run(registry.aclose())
+    assert all(client.is_closed for client in clients)
+    ## Pools are rebuilt on demand afterwards
+    assert not any(client.is_closed for client in registry.http_clients("groq"))
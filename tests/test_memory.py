@@ -0,0 +1,76 @@
+from helpers import import_repo
+from fake_llm import StubChatModel
+
+from langchain_core.chat_history import BaseChatMessageHistory
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+import pytest
+
+memory = import_repo("llm.langchain.memory")
+message_history = import_repo("llm.langchain.message_history")
+memory.print = lambda *args, **kwargs: None
+
+class ListHistory(BaseChatMessageHistory):
+    '''
+    History without `get_last_messages`.
+    '''
+    def __init__(self):
+        self.messages = []
+
+    def add_messages(self, messages):
+        self.messages.extend(messages)
+
+    def clear(self):
+        self.messages = []
+
+PINNED = [HumanMessage("You are a helpful assistant."), AIMessage("")]
+
+@pytest.fixture(params=["file", "list"])
+def history(request, tmp_path):
+    history = message_history.FileChatMessageHistory(str(tmp_path), "session", cache=None) if request.param == "file" else ListHistory()
+    history.add_messages(PINNED)
+    return history
+
+def chat(window, turns: int, start: int = 0):
+    for i in range(start, start + turns):
+        window.save_context({ "input": f"question {i} " + "word " * 20 }, { "response": f"answer {i} " + "word " * 40 })
+
+def test_buffer_stays_bounded(history):
+    window = memory.TokenWindowMemory(chat_memory=history, pinned=PINNED, max_token_limit=300)
+    for turns in (5, 20, 50):
+        chat(window, turns)
+        assert window.prompt_tokens() <= 300
+    ## The history keeps everything
+    assert len(history.messages) == len(PINNED) + 2 * 75
+
+def test_pinned_messages_are_kept(history):
+    window = memory.TokenWindowMemory(chat_memory=history, pinned=PINNED, max_token_limit=200)
+    chat(window, 30)
+    buffer = window.buffer()
+    assert buffer[:2] == PINNED
+    assert buffer[-1].content.startswith("answer 29")
+    ## A new memory over the same history rebuilds the same window
+    reloaded = memory.TokenWindowMemory(chat_memory=history, pinned=PINNED, max_token_limit=200)
+    assert [m.content for m in reloaded.buffer()] == [m.content for m in buffer]
+
+@pytest.mark.parametrize("limit", range(60, 200, 7))
+def test_window_opens_on_a_human_message(history, limit):
+    window = memory.TokenWindowMemory(chat_memory=history, pinned=PINNED, max_token_limit=limit)
+    chat(window, 8)
+    for buffer in (window.buffer(), memory.TokenWindowMemory(chat_memory=history, pinned=PINNED, max_token_limit=limit).buffer()):
+        recent = buffer[len(PINNED):]
+        assert recent == [] or isinstance(recent[0], HumanMessage)
+
+def test_evicted_turns_are_summarized(history):
+    summarizer = StubChatModel(reply="The user asked several questions.")
+    window = memory.TokenWindowMemory(chat_memory=history, pinned=PINNED, max_token_limit=300, summarizer=summarizer)
+    chat(window, 20)
+    buffer = window.buffer()
+    assert isinstance(buffer[len(PINNED)], SystemMessage) and "several questions" in buffer[len(PINNED)].content
+    assert isinstance(buffer[len(PINNED) + 1], HumanMessage)
+    assert window.prompt_tokens() <= 300
+    ## Turns are folded a few at a time, not one call per turn
+    assert 0 < summarizer.calls < 20
+
+def test_last_messages_of_any_history(history):
+    assert memory.last_messages(history, 1) == PINNED[-1:]
+    assert memory.last_messages(history, 0) == []
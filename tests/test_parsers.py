@@ -0,0 +1,39 @@
+from helpers import import_repo
+
+import pytest
+
+parsers = import_repo("llm.langchain.parsers")
+parsers.print = lambda *args, **kwargs: None # The reasoning is printed once parsed
+
+def chunks(text: str, size: int) -> list[str]:
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+DEEPSEEK_OUTPUTS = [
+    "<think>reasoning here</think>\nThe answer",
+    "reasoning here</think>\nThe answer",
+    "  <think>\nstep one\n</think>\n\nThe answer\nsecond line  ",
+    "plain answer without any reasoning",
+    "<think>unterminated reasoning",
+    "reasoning mentioning <think> inline</think> The answer",
+    "<thi",
+    "",
+]
+
+@pytest.mark.parametrize("text", DEEPSEEK_OUTPUTS)
+@pytest.mark.parametrize("size", [1, 3, 1000])
+def test_deepseek_stream_matches_parse(text, size):
+    parser = parsers.DeepseekOutputParser()
+    assert "".join(parser.transform(iter(chunks(text, size)))) == parser.parse(text)
+
+def test_deepseek_stream_cuts_closing_tag_only_output():
+    parser = parsers.DeepseekOutputParser()
+    assert "".join(parser.transform(iter(chunks("reasoning here</think>\nThe answer", 2)))) == "The answer"
+
+@pytest.mark.parametrize("text", ["Hello there\nHuman: next", "Hi! AI: more", "single line"])
+def test_chat_stream_matches_parse(text):
+    parser = parsers.ChatOutputParser()
+    assert "".join(parser.transform(iter(chunks(text, 2)))) == parser.parse(text)
+
+def test_streaming_parser_requires_cutter():
+    with pytest.raises(TypeError):
+        parsers._StreamingParser()
@@ -0,0 +1,66 @@
+from helpers import import_repo
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+router = import_repo("llm.langchain.router")
+
+class ScriptedModel(BaseChatModel):
+    '''
+    Answers "hello world", or fails before (`fail_after=0`) or after `fail_after` streamed chunks.
+    '''
+    fail_after: int | None = None
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        if self.fail_after is not None:
+            raise ConnectionError("down")
+        return ChatResult(generations=[ChatGeneration(message=AIMessage("hello world"))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        for i, token in enumerate(["hello", " world"]):
+            if self.fail_after is not None and i >= self.fail_after:
+                raise ConnectionError("down")
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+def in_flight(model) -> dict[str, int]:
+    return { name: stats["in_flight"] for name, stats in model.stats().items() }
+
+def test_stream_releases_in_flight():
+    model = router.ModelRouter(backends={ "a": ScriptedModel(), "b": ScriptedModel() })
+    assert "".join(chunk.content for chunk in model.stream("hi")) == "hello world"
+    assert in_flight(model) == { "a": 0, "b": 0 }
+
+def test_stream_failover_releases_in_flight():
+    model = router.ModelRouter(backends={ "a": ScriptedModel(fail_after=0), "b": ScriptedModel() })
+    for _ in range(3):
+        assert "".join(chunk.content for chunk in model.stream("hi")) == "hello world"
+        assert in_flight(model) == { "a": 0, "b": 0 }
+    assert model.stats()["a"]["errors"] >= 1
+
+def test_stream_error_after_first_chunk_releases_in_flight():
+    model = router.ModelRouter(backends={ "a": ScriptedModel(fail_after=1) })
+    chunks = []
+    try:
+        for chunk in model.stream("hi"):
+            chunks.append(chunk.content)
+    except ConnectionError:
+        pass
+    assert chunks == ["hello"]
+    assert in_flight(model) == { "a": 0 }
+
+def test_abandoned_stream_releases_in_flight():
+    model = router.ModelRouter(backends={ "a": ScriptedModel() })
+    stream = model.stream("hi")
+    next(stream)
+    stream.close()
+    assert in_flight(model) == { "a": 0 }
+
+def test_invoke_failover_releases_in_flight():
+    model = router.ModelRouter(backends={ "a": ScriptedModel(fail_after=0), "b": ScriptedModel() })
+    assert model.invoke("hi").content == "hello world"
+    assert in_flight(model) == { "a": 0, "b": 0 }
@@ -0,0 +1,75 @@
+from helpers import import_repo
+from fakes import FakeFirestore
+
+from google.cloud.firestore_v1.base_query import FieldFilter
+import json
+import os
+import pytest
+
+firestore = import_repo("db.firebase.firestore")
+
+@pytest.fixture
+def db():
+    db = FakeFirestore()
+    for i in range(53):
+        db.collection("items").document(f"doc-{i:03d}").set({ "n": i, "even": i % 2 == 0, "name": f"item {i}" })
+    return db
+
+def test_pages_in_document_id_order(db):
+    pages = list(firestore.FirestoreUtil(db).scan_pages("items", page_size=10))
+    assert [len(page) for page in pages] == [10, 10, 10, 10, 10, 3]
+    assert [snapshot.id for page in pages for snapshot in page] == [f"doc-{i:03d}" for i in range(53)]
+
+def test_scan_projects_and_filters(db):
+    util = firestore.FirestoreUtil(db)
+    docs = list(util.scan("items", fields=["n"], filters=[FieldFilter("even", "==", True)], page_size=7))
+    assert docs == [(f"doc-{i:03d}", { "n": i }) for i in range(0, 53, 2)]
+
+def test_checkpoint_resumes_after_the_last_finished_page(db, tmp_path):
+    util = firestore.FirestoreUtil(db)
+    path = str(tmp_path / "scan.checkpoint")
+    seen = []
+    for page in util.scan_pages("items", page_size=10, checkpoint=firestore.ScanCheckpoint(path)):
+        seen.extend(snapshot.id for snapshot in page)
+        if len(seen) == 30:
+            break # Interrupted while handling the third page
+
+    checkpoint = firestore.ScanCheckpoint(path)
+    assert (checkpoint.last_id, checkpoint.count, checkpoint.done) == ("doc-019", 20, False)
+    rest = [snapshot.id for page in util.scan_pages("items", page_size=10, checkpoint=checkpoint) for snapshot in page]
+    assert rest == [f"doc-{i:03d}" for i in range(20, 53)]
+    assert firestore.ScanCheckpoint(path).done and checkpoint.count == 53
+    ## A finished scan yields nothing more
+    assert list(util.scan_pages("items", page_size=10, checkpoint=firestore.ScanCheckpoint(path))) == []
+
+def test_checkpoint_of_another_scan_is_rejected(db, tmp_path):
+    util = firestore.FirestoreUtil(db)
+    path = str(tmp_path / "scan.checkpoint")
+    next(util.scan_pages("items", page_size=10, checkpoint=firestore.ScanCheckpoint(path)))
+    list(util.scan_pages("items", page_size=10, checkpoint=firestore.ScanCheckpoint(path)))
+    with pytest.raises(Exception, match="another scan"):
+        list(util.scan_pages("items", fields=["n"], page_size=10, checkpoint=firestore.ScanCheckpoint(path)))
+
+def test_export_resumes_without_duplicates(db, tmp_path, monkeypatch):
+    util = firestore.FirestoreUtil(db)
+    path = str(tmp_path / "items.jsonl")
+
+    ## Crash after the third page is written to the file but before it is checkpointed
+    save = firestore.ScanCheckpoint.save
+    def failing_save(checkpoint):
+        if checkpoint.count >= 30:
+            raise OSError("disk full")
+        save(checkpoint)
+    monkeypatch.setattr(firestore.ScanCheckpoint, "save", failing_save)
+    with pytest.raises(OSError):
+        util.export_collection("items", path, page_size=10)
+    with open(path) as file:
+        assert len(file.readlines()) == 30
+    monkeypatch.setattr(firestore.ScanCheckpoint, "save", save)
+
+    assert util.export_collection("items", path, page_size=10) == 53
+    with open(path) as file:
+        lines = [json.loads(line) for line in file]
+    assert [line["id"] for line in lines] == [f"doc-{i:03d}" for i in range(53)]
+    assert lines[5]["data"] == { "n": 5, "even": False, "name": "item 5" }
+    assert not os.path.exists(path + ".checkpoint")
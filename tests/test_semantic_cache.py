@@ -0,0 +1,28 @@
+from helpers import import_repo
+from fake_llm import FakeEmbeddings
+
+from langchain_core.runnables import RunnableLambda
+
+semantic_cache = import_repo("llm.langchain.semantic_cache")
+
+def answering(answer: str) -> RunnableLambda:
+    return RunnableLambda(lambda input: { "input": input["input"], "context": [], "answer": answer })
+
+def test_chains_have_their_own_cache():
+    embedding = FakeEmbeddings(size=64)
+    first = semantic_cache.CachedQAChain(answering("from the first model"), embedding, version="v1")
+    second = semantic_cache.CachedQAChain(answering("from the second model"), embedding, version="v2")
+    assert first.invoke({ "input": "How to help with sleep?" })["answer"] == "from the first model"
+    assert second.invoke({ "input": "How to help with sleep?" })["answer"] == "from the second model"
+    ## Neither version change cleared the other chain's answers
+    assert first.cache.stats()["invalidations"] == 0
+    assert first.invoke({ "input": "how to help with sleep" })["answer"] == "from the first model"
+    assert first.cache.stats()["exact_hits"] == 1
+
+def test_shared_cache():
+    cache = semantic_cache.SemanticCache()
+    embedding = FakeEmbeddings(size=64)
+    first = semantic_cache.CachedQAChain(answering("cached"), embedding, cache=cache)
+    second = semantic_cache.CachedQAChain(answering("never generated"), embedding, cache=cache)
+    first.invoke({ "input": "How to help with sleep?" })
+    assert second.invoke({ "input": "How to help with sleep?" })["answer"] == "cached"
@@ -0,0 +1,112 @@
+from helpers import import_repo
+from fakes import FakeAuth, install_auth
+
+from firebase_admin import auth
+from types import SimpleNamespace
+import pytest
+
+user_auth = import_repo("db.firebase.user_auth")
+exception = import_repo("exception")
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(user_auth, "time", SimpleNamespace(time=lambda: now[0]))
+    return now
+
+@pytest.fixture
+def fake_auth(monkeypatch):
+    fake = FakeAuth()
+    install_auth(fake)
+    monkeypatch.setattr(user_auth.FirebaseAuthentication, "token_cache", user_auth.TokenCache())
+    yield fake
+    install_auth(auth)
+
+def claims(uid: str, iat: float = 900.0, exp: float = 2000.0) -> dict:
+    return { "uid": uid, "iat": iat, "exp": exp }
+
+def request_for(path: str, token: str | None = None) -> SimpleNamespace:
+    headers = { "Authorization": "Bearer " + token } if token is not None else {}
+    return SimpleNamespace(path=path, data={}, headers=headers)
+
+def test_allowed_paths_behave_like_a_list():
+    authentication = user_auth.FirebaseAuthentication()
+    assert list(authentication.allowed_paths) == list(user_auth.FirebaseAuthentication.default_allowed_paths)
+    assert "/login" in authentication.allowed_paths and "/chat" not in authentication.allowed_paths
+
+    authentication.allowed_paths.append("/health")
+    assert "/health" in authentication.allowed_paths
+    assert authentication.authenticate(request_for("/health"))[0]["is_authenticated"]
+    ## Instances don't share their rules
+    assert "/health" not in user_auth.FirebaseAuthentication().allowed_paths
+
+    authentication.allowed_paths.remove("/login")
+    assert "/login" not in authentication.allowed_paths
+    authentication.allowed_paths = ["/status"]
+    assert list(authentication.allowed_paths) == ["/status"] and len(authentication.allowed_paths) == 1
+    assert "/register" not in authentication.allowed_paths
+
+def test_prefix_rules():
+    matcher = user_auth.PathMatcher(["/login"], prefixes=["/public/", "/public/docs/"])
+    assert "/public/docs/intro" in matcher and "/public/page" in matcher
+    assert "/publicity" not in matcher and "/login/other" not in matcher
+
+def test_entries_expire_at_exp(clock):
+    cache = user_auth.TokenCache()
+    cache.put("token", claims("user-1", exp=1010.0))
+    assert cache.get("token")["uid"] == "user-1"
+    clock[0] = 1009.9
+    assert cache.get("token") is not None
+    clock[0] = 1010.0
+    assert cache.get("token") is None
+    assert cache.stats()["entries"] == 0
+
+def test_revoke_token_drops_only_that_token(clock):
+    cache = user_auth.TokenCache()
+    cache.put("first", claims("user-1"))
+    cache.put("second", claims("user-1"))
+    cache.revoke_token("first")
+    assert cache.get("first") is None
+    assert cache.get("second") is not None
+
+def test_revoke_uid_drops_and_rejects_earlier_tokens(clock):
+    cache = user_auth.TokenCache()
+    cache.put("first", claims("user-1"))
+    cache.put("second", claims("user-1"))
+    cache.put("other", claims("user-2"))
+    cache.revoke_uid("user-1")
+
+    assert cache.get("first") is None and cache.get("second") is None
+    assert cache.get("other") is not None
+    ## Issued before the revocation: not cached again; issued after: cached as usual
+    assert cache.is_revoked(claims("user-1", iat=999.0))
+    cache.put("first", claims("user-1", iat=999.0))
+    assert cache.get("first") is None
+    cache.put("fresh", claims("user-1", iat=1001.0))
+    assert cache.get("fresh") is not None
+
+def test_cache_is_bounded_and_least_recently_used_goes_first(clock):
+    cache = user_auth.TokenCache(max_entries=3)
+    for i in range(3):
+        cache.put(f"token-{i}", claims(f"user-{i}"))
+    assert cache.get("token-0") is not None # Now the most recently used
+    cache.put("token-3", claims("user-3"))
+
+    assert cache.stats()["entries"] == 3
+    assert cache.get("token-1") is None
+    assert all(cache.get(f"token-{i}") is not None for i in (0, 2, 3))
+    ## Evicted entries leave no trace in the per-user index
+    cache.revoke_uid("user-1")
+    assert cache.stats()["entries"] == 3
+
+def test_authenticate_verifies_a_token_once(fake_auth):
+    authentication = user_auth.FirebaseAuthentication()
+    token = fake_auth.issue_token("user-1")
+    for _ in range(3):
+        user, _ = authentication.authenticate(request_for("/chat", token))
+        assert user == { "uid": "user-1", "is_authenticated": True }
+    assert fake_auth.verifications == 1
+
+    authentication.token_cache.revoke_uid("user-1")
+    with pytest.raises(exception.MsgException):
+        authentication.authenticate(request_for("/chat", token))
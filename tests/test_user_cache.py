@@ -0,0 +1,88 @@
+from helpers import import_repo
+from fakes import FakeFirestore
+
+from types import SimpleNamespace
+import pytest
+import time
+
+firestore = import_repo("db.firebase.firestore")
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(firestore, "time", SimpleNamespace(monotonic=lambda: now[0], perf_counter=time.perf_counter, sleep=time.sleep))
+    return now
+
+@pytest.fixture
+def util():
+    db = FakeFirestore()
+    for i in range(3):
+        db.collection("users").document(f"uid-{i}").set(profile(i))
+    firestore.FirestoreUtil.enable_user_cache(ttl=60.0)
+    yield firestore.FirestoreUtil(db), db
+    firestore.FirestoreUtil.disable_user_cache()
+
+def profile(i: int, **changes) -> dict:
+    return { "email": f"user{i}@example.com", "username": f"user{i}", "user_id": i, "organization": "org-1", "role": "patient", **changes }
+
+def test_entries_expire_after_the_ttl(clock):
+    cache = firestore.UserCache(ttl=10.0)
+    cache.put("uid-1", profile(1))
+    clock[0] += 9.9
+    assert cache.get("uid-1") == profile(1)
+    assert cache.get_by_email("user1@example.com") == ("uid-1", profile(1))
+    clock[0] += 0.2
+    assert cache.get_by_username("user1") is None
+    assert cache.get("uid-1") is None
+    assert cache.stats()["entries"] == 0
+
+def test_least_recently_used_entry_goes_first(clock):
+    cache = firestore.UserCache(max_entries=3)
+    for i in range(3):
+        cache.put(f"uid-{i}", profile(i))
+    assert cache.get_by_user_id(0, "org-1") is not None # Now the most recently used
+    cache.put("uid-3", profile(3))
+
+    assert cache.stats()["entries"] == 3
+    assert cache.get("uid-1") is None
+    assert cache.get_by_email("user1@example.com") is None and cache.get_by_username("user1") is None
+    assert all(cache.get(f"uid-{i}") is not None for i in (0, 2, 3))
+
+def test_cached_copies_are_not_shared():
+    cache = firestore.UserCache()
+    data = profile(1)
+    cache.put("uid-1", data)
+    data["role"] = "doctor"
+    cache.get("uid-1")["role"] = "guardian"
+    assert cache.get("uid-1")["role"] == "patient"
+
+def test_lookups_answer_each_other(util):
+    util, db = util
+    assert util.fetch_user_data("uid-1") == profile(1)
+    reads = db.reads
+    assert util.validate_user_role("user1@example.com", "patient")
+    assert util.fetch_email_by_username("user1") == "user1@example.com"
+    assert util.fetch_user_data_by_user_id(1, "org-1", send_ref_id=True) == "uid-1"
+    assert db.reads == reads
+
+def test_insert_data_invalidates(util):
+    util, db = util
+    util.fetch_user_data("uid-1")
+    util.insert_data("users", "uid-1", { "role": "doctor" })
+    assert util.fetch_user_data("uid-1")["role"] == "doctor"
+    ## Read once after the write, then served from the cache again, under the new email only
+    util.insert_data("users", "uid-1", { "email": "new@example.com" })
+    reads = db.reads
+    assert util.fetch_user_data("uid-1")["email"] == "new@example.com"
+    assert util.fetch_user_data("uid-1")["email"] == "new@example.com"
+    assert db.reads == reads + 1
+    assert util.user_cache.get_by_email("user1@example.com") is None
+
+def test_bulk_writes_invalidate(util):
+    util, db = util
+    assert [data["role"] for data in util.fetch_users(["uid-0", "uid-1", "uid-2"])] == ["patient"] * 3
+    report = util.bulk_insert_data("users", ((f"uid-{i}", { "role": "doctor" }) for i in range(2)), chunk_size=1)
+    assert report.written == 2
+    assert [data["role"] for data in util.fetch_users(["uid-0", "uid-1", "uid-2"])] == ["doctor", "doctor", "patient"]
+    util.batch_insert_data("users", ["uid-2"], [{ "role": "guardian" }])
+    assert util.fetch_user_data("uid-2")["role"] == "guardian"
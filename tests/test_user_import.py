@@ -0,0 +1,87 @@
+from helpers import import_repo
+from fakes import FakeAuth, FakeFirestore, install_auth
+
+from firebase_admin import auth
+import json
+import pytest
+
+user_import = import_repo("db.firebase.user_import")
+firestore = import_repo("db.firebase.firestore")
+id_allocator = import_repo("db.firebase.id_allocator")
+
+ORG = "org-1"
+
+@pytest.fixture
+def db():
+    return FakeFirestore()
+
+@pytest.fixture
+def fake_auth():
+    fake = FakeAuth()
+    install_auth(fake)
+    yield fake
+    install_auth(auth)
+
+def registration(db, batch_size: int = 1000):
+    db.collection("organizations").document(ORG).set({ "user_ids": { "patient": 1, "doctor": 1 } })
+    return user_import.BulkUserRegistration(
+        batch_size=batch_size,
+        hash_rounds=1,
+        hash_workers=2,
+        id_allocator=id_allocator.IdAllocator(db),
+        db_interface=firestore.FirestoreUtil(db),
+    )
+
+def row(i: int, role: str = "patient", email: str | None = None) -> dict:
+    return { "email": email or f"user{i}@example.com", "password": "secret", "role": role, "organization": ORG }
+
+def profiles(db) -> dict[str, dict]:
+    return { doc.id: doc.to_dict() for doc in db.collection("users").stream() }
+
+def test_rows_become_accounts_and_profiles(db, fake_auth):
+    importer = registration(db, batch_size=3)
+    rows = [row(i, "patient" if i % 3 else "doctor") for i in range(7)]
+    results = list(importer.import_rows(rows))
+
+    assert [result["row"] for result in results] == list(range(1, 8))
+    assert all(result["status"] == "created" for result in results)
+    stored = profiles(db)
+    assert set(stored) == set(fake_auth.users) == { result["uid"] for result in results }
+    assert all("password" not in data for data in stored.values())
+    assert sorted(data["user_id"] for data in stored.values() if data["role"] == "doctor") == [1, 2, 3]
+    assert all(data["patients"] == [] for data in stored.values() if data["role"] == "doctor")
+    assert importer.id_allocator.active_users(ORG) == 7
+
+def test_duplicate_emails_in_a_batch_fail(db, fake_auth):
+    importer = registration(db)
+    rows = [row(0), row(1, email="User0@Example.com"), row(2), row(3, email="user2@example.com")]
+    results = list(importer.import_rows(rows))
+
+    assert [result["status"] for result in results] == ["created", "failed", "created", "failed"]
+    assert results[1]["error"] == results[3]["error"] == "Duplicate email in the import"
+    assert results[1]["uid"] is None and results[1]["user_id"] is None
+    assert len(fake_auth.users) == len(profiles(db)) == 2
+
+def test_registered_emails_fail_across_batches_and_imports(db, fake_auth):
+    importer = registration(db, batch_size=2)
+    list(importer.import_rows([row(0), row(1)]))
+    ## The second batch repeats an email of the first one; the run repeats one of the earlier import
+    results = list(importer.import_rows([row(2), row(3), row(4, email="user2@example.com"), row(1)]))
+
+    assert [result["status"] for result in results] == ["created", "created", "failed", "failed"]
+    assert {result["error"] for result in results[2:]} == { "Email already registered" }
+    assert len(fake_auth.users) == len(profiles(db)) == 4
+    ## No IDs were reserved for the skipped rows
+    assert db.collection("organizations").document(ORG).get().to_dict()["user_ids"]["patient"] == 5
+
+def test_import_file_reports_every_row(db, fake_auth, tmp_path):
+    path = tmp_path / "users.jsonl"
+    lines = [row(0), { "email": "missing@example.com" }, row(2), row(3, email="user0@example.com")]
+    path.write_text("\n".join(json.dumps(line) for line in lines) + "\n")
+    report = tmp_path / "report.csv"
+    summary = registration(db).import_file(str(path), str(report))
+
+    assert (summary["created"], summary["failed"]) == (2, 2)
+    report_rows = report.read_text().splitlines()
+    assert len(report_rows) == 5
+    assert "Missing fields: password, role" in report_rows[2]
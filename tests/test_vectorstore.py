@@ -0,0 +1,72 @@
+from helpers import import_repo
+
+from langchain_core.embeddings import Embeddings
+import numpy as np
+import json
+import threading
+import zlib
+
+vectorstore = import_repo("llm.langchain.vectorstore")
+
+class HashEmbeddings(Embeddings):
+    '''
+    Deterministic vectors from a hash of the words.
+    '''
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        vector = [0.0] * 16
+        for word in text.split():
+            vector[zlib.crc32(word.encode()) % 16] += 1.0
+        return vector
+
+def make_store(tmp_path, count: int):
+    store = vectorstore.NumpyVectorStore("docs", HashEmbeddings(), str(tmp_path), ivf_threshold=None)
+    store.add_texts([f"note {i} about sleep" for i in range(count)], ids=[f"id{i}" for i in range(count)])
+    return store
+
+def test_delete_repeated_ids(tmp_path):
+    store = make_store(tmp_path, 200)
+    store.delete(ids=["id170", "id170", "missing"])
+    assert store.get_by_ids(["id170", "id171"])[0].id == "id171"
+    assert len(store.get_by_ids([f"id{i}" for i in range(200)])) == 199
+
+    reopened = vectorstore.NumpyVectorStore("docs", HashEmbeddings(), str(tmp_path), ivf_threshold=None)
+    assert len(reopened.get_by_ids([f"id{i}" for i in range(200)])) == 199
+
+def test_search_during_compaction(tmp_path):
+    store = make_store(tmp_path, 300)
+    errors = []
+    stop = threading.Event()
+
+    def search():
+        try:
+            while not stop.is_set():
+                for doc in store.similarity_search("note 7 about sleep", k=3):
+                    assert doc.page_content == f"note {doc.id[2:]} about sleep"
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=search) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for i in range(0, 100, 10):
+        store.delete(ids=[f"id{j}" for j in range(i, i + 10)])
+        store.compact()
+    stop.set()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    assert len(store.get_by_ids([f"id{i}" for i in range(300)])) == 200
+
+def test_reopened_index_keeps_its_lists_and_takes_settings_from_the_constructor(tmp_path):
+    store = make_store(tmp_path, 300)
+    store.build_index(12)
+    exact = [round(score, 5) for _, score in store.similarity_search_with_score("note 7 about sleep", k=5)]
+    assert json.loads((tmp_path / "docs" / "meta.json").read_text()) == { "dim": 16 }
+
+    ## Probing every list of the stored index gives the exhaustive results (many vectors tie, so scores are compared)
+    reopened = vectorstore.NumpyVectorStore("docs", HashEmbeddings(), str(tmp_path), ivf_threshold=1, n_probe=12)
+    assert [round(score, 5) for _, score in reopened.similarity_search_with_score("note 7 about sleep", k=5)] == exact
+    assert len(np.load(tmp_path / "docs" / "ivf.npz")["centroids"]) == 12